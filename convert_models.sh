@@ -1,25 +1,19 @@
 #!/bin/bash
 
-# Convert PyTorch models to ONNX format for browser inference
+# Convert PyTorch models to ONNX format for browser inference.
+# Artifacts are cached by content hash (checkpoint, scaler, vocab, converter code and
+# options), so unchanged models are not re-exported; extra arguments are passed on to
+# scripts/build_model_artifacts.py (e.g. --force, --jobs 2, --export-mode loop).
 
-echo "🚀 Converting Fin-O models to ONNX format..."
-
-# Create output directory
-mkdir -p public/model
+set -e
 
-# Convert Fin-O Small model
-echo "🔄 Converting Fin-O Small model..."
-python3 scripts/convert_pytorch_to_onnx.py \
-  --model-type small \
-  --model-path model/fin-o-small \
-  --output-dir public/model
+echo "🚀 Converting Fin-O models to ONNX format..."
 
-# Convert Fin-O Large model  
-echo "🔄 Converting Fin-O Large model..."
-python3 scripts/convert_pytorch_to_onnx.py \
-  --model-type large \
-  --model-path model/fin-o-large \
-  --output-dir public/model
+python3 scripts/build_model_artifacts.py \
+  --variant small=model/fin-o-small \
+  --variant large=model/fin-o-large \
+  --output-dir public/model \
+  "$@"
 
 echo "✅ Model conversion complete!"
 echo "📁 Files created in public/model/:"
@@ -17,6 +17,16 @@ export interface TransactionData {
   month_of_year_cos: number;
 }
 
+// Raw transaction columns for models exported with --export-mode raw, which compute the
+// scaled features, time deltas and calendar encodings in the graph
+export interface RawTransaction {
+  amount: number; // signed: income positive, spending negative
+  balance_before: number;
+  category_id: number;
+  merchant_id: number;
+  step: number; // integer day offset from 2024-01-01
+}
+
 export interface PredictionResult {
   amount: number;
   category: string;
@@ -42,6 +52,24 @@ export interface ModelConfig {
   };
 }
 
+// Content-hashed file names from /model/manifest.json (written by scripts/build_model_artifacts.py)
+let modelManifest: Promise<Record<string, string>> | null = null;
+
+async function resolveModelAsset(path: string): Promise<string> {
+  if (!modelManifest) {
+    modelManifest = fetch('/model/manifest.json', { cache: 'no-cache' })
+      .then(response => (response.ok ? response.json() : { files: {} }))
+      .then(manifest => Object.fromEntries(
+        Object.entries(manifest.files ?? {}).map(([name, entry]: [string, any]) => [name, entry.url])
+      ))
+      .catch(() => ({}));
+  }
+
+  const files = await modelManifest;
+  const name = path.split('/').pop() ?? path;
+  return path.startsWith('/model/') && files[name] ? files[name] : path;
+}
+
 export class FinOModel {
   private session: ort.InferenceSession | null = null;
   private vocabMappings: any = null;
@@ -356,7 +384,7 @@ export class FinOModel {
       console.log(`Loading model from: ${this.modelPath}`);
       console.log('Model path check:', this.modelPath);
       
-      this.session = await ort.InferenceSession.create(this.modelPath);
+      this.session = await ort.InferenceSession.create(await resolveModelAsset(this.modelPath));
       console.log('ONNX model loaded successfully');
       
       // Load vocab mappings and scaler
@@ -382,7 +410,7 @@ export class FinOModel {
 
   private async loadVocabMappings(): Promise<void> {
     try {
-      const vocabResponse = await fetch('/model/vocab.json');
+      const vocabResponse = await fetch(await resolveModelAsset('/model/vocab.json'));
       this.vocabMappings = await vocabResponse.json();
       console.log('Vocab mappings loaded successfully');
     } catch (error) {
@@ -405,7 +433,7 @@ export class FinOModel {
 
   private async loadScaler(): Promise<void> {
     try {
-      const scalerResponse = await fetch('/model/scaler.json');
+      const scalerResponse = await fetch(await resolveModelAsset('/model/scaler.json'));
       this.scaler = await scalerResponse.json();
       console.log('Scaler loaded successfully');
     } catch (error) {
@@ -488,7 +516,8 @@ export class FinOModel {
     };
   }
 
-  async predict(transactions: TransactionData[]): Promise<PredictionResult[]> {
+  // horizon: number of forecast steps; loop exports only compute that many
+  async predict(transactions: TransactionData[], horizon: number = this.config.forecastHorizon): Promise<PredictionResult[]> {
     if (this.mockMode) {
       return this.generateMockPredictions();
     }
@@ -506,7 +535,7 @@ export class FinOModel {
       // Create input tensor
       const inputTensor = new ort.Tensor('float32', inputArray, [1, this.config.sequenceLength, 14]);
       
-      return await this.runInference(inputTensor);
+      return await this.runInference({ input: inputTensor }, horizon);
       
     } catch (error) {
       console.error('Error during prediction:', error);
@@ -514,8 +543,36 @@ export class FinOModel {
     }
   }
 
+  // Predict from a user's raw transaction history (in step order) with a model exported with
+  // --export-mode raw (createFinOModel('small', '/model/fin-o-small-raw.onnx')). Pass the whole
+  // history: time deltas and merchant averages of the encoded window look back over all of it
+  async predictRawTransactions(transactions: RawTransaction[]): Promise<PredictionResult[]> {
+    if (this.mockMode) {
+      return this.generateMockPredictions();
+    }
+
+    if (!this.session) {
+      throw new Error('Model not loaded. Call loadModel() first.');
+    }
+
+    if (!this.session.inputNames.includes('transaction_step')) {
+      throw new Error('Model was not exported with raw transaction inputs');
+    }
+
+    // No padding or slicing needed: the graph encodes the last sequenceLength transactions
+    const shape = [1, transactions.length];
+
+    return await this.runInference({
+      transaction_amount: new ort.Tensor('float32', Float32Array.from(transactions, t => t.amount), shape),
+      transaction_balance: new ort.Tensor('float32', Float32Array.from(transactions, t => t.balance_before), shape),
+      transaction_category: new ort.Tensor('int64', BigInt64Array.from(transactions, t => BigInt(t.category_id)), shape),
+      transaction_merchant: new ort.Tensor('int64', BigInt64Array.from(transactions, t => BigInt(t.merchant_id)), shape),
+      transaction_step: new ort.Tensor('int64', BigInt64Array.from(transactions, t => BigInt(Math.floor(t.step))), shape),
+    });
+  }
+
   // New method to accept pre-processed tensor input
-  async predictWithTensor(inputTensor: ort.Tensor): Promise<PredictionResult[]> {
+  async predictWithTensor(inputTensor: ort.Tensor, horizon: number = this.config.forecastHorizon): Promise<PredictionResult[]> {
     if (this.mockMode) {
       return this.generateMockPredictions();
     }
@@ -527,7 +584,7 @@ export class FinOModel {
     try {
       console.log('Running real model inference with pre-processed tensor...');
       
-      return await this.runInference(inputTensor);
+      return await this.runInference({ input: inputTensor }, horizon);
       
     } catch (error) {
       console.error('Error during prediction with tensor:', error);
@@ -535,16 +592,20 @@ export class FinOModel {
     }
   }
 
-  // Helper method to run inference with a given input tensor
-  private async runInference(inputTensor: ort.Tensor): Promise<PredictionResult[]> {
-    // Create dummy target tensor for the model
-    const dummyTarget = new ort.Tensor('float32', new Float32Array(this.config.forecastHorizon * 4), [1, this.config.forecastHorizon, 4]);
+  // Helper method to run inference with the given model inputs
+  private async runInference(inputs: Record<string, ort.Tensor>, horizon: number = this.config.forecastHorizon): Promise<PredictionResult[]> {
+    if (!Number.isInteger(horizon) || horizon < 1) {
+      throw new Error(`Forecast horizon must be a positive integer, got ${horizon}`);
+    }
+    const feeds: Record<string, ort.Tensor> = { ...inputs };
     
-    // Run inference
-    const feeds = { 
-      input: inputTensor,
-      target: dummyTarget
-    };
+    if (this.session!.inputNames.includes('horizon')) {
+      // Models exported with --export-mode loop only run the requested number of decoder steps
+      feeds.horizon = new ort.Tensor('int64', BigInt64Array.of(BigInt(horizon)), []);
+    } else {
+      // Create dummy target tensor for the model
+      feeds.target = new ort.Tensor('float32', new Float32Array(this.config.forecastHorizon * 4), [1, this.config.forecastHorizon, 4]);
+    }
     
     console.log('Running ONNX inference...');
     const results = await this.session!.run(feeds);
@@ -552,7 +613,12 @@ export class FinOModel {
     
     // Process outputs
     const predictions: PredictionResult[] = [];
-    const forecastHorizon = this.config.forecastHorizon;
+    const forecastHorizon = Math.min(horizon, results.amount_output?.dims[1] ?? horizon);
+    
+    // Models exported with --postprocess-top-k already return unscaled amounts and top-k probabilities
+    if (results.category_topk_ids) {
+      return this.processPostprocessedOutputs(results, horizon);
+    }
     
     // Extract predictions from model outputs
     const amountOutput = results.amount_output?.data as Float32Array;
@@ -589,6 +655,37 @@ export class FinOModel {
     return predictions;
   }
 
+  // Build predictions from the outputs of a model with in-graph softmax, top-k and inverse scaling
+  private processPostprocessedOutputs(results: ort.InferenceSession.OnnxValueMapType, horizon: number): PredictionResult[] {
+    const predictions: PredictionResult[] = [];
+    const amountOutput = results.amount.data as Float32Array;
+    const categoryIds = results.category_topk_ids.data as Int32Array;
+    const categoryProbs = results.category_topk_probs.data as Float32Array;
+    const merchantIds = results.merchant_topk_ids.data as Int32Array;
+    const merchantProbs = results.merchant_topk_probs.data as Float32Array;
+    const topK = results.category_topk_ids.dims[2];
+    
+    const forecastHorizon = Math.min(horizon, results.amount.dims[1]);
+    
+    for (let i = 0; i < forecastHorizon; i++) {
+      const categoryId = categoryIds[i * topK];
+      const merchantId = merchantIds[i * topK];
+      
+      const englishCategory = this.vocabMappings.categories[categoryId] || 'Unknown';
+      const englishMerchant = this.vocabMappings.merchants[merchantId] || 'Unknown';
+      
+      predictions.push({
+        amount: amountOutput[i],
+        category: this.translateCategoryToGerman(englishCategory),
+        merchant: this.translateMerchantToGerman(englishMerchant),
+        confidence: categoryProbs[i * topK] * merchantProbs[i * topK],
+      });
+    }
+    
+    console.log(`Generated ${predictions.length} predictions`);
+    return predictions;
+  }
+
   // Helper method to convert PyTorch tensor data to ONNX Runtime tensor
   convertPyTorchTensorToONNX(pytorchTensorData: number[], shape: number[]): ort.Tensor {
     // Convert the flat array to Float32Array
@@ -899,7 +996,8 @@ export class FinOModel {
 }
 
 // Factory function to create model instances
-export function createFinOModel(modelType: 'small' | 'large'): FinOModel {
+// modelPath can point to another export of the model, e.g. /model/fin-o-small-loop.onnx
+export function createFinOModel(modelType: 'small' | 'large', modelPath: string = `/model/fin-o-${modelType}.onnx`): FinOModel {
   const config: ModelConfig = {
     sequenceLength: 50,
     forecastHorizon: 10,
@@ -912,7 +1010,6 @@ export function createFinOModel(modelType: 'small' | 'large'): FinOModel {
     },
   };
 
-  const modelPath = `/model/fin-o-${modelType}.onnx`;
   return new FinOModel(modelPath, config);
 }
 
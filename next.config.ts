@@ -52,6 +52,20 @@ const nextConfig: NextConfig = {
   devIndicators: {
     buildActivity: false,
   },
+  // Model artifacts named by content hash (scripts/build_model_artifacts.py) never change;
+  // the manifest pointing to them must always be revalidated
+  async headers() {
+    return [
+      {
+        source: '/model/:file([\\w.-]+\\.[0-9a-f]{16}\\.(?:onnx|data|json))',
+        headers: [{ key: 'Cache-Control', value: 'public, max-age=31536000, immutable' }],
+      },
+      {
+        source: '/model/manifest.json',
+        headers: [{ key: 'Cache-Control', value: 'no-cache' }],
+      },
+    ];
+  },
 
 };
 
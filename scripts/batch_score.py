@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Bulk offline scoring of Fin-O forecasts for a whole user base.
+Streams windows from the window-index format (or legacy sequences_X.npy), runs greedy
+forecasts in large batches with PyTorch or the split ONNX export across a worker pool, and
+writes chunked columnar output:
+
+    part-00000.npz ...   one row per (window, forecast step): user_id (nameOrig), user_index,
+                         window, step, inverse-scaled amount, top-k category/merchant ids and
+                         probabilities
+    checkpoint.json      scoring options and the number of windows already written
+
+An interrupted run resumes from the checkpointed offset when started again with the same options.
+"""
+
+import argparse
+import json
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from convert_pytorch_to_onnx import FORECAST_HORIZON
+from preprocess_transactions import NUMERICAL_FEATURES
+
+AMOUNT_INDEX = NUMERICAL_FEATURES.index('amount')
+
+# Per-process scoring state, set up once by init_worker
+_worker = {}
+
+
+def scoring_units(data_dir: str, mode: str):
+    """(user_id, user_index, window, input_start) of every window to score.
+
+    mode 'last' scores the most recent sequence_length transactions of each user (the
+    forecast of their next transactions), identified by the first feature row of the input;
+    'all' scores every window of the dataset, identified by its window index.
+    For legacy sequences_X.npy input, windows are rows of the array, user_index is -1 and
+    user_id is empty.
+    """
+    data_dir = Path(data_dir)
+
+    if not (data_dir / 'meta.json').exists():
+        if mode != 'all':
+            raise ValueError("Legacy sequences_X.npy input has no user boundaries; use --mode all")
+        num_windows = len(np.load(data_dir / 'sequences_X.npy', mmap_mode='r'))
+        window = np.arange(num_windows, dtype=np.int64)
+        return np.full(num_windows, ''), np.full(num_windows, -1, dtype=np.int64), window, window
+
+    from window_dataset import WindowIndex
+
+    index = WindowIndex(data_dir)
+    if index.user_ids is None:
+        raise ValueError(f"{data_dir} has no user_ids.npy; preprocess it again to score by user id")
+    if mode == 'all':
+        user_index = np.searchsorted(index.user_offsets, index.window_starts, side='right') - 1
+        return index.user_ids[user_index], user_index, np.arange(len(index), dtype=np.int64), index.window_starts
+
+    counts = np.diff(index.user_offsets)
+    user_index = np.flatnonzero(counts >= index.sequence_length)
+    input_start = index.user_offsets[user_index + 1] - index.sequence_length
+    return index.user_ids[user_index], user_index, input_start, input_start
+
+
+def init_worker(data_dir: str, backend: str, model_path: str, model_dir: str, model_type: str,
+                threads: int, amount_mean: float, amount_scale: float):
+    """Load the model and open the input data once per worker process."""
+    data_dir = Path(data_dir)
+    if (data_dir / 'meta.json').exists():
+        from window_dataset import WindowIndex
+        _worker['inputs'] = WindowIndex(data_dir).inputs
+    else:
+        _worker['inputs'] = np.load(data_dir / 'sequences_X.npy', mmap_mode='r')
+
+    if backend == 'torch':
+        import torch
+        from convert_pytorch_to_onnx import load_model
+
+        torch.set_num_threads(threads)
+        model = load_model(model_path, torch.device('cpu'))
+
+        def forecast(src, horizon):
+            outputs = model.predict(torch.from_numpy(src), horizon)
+            return tuple(output.numpy() for output in outputs)
+    else:
+        import onnxruntime as ort
+        from run_split_onnx import greedy_forecast, load_split_sessions
+
+        session_options = ort.SessionOptions()
+        session_options.intra_op_num_threads = threads
+        encoder_session, decoder_session = load_split_sessions(model_dir, model_type, session_options)
+
+        def forecast(src, horizon):
+            return greedy_forecast(encoder_session, decoder_session, src, horizon)
+
+    _worker['forecast'] = forecast
+    _worker['amount_mean'] = amount_mean
+    _worker['amount_scale'] = amount_scale
+
+
+def top_k(logits: np.ndarray, k: int):
+    """Top-k ids and softmax probabilities along the last axis."""
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    probabilities = np.exp(logits)
+    probabilities /= probabilities.sum(axis=-1, keepdims=True)
+
+    ids = np.argsort(-probabilities, axis=-1, kind='stable')[..., :k]
+    return ids.astype(np.int16), np.take_along_axis(probabilities, ids, axis=-1).astype(np.float32)
+
+
+def score_chunk(part_path: str, user_id: np.ndarray, user_index: np.ndarray, window: np.ndarray,
+                input_start: np.ndarray, horizon: int, top_k_size: int, batch_size: int):
+    """Forecast one chunk of windows and write it as a columnar .npz part; returns its row count."""
+    inputs = _worker['inputs']
+    columns = {name: [] for name in ['amount', 'category_id', 'category_prob', 'merchant_id', 'merchant_prob']}
+
+    for begin in range(0, len(input_start), batch_size):
+        src = np.ascontiguousarray(inputs[input_start[begin:begin + batch_size]], dtype=np.float32)
+        amount, category, merchant = _worker['forecast'](src, horizon)
+
+        columns['amount'].append(amount[..., 0] * _worker['amount_scale'] + _worker['amount_mean'])
+        category_id, category_prob = top_k(category, top_k_size)
+        merchant_id, merchant_prob = top_k(merchant, top_k_size)
+        columns['category_id'].append(category_id)
+        columns['category_prob'].append(category_prob)
+        columns['merchant_id'].append(merchant_id)
+        columns['merchant_prob'].append(merchant_prob)
+
+    # Flatten (windows, horizon, ...) to one row per forecast step
+    num_windows = len(input_start)
+    part = {
+        'user_id': np.repeat(user_id, horizon),
+        'user_index': np.repeat(user_index, horizon),
+        'window': np.repeat(window, horizon),
+        'step': np.tile(np.arange(1, horizon + 1, dtype=np.int16), num_windows),
+        'amount': np.concatenate(columns['amount']).reshape(-1).astype(np.float32),
+    }
+    for name in ['category_id', 'category_prob', 'merchant_id', 'merchant_prob']:
+        part[name] = np.concatenate(columns[name]).reshape(num_windows * horizon, top_k_size)
+
+    # Write under a temporary name so a crash never leaves a truncated part behind
+    tmp_path = part_path[:-len('.npz')] + '.tmp.npz'
+    np.savez(tmp_path, **part)
+    os.replace(tmp_path, part_path)
+    return num_windows * horizon
+
+
+def read_checkpoint(checkpoint_path: Path, options: dict) -> int:
+    """Number of windows already scored with the same options (0 for a fresh run)."""
+    if not checkpoint_path.exists():
+        return 0
+    with open(checkpoint_path) as f:
+        checkpoint = json.load(f)
+    if checkpoint['options'] != options:
+        raise ValueError(f"{checkpoint_path} was written with different options; "
+                         f"use a new --output-dir or delete it to start over")
+    return checkpoint['completed_windows']
+
+
+def write_checkpoint(checkpoint_path: Path, options: dict, completed_windows: int, num_windows: int):
+    tmp_path = checkpoint_path.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump({'options': options, 'completed_windows': completed_windows, 'num_windows': num_windows},
+                  f, indent=2)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def read_forecasts(output_dir: str) -> dict:
+    """Concatenate all parts in output_dir into one dict of columns."""
+    parts = [np.load(path) for path in sorted(Path(output_dir).glob('part-[0-9]*[0-9].npz'))]
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0].files}
+
+
+def batch_score(data_dir: str, output_dir: str, backend: str, mode: str = 'last', model_path: str = None,
+                model_dir: str = 'public/model', model_type: str = 'large', scaler_path: str = None,
+                horizon: int = FORECAST_HORIZON, top_k_size: int = 3, batch_size: int = 1024,
+                chunk_size: int = 65536, workers: int = None, threads_per_worker: int = 1):
+    """Score data_dir into output_dir, resuming from its checkpoint; returns (rows, seconds)."""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    checkpoint_path = output_dir / 'checkpoint.json'
+
+    scaler_path = Path(scaler_path) if scaler_path else Path(data_dir) / 'scaler.pkl'
+    if scaler_path.exists():
+        with open(scaler_path, 'rb') as f:
+            scaler = pickle.load(f)
+        amount_mean, amount_scale = float(scaler.mean_[AMOUNT_INDEX]), float(scaler.scale_[AMOUNT_INDEX])
+    else:
+        print(f"⚠️  Scaler file {scaler_path} not found, writing scaled amounts")
+        amount_mean, amount_scale = 0.0, 1.0
+
+    options = {
+        'data_dir': str(Path(data_dir).resolve()),
+        'mode': mode,
+        'backend': backend,
+        'model': str(Path(model_path).resolve()) if backend == 'torch' else
+                 str((Path(model_dir) / f"fin-o-{model_type}").resolve()),
+        'horizon': horizon,
+        'top_k': top_k_size,
+        'chunk_size': chunk_size,
+    }
+
+    user_id, user_index, window, input_start = scoring_units(data_dir, mode)
+    num_windows = len(input_start)
+    completed = read_checkpoint(checkpoint_path, options)
+
+    if completed:
+        print(f"🔄 Resuming at window {completed:,} of {num_windows:,}")
+    if completed >= num_windows:
+        return 0, 0.0
+
+    chunk_starts = range(completed, num_windows, chunk_size)
+    chunk_args = [
+        (str(output_dir / f"part-{begin // chunk_size:05d}.npz"),
+         user_id[begin:begin + chunk_size], user_index[begin:begin + chunk_size], window[begin:begin + chunk_size],
+         input_start[begin:begin + chunk_size], horizon, top_k_size, batch_size)
+        for begin in chunk_starts
+    ]
+
+    rows = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(str(data_dir), backend, model_path, model_dir, model_type,
+                                       threads_per_worker, amount_mean, amount_scale)) as pool:
+        # Results arrive in chunk order, so the checkpoint only ever covers finished parts
+        for begin, part_rows in zip(chunk_starts, pool.map(score_chunk, *zip(*chunk_args))):
+            rows += part_rows
+            completed = min(begin + chunk_size, num_windows)
+            write_checkpoint(checkpoint_path, options, completed, num_windows)
+
+            elapsed = time.perf_counter() - start
+            print(f"   {completed:,}/{num_windows:,} windows  {rows / elapsed:,.0f} rows/s")
+
+    return rows, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score every user with a Fin-O model into columnar output')
+    parser.add_argument('--data-dir', type=str, required=True,
+                       help='Window-index dataset directory, or a directory with legacy sequences_X.npy')
+    parser.add_argument('--output-dir', type=str, required=True,
+                       help='Directory for part-*.npz files and checkpoint.json')
+    parser.add_argument('--mode', choices=['last', 'all'], default='last',
+                       help="last: forecast from each user's latest transactions; all: score every window")
+    parser.add_argument('--backend', choices=['torch', 'onnx'], default='onnx',
+                       help='torch: Seq2Seq.predict on a checkpoint; onnx: split ONNX export')
+    parser.add_argument('--model-path', type=str, default=None,
+                       help='PyTorch checkpoint for --backend torch')
+    parser.add_argument('--model-dir', type=str, default='public/model',
+                       help='Directory with the split ONNX files for --backend onnx')
+    parser.add_argument('--model-type', choices=['small', 'large'], default='large',
+                       help='Split ONNX model to use for --backend onnx')
+    parser.add_argument('--scaler-path', type=str, default=None,
+                       help='scaler.pkl used to inverse-scale amounts (default: <data-dir>/scaler.pkl)')
+    parser.add_argument('--horizon', type=int, default=FORECAST_HORIZON,
+                       help='Number of forecast steps per window')
+    parser.add_argument('--top-k', type=int, default=3,
+                       help='Number of categories and merchants kept per step')
+    parser.add_argument('--batch-size', type=int, default=1024,
+                       help='Windows per model call')
+    parser.add_argument('--chunk-size', type=int, default=65536,
+                       help='Windows per output part (and checkpoint granularity)')
+    parser.add_argument('--workers', type=int, default=None,
+                       help='Worker processes (default: number of CPUs)')
+    parser.add_argument('--threads-per-worker', type=int, default=1,
+                       help='Intra-op threads used by each worker')
+
+    args = parser.parse_args()
+
+    if args.backend == 'torch' and args.model_path is None:
+        parser.error('--backend torch requires --model-path')
+
+    print(f"🚀 Scoring {args.data_dir} ({args.mode} windows) with the {args.backend} backend...")
+
+    try:
+        rows, elapsed = batch_score(
+            args.data_dir, args.output_dir, args.backend, args.mode, args.model_path, args.model_dir,
+            args.model_type, args.scaler_path, args.horizon, args.top_k, args.batch_size,
+            args.chunk_size, args.workers, args.threads_per_worker,
+        )
+    except ValueError as e:
+        print(f"❌ {e}")
+        raise SystemExit(1)
+
+    if rows == 0:
+        print(f"✅ Nothing to do, {args.output_dir} is already complete")
+        return
+
+    print(f"✅ Wrote {rows:,} forecast rows to {args.output_dir} in {elapsed:.1f}s "
+          f"({rows / elapsed:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Latency of the loop export (--export-mode loop, runtime horizon input) at different forecast
+horizons, next to the unrolled full graph, which always runs FORECAST_HORIZON decoder steps,
+and the PyTorch reference Seq2Seq.predict. The loop graph is checked against Seq2Seq.predict
+at every horizon first, and the full graph against the teacher-forced Seq2Seq at the
+benchmarked batch size.
+"""
+
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import onnxruntime as ort
+import torch
+
+from benchmark_inference import median_ms
+from convert_pytorch_to_onnx import (
+    FORECAST_HORIZON,
+    build_model,
+    convert_loop_model_to_onnx,
+    convert_model_to_onnx,
+    dummy_sequence,
+    load_model,
+)
+
+
+def check_loop(model, loop_session, src: np.ndarray, horizon: int, atol: float = 1e-4) -> bool:
+    """Compare the loop graph with Seq2Seq.predict at one horizon."""
+    expected = model.predict(torch.from_numpy(src), horizon)
+    actual = loop_session.run(None, {'input': src, 'horizon': np.array(horizon, dtype=np.int64)})
+
+    max_diff = max(float(np.abs(e.numpy() - a).max()) for e, a in zip(expected, actual))
+    ok = max_diff <= atol and actual[0].shape[1] == horizon
+    print(f"   {'✅' if ok else '❌'} horizon {horizon:>3}: max abs diff {max_diff:.2e}")
+    return ok
+
+
+def check_full(model, full_session, src: np.ndarray, trg: np.ndarray, atol: float = 1e-4) -> bool:
+    """Compare the full graph with the teacher-forced Seq2Seq on the whole batch."""
+    with torch.no_grad():
+        expected = model(torch.from_numpy(src), torch.from_numpy(trg))
+    actual = full_session.run(None, {'input': src, 'target': trg})
+
+    max_diff = max(float(np.abs(e.numpy() - a).max()) for e, a in zip(expected, actual))
+    ok = max_diff <= atol and actual[0].shape[0] == len(src)
+    print(f"   {'✅' if ok else '❌'} full graph, batch {len(src)}: max abs diff {max_diff:.2e}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latency of the Fin-O loop export by forecast horizon')
+    parser.add_argument('--model-path', type=str, default=None,
+                       help='PyTorch checkpoint (default: random weights)')
+    parser.add_argument('--horizons', type=int, nargs='+', default=[1, 3, 10],
+                       help='Forecast horizons to measure')
+    parser.add_argument('--batch-size', type=int, default=1,
+                       help='Batch size')
+    parser.add_argument('--runs', type=int, default=50,
+                       help='Timed runs per case')
+    parser.add_argument('--threads', type=int, default=1,
+                       help='Intra-op threads for ONNX Runtime and PyTorch')
+
+    args = parser.parse_args()
+
+    if min(args.horizons) < 1:
+        parser.error('--horizons must be at least 1')
+
+    torch.set_num_threads(args.threads)
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = args.threads
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path = args.model_path
+        if model_path is None:
+            model_path = str(Path(tmp_dir) / 'random.pth')
+            torch.save(build_model().state_dict(), model_path)
+
+        model = load_model(model_path, torch.device('cpu'))
+        loop_path = convert_loop_model_to_onnx(model_path, 'benchmark', tmp_dir)
+        full_path = convert_model_to_onnx(model_path, 'benchmark', tmp_dir)
+
+        providers = ['CPUExecutionProvider']
+        loop_session = ort.InferenceSession(str(loop_path), sess_options=options, providers=providers)
+        full_session = ort.InferenceSession(str(full_path), sess_options=options, providers=providers)
+
+    src = dummy_sequence(args.batch_size).numpy()
+
+    full_feeds = {'input': src, 'target': np.zeros((args.batch_size, FORECAST_HORIZON, 4), dtype=np.float32)}
+
+    print("🔄 Checking the exported graphs against PyTorch...")
+    ok = all([check_loop(model, loop_session, src, horizon) for horizon in args.horizons])
+    ok = check_full(model, full_session, src, full_feeds['target']) and ok
+
+    full_latency = median_ms(lambda: full_session.run(None, full_feeds), args.runs)
+
+    print(f"📊 Latency (ms, batch {args.batch_size}, {args.threads} thread(s)):")
+    print(f"   {'horizon':>7}  {'loop graph':>10}  {'Seq2Seq.predict':>15}  {'full graph':>10}")
+    for horizon in args.horizons:
+        loop_feeds = {'input': src, 'horizon': np.array(horizon, dtype=np.int64)}
+        loop_latency = median_ms(lambda: loop_session.run(None, loop_feeds), args.runs)
+        torch_latency = median_ms(lambda: model.predict(torch.from_numpy(src), horizon), args.runs)
+        print(f"   {horizon:>7}  {loop_latency:>10.2f}  {torch_latency:>15.2f}  {full_latency:>10.2f}  "
+              f"({full_latency / loop_latency:.1f}x vs {FORECAST_HORIZON} unrolled steps)")
+
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Throughput comparison of the fused decoder path (Seq2Seq.forward_fused) against the
+per-step decoder loop (Seq2Seq.forward) on CPU, for teacher-forced validation and training
+steps. Also checks that both paths produce the same outputs.
+"""
+
+import argparse
+
+import torch
+import torch.nn as nn
+
+from benchmark_inference import RANDOM_ARCHITECTURES, median_ms
+from convert_pytorch_to_onnx import (
+    FORECAST_HORIZON,
+    build_model,
+    dummy_sequence,
+    load_model,
+    scheduled_sampling_mask,
+    vocab_sizes,
+)
+from train_fin_o import compute_loss
+
+
+def dummy_target(batch_size: int, forecast_horizon: int, vocab_size_cat: int, vocab_size_merch: int):
+    """Random (amount, category_id, merchant_id, time_delta) targets with valid IDs."""
+    trg = torch.randn(batch_size, forecast_horizon, 4)
+    trg[:, :, 1] = torch.randint(0, vocab_size_cat, (batch_size, forecast_horizon))
+    trg[:, :, 2] = torch.randint(0, vocab_size_merch, (batch_size, forecast_horizon))
+    return trg
+
+
+def check_outputs(model, src, trg, atol: float = 1e-5) -> bool:
+    """Compare forward_fused with the step loop in eval mode."""
+    model.eval()
+    with torch.no_grad():
+        expected = model(src, trg)
+        fused = model.forward_fused(src, trg)
+        all_teacher = model.forward_fused(src, trg, torch.ones(trg.shape[:2], dtype=torch.bool))
+
+    ok = True
+    for name, step_output, fused_output, masked_output in zip(
+        ['amount', 'category', 'merchant'], expected, fused, all_teacher
+    ):
+        max_diff = max(float((step_output - fused_output).abs().max()),
+                       float((step_output - masked_output).abs().max()))
+        status = "✅" if max_diff <= atol else "❌"
+        ok = ok and max_diff <= atol
+        print(f"   {status} {name}: max abs diff {max_diff:.2e}")
+    return ok
+
+
+def compare_throughput(model, src, trg, runs: int):
+    """Samples per second of the step loop and fused path, for validation and training steps."""
+    batch_size = src.shape[0]
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-4)
+    mask = scheduled_sampling_mask(batch_size, trg.shape[1], 0.5)
+    criterion_h = nn.HuberLoss()
+    criterion_ce = nn.CrossEntropyLoss()
+
+    def validation(forward):
+        def step():
+            model.eval()
+            with torch.no_grad():
+                forward()
+        return step
+
+    def training(forward):
+        def step():
+            model.train()
+            optimizer.zero_grad()
+            compute_loss(forward(), trg, criterion_h, criterion_ce).backward()
+            optimizer.step()
+        return step
+
+    cases = [
+        ('validation', 'step loop', validation(lambda: model(src, trg))),
+        ('validation', 'fused', validation(lambda: model.forward_fused(src, trg))),
+        ('training', 'step loop', training(lambda: model(src, trg))),
+        ('training', 'fused', training(lambda: model.forward_fused(src, trg))),
+        ('training', 'fused + sampling', training(lambda: model.forward_fused(src, trg, mask))),
+    ]
+
+    results = {}
+    for mode, path, step in cases:
+        results[(mode, path)] = batch_size / (median_ms(step, runs) / 1e3)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the fused and step-loop Fin-O decoder paths')
+    parser.add_argument('--model-types', nargs='+', choices=['small', 'large'], default=['small', 'large'],
+                       help='Model variants to compare')
+    parser.add_argument('--checkpoint', action='append', default=[], metavar='TYPE=PATH',
+                       help='Checkpoint for a model type (default: random weights, small 2x256 / large 4x512)')
+    parser.add_argument('--batch-size', type=int, default=256,
+                       help='Batch size')
+    parser.add_argument('--forecast-horizon', type=int, default=FORECAST_HORIZON,
+                       help='Decoder steps')
+    parser.add_argument('--runs', type=int, default=5,
+                       help='Timed runs per case')
+    parser.add_argument('--threads', type=int, default=None,
+                       help='torch intra-op threads (default: torch default)')
+
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    checkpoints = dict(spec.split('=', 1) for spec in args.checkpoint)
+
+    ok = True
+    for model_type in args.model_types:
+        print(f"🚀 Fin-O {model_type} (batch {args.batch_size}, horizon {args.forecast_horizon}, "
+              f"{torch.get_num_threads()} threads)")
+
+        torch.manual_seed(0)
+        if model_type in checkpoints:
+            model = load_model(checkpoints[model_type], torch.device('cpu'))
+        else:
+            model = build_model(**RANDOM_ARCHITECTURES[model_type])
+        src = dummy_sequence(args.batch_size, **vocab_sizes(model))
+        trg = dummy_target(args.batch_size, args.forecast_horizon, **vocab_sizes(model))
+
+        print("🔄 Checking outputs against the step loop...")
+        ok = check_outputs(model, src, trg) and ok
+
+        print("🔄 Measuring throughput...")
+        results = compare_throughput(model, src, trg, args.runs)
+
+        print("📊 Samples/s:")
+        for mode in ['validation', 'training']:
+            baseline = results[(mode, 'step loop')]
+            for (case_mode, path), samples_per_second in results.items():
+                if case_mode == mode:
+                    print(f"   {mode:<11} {path:<17} {samples_per_second:9.1f}  "
+                          f"({samples_per_second / baseline:.2f}x)")
+
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Inference benchmark suite for the Fin-O Seq2Seq models.
+Sweeps backend (PyTorch eager, TorchScript, ONNX Runtime fp32/int8), batch size, sequence
+length, forecast horizon and thread count. Each point runs greedy forecasting in a fresh
+subprocess and records load time, p50/p95/p99 latency, throughput and peak RSS. Results are
+written as JSON that can be diffed between commits, and --baseline turns the run into a
+regression check. Random weights are used unless checkpoints are given.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from itertools import product
+from pathlib import Path
+
+import numpy as np
+
+BACKENDS = ['eager', 'torchscript', 'ort-fp32', 'ort-int8']
+
+# build_model arguments of the random-weight model of each type, as in convert_model_to_onnx.py
+RANDOM_ARCHITECTURES = {
+    'small': {'hidden_dim': 256, 'num_layers': 2},
+    'large': {'hidden_dim': 512, 'num_layers': 4},
+}
+
+# Tracked metrics and whether larger values are better
+TRACKED_METRICS = {
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+    'throughput': True,
+    'peak_rss_mb': False,
+    'load_ms': False,
+}
+
+
+def prepare_artifacts(work_dir: Path, model_type: str, backends: list, model_path: str = None, seed: int = 0):
+    """Checkpoint, traced TorchScript modules and split ONNX models for one model type."""
+    import torch
+    from convert_pytorch_to_onnx import build_model, convert_split_model_to_onnx, dummy_sequence, load_model
+
+    work_dir.mkdir(parents=True, exist_ok=True)
+    artifacts = {}
+
+    if model_path is None:
+        model_path = work_dir / f"fin-o-{model_type}-random.pth"
+        torch.manual_seed(seed)
+        torch.save(build_model(**RANDOM_ARCHITECTURES[model_type]).state_dict(), model_path)
+    artifacts['checkpoint'] = str(model_path)
+
+    if 'torchscript' in backends:
+        model = load_model(str(model_path), torch.device('cpu'))
+        src = dummy_sequence()
+        with torch.no_grad():
+            hidden, cell = model.encoder(src)
+            encoder = torch.jit.trace(model.encoder, (src,))
+            decoder = torch.jit.trace(model.decoder, (src[:, -1, [0, 2, 3]], hidden, cell))
+        artifacts['torchscript_encoder'] = str(work_dir / f"fin-o-{model_type}-encoder.pt")
+        artifacts['torchscript_decoder'] = str(work_dir / f"fin-o-{model_type}-decoder-step.pt")
+        torch.jit.save(encoder, artifacts['torchscript_encoder'])
+        torch.jit.save(decoder, artifacts['torchscript_decoder'])
+
+    if 'ort-fp32' in backends or 'ort-int8' in backends:
+        encoder_path, decoder_path = convert_split_model_to_onnx(str(model_path), model_type, str(work_dir))
+        artifacts['ort-fp32'] = [str(encoder_path), str(decoder_path)]
+
+    if 'ort-int8' in backends:
+        from quantize_onnx_model import quantize_model
+
+        artifacts['ort-int8'] = []
+        for fp32_path in artifacts['ort-fp32']:
+            int8_path = fp32_path.replace('.onnx', '-int8.onnx')
+            quantize_model(fp32_path, int8_path, 'dynamic')
+            artifacts['ort-int8'].append(int8_path)
+
+    return artifacts
+
+
+def load_backend(backend: str, artifacts: dict, threads: int):
+    """Load one backend and return forecast(src, horizon), a greedy Seq2Seq.predict equivalent."""
+    if backend.startswith('ort'):
+        import onnxruntime as ort
+        from run_split_onnx import greedy_forecast
+
+        session_options = ort.SessionOptions()
+        session_options.intra_op_num_threads = threads
+        encoder_session, decoder_session = [
+            ort.InferenceSession(path, sess_options=session_options, providers=['CPUExecutionProvider'])
+            for path in artifacts[backend]
+        ]
+        return lambda src, horizon: greedy_forecast(encoder_session, decoder_session, src.numpy(), horizon)
+
+    import torch
+    from convert_pytorch_to_onnx import initial_decoder_input, load_model, next_decoder_input
+
+    torch.set_num_threads(threads)
+
+    if backend == 'eager':
+        model = load_model(artifacts['checkpoint'], torch.device('cpu'))
+        return model.predict
+
+    encoder = torch.jit.load(artifacts['torchscript_encoder'])
+    decoder = torch.jit.load(artifacts['torchscript_decoder'])
+
+    def forecast(src, horizon):
+        with torch.no_grad():
+            hidden, cell = encoder(src)
+            decoder_input = initial_decoder_input(src)
+            outputs = []
+            for _ in range(horizon):
+                pred_amount, pred_category, pred_merchant, hidden, cell = decoder(decoder_input, hidden, cell)
+                outputs.append((pred_amount, pred_category, pred_merchant))
+                decoder_input = next_decoder_input(pred_amount, pred_category, pred_merchant)
+        return outputs
+
+    return forecast
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    # On Linux ru_maxrss survives fork + exec, so it would report the parent's peak; VmHWM
+    # belongs to the current address space only
+    status = Path('/proc/self/status')
+    if status.exists():
+        for line in status.read_text().splitlines():
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1e3
+
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss / 1e6 if sys.platform == 'darwin' else peak_rss / 1e3
+
+
+def median_ms(step, runs: int, warmup: int = 1) -> float:
+    """Median wall-clock milliseconds per call of step(), after warmup untimed calls."""
+    for _ in range(warmup):
+        step()
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        step()
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2] * 1e3
+
+
+def run_point(point: dict):
+    """Measure a single sweep point in the current process."""
+    import torch
+    from convert_pytorch_to_onnx import dummy_sequence
+
+    start = time.perf_counter()
+    forecast = load_backend(point['backend'], point['artifacts'], point['threads'])
+    load_ms = (time.perf_counter() - start) * 1e3
+
+    torch.manual_seed(0)
+    src = dummy_sequence(point['batch_size'], point['sequence_length'])
+
+    for _ in range(point['warmup']):
+        forecast(src, point['horizon'])
+
+    timings = []
+    deadline = time.perf_counter() + point['max_seconds']
+    while len(timings) < point['runs'] and (len(timings) < point['min_runs'] or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        forecast(src, point['horizon'])
+        timings.append((time.perf_counter() - start) * 1e3)
+
+    return {
+        'load_ms': load_ms,
+        'p50_ms': float(np.percentile(timings, 50)),
+        'p95_ms': float(np.percentile(timings, 95)),
+        'p99_ms': float(np.percentile(timings, 99)),
+        'throughput': point['batch_size'] / (float(np.mean(timings)) / 1e3),
+        'peak_rss_mb': peak_rss_mb(),
+        'runs': len(timings),
+    }
+
+
+def measure_point(point: dict):
+    """Run one point in a fresh interpreter so load time and peak RSS are not shared."""
+    env = dict(os.environ, OMP_NUM_THREADS=str(point['threads']))
+    completed = subprocess.run(
+        [sys.executable, str(Path(__file__).resolve()), '--run-point', json.dumps(point)],
+        capture_output=True, text=True, env=env, cwd=str(Path(__file__).resolve().parent),
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Benchmark point failed:\n{completed.stderr}")
+    # The measurement is the last line; anything before it is model loading output
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def point_key(point: dict) -> str:
+    return (f"{point['model_type']}/{point['backend']}/batch={point['batch_size']}/"
+            f"seq={point['sequence_length']}/horizon={point['horizon']}/threads={point['threads']}")
+
+
+def environment_info():
+    import onnxruntime as ort
+    import torch
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'torch': torch.__version__,
+        'onnxruntime': ort.__version__,
+    }
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float, metrics: list):
+    """Tracked metrics that got worse than the baseline by more than tolerance (a fraction)."""
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        for metric in metrics:
+            current, previous = result[metric], baseline[key][metric]
+            if TRACKED_METRICS[metric]:
+                worse = current < previous * (1 - tolerance)
+            else:
+                worse = current > previous * (1 + tolerance)
+            if worse:
+                regressions.append((key, metric, previous, current))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Fin-O inference across backends and shapes')
+    parser.add_argument('--model-types', nargs='+', choices=['small', 'large'], default=['small', 'large'],
+                       help='Model variants to benchmark')
+    parser.add_argument('--checkpoint', action='append', default=[], metavar='TYPE=PATH',
+                       help='Checkpoint for a model type (default: random weights, small 256x2 and large 512x4), '
+                            'e.g. large=model/fin-o-large')
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=BACKENDS,
+                       help='Backends to benchmark')
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 16, 256, 2048],
+                       help='Batch sizes to sweep')
+    parser.add_argument('--sequence-lengths', nargs='+', type=int, default=[50],
+                       help='Encoder sequence lengths to sweep')
+    parser.add_argument('--horizons', nargs='+', type=int, default=[10],
+                       help='Forecast horizons to sweep')
+    parser.add_argument('--threads', nargs='+', type=int, default=[os.cpu_count()],
+                       help='Intra-op thread counts to sweep')
+    parser.add_argument('--runs', type=int, default=20,
+                       help='Timed runs per point')
+    parser.add_argument('--min-runs', type=int, default=3,
+                       help='Timed runs per point even when --max-seconds is exceeded')
+    parser.add_argument('--warmup', type=int, default=2,
+                       help='Untimed warm-up runs per point')
+    parser.add_argument('--max-seconds', type=float, default=30.0,
+                       help='Stop timing a point after this many seconds (once --min-runs is reached)')
+    parser.add_argument('--work-dir', type=str, default='benchmark_artifacts',
+                       help='Directory for random-weight checkpoints and exported models')
+    parser.add_argument('--output', type=str, default='benchmark_results.json',
+                       help='Where to write the JSON results')
+    parser.add_argument('--baseline', type=str, default=None,
+                       help='Previous results JSON; exit with an error if a tracked metric regressed')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                       help='Allowed relative regression against --baseline')
+    parser.add_argument('--metrics', nargs='+', choices=list(TRACKED_METRICS),
+                       default=['p50_ms', 'p99_ms', 'throughput', 'peak_rss_mb'],
+                       help='Metrics checked against --baseline')
+    parser.add_argument('--run-point', type=str, default=None, help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.run_point:
+        print(json.dumps(run_point(json.loads(args.run_point))))
+        return
+
+    checkpoints = dict(spec.split('=', 1) for spec in args.checkpoint)
+
+    print(f"🚀 Benchmarking {', '.join(args.backends)} for Fin-O {', '.join(args.model_types)}...")
+
+    results = {}
+    for model_type in args.model_types:
+        print(f"🔄 Preparing {model_type} artifacts in {args.work_dir}...")
+        artifacts = prepare_artifacts(Path(args.work_dir) / model_type, model_type, args.backends,
+                                      checkpoints.get(model_type))
+
+        sweep = product(args.backends, args.batch_sizes, args.sequence_lengths, args.horizons, args.threads)
+        for backend, batch_size, sequence_length, horizon, threads in sweep:
+            point = {
+                'model_type': model_type,
+                'backend': backend,
+                'batch_size': batch_size,
+                'sequence_length': sequence_length,
+                'horizon': horizon,
+                'threads': threads,
+                'runs': args.runs,
+                'min_runs': args.min_runs,
+                'warmup': args.warmup,
+                'max_seconds': args.max_seconds,
+                'artifacts': artifacts,
+            }
+            key = point_key(point)
+            metrics = measure_point(point)
+            results[key] = {name: point[name] for name in
+                            ['model_type', 'backend', 'batch_size', 'sequence_length', 'horizon', 'threads']}
+            results[key].update(metrics)
+
+            print(f"   {key:<60} p50 {metrics['p50_ms']:9.2f} ms  p99 {metrics['p99_ms']:9.2f} ms  "
+                  f"{metrics['throughput']:9.1f} seq/s  {metrics['peak_rss_mb']:7.0f} MB  "
+                  f"load {metrics['load_ms']:7.0f} ms")
+
+    report = {
+        'environment': environment_info(),
+        'checkpoints': {model_type: checkpoints.get(model_type, 'random') for model_type in args.model_types},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"✅ Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+        regressions = find_regressions(results, baseline, args.tolerance, args.metrics)
+        missing = sorted(set(results) - set(baseline))
+        if missing:
+            print(f"⚠️  {len(missing)} point(s) not in the baseline, not checked")
+
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for key, metric, previous, current in regressions:
+                print(f"   {key} {metric}: {previous:.2f} -> {current:.2f}")
+            raise SystemExit(1)
+        print(f"✅ No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
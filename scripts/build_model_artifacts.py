@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Incremental build of the web app's model artifacts (ONNX models, scaler.json, vocab.json).
+Every artifact is keyed on a content hash of its inputs (checkpoint, scaler.pkl, vocab.json,
+converter source, library versions and export options) and stored in a local cache, so
+unchanged artifacts are never re-exported. Cache misses are converted in a process pool.
+Artifacts are published under content-hashed file names with a manifest.json mapping the
+plain names to them, so the files can be served with immutable long-lived HTTP caching and
+browsers keep reusing unchanged weights across deploys.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import onnx
+import torch
+
+import checkpoint_format
+import convert_pytorch_to_onnx
+from convert_pytorch_to_onnx import (
+    convert_loop_model_to_onnx,
+    convert_model_to_onnx,
+    convert_split_model_to_onnx,
+    copy_vocab_json,
+    create_scaler_json,
+    load_checkpoint,
+)
+
+MANIFEST_VERSION = 1
+DEFAULT_VARIANTS = ['small=model/fin-o-small', 'large=model/fin-o-large']
+
+
+def file_digest(path) -> str:
+    """sha256 of a file's content, or 'missing' if it does not exist."""
+    path = Path(path)
+    if not path.exists():
+        return 'missing'
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def artifact_key(kind: str, inputs: dict, options: dict) -> str:
+    """Cache key of one artifact: its kind, input file contents, converter source and options."""
+    key = {
+        'kind': kind,
+        'inputs': {name: file_digest(path) for name, path in sorted(inputs.items())},
+        'converter': [file_digest(convert_pytorch_to_onnx.__file__), file_digest(checkpoint_format.__file__)],
+        'builder': file_digest(__file__),
+        'options': options,
+    }
+    if kind == 'model':
+        key['versions'] = {'torch': torch.__version__, 'onnx': onnx.__version__}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def artifact_specs(variants: dict, args):
+    """(name, kind, inputs, options) of every artifact to build."""
+    specs = []
+    for model_type, model_path in variants.items():
+        inputs = {'checkpoint': model_path}
+        # Only inputs that end up in the graph invalidate it
+        if args.postprocess_top_k is not None or args.export_mode == 'raw':
+            inputs['scaler'] = args.scaler_path
+        if args.export_mode == 'raw':
+            inputs['vocab'] = args.vocab_path
+        options = {'model_type': model_type, 'export_mode': args.export_mode, 'top_k': args.postprocess_top_k}
+        # Export modes write different files, so each gets its own manifest entry
+        name = model_type if args.export_mode == 'full' else f"{model_type}-{args.export_mode}"
+        specs.append((name, 'model', inputs, options))
+
+    specs.append(('scaler', 'scaler', {'scaler': args.scaler_path}, {}))
+    specs.append(('vocab', 'vocab', {'vocab': args.vocab_path}, {}))
+    return specs
+
+
+def init_worker(threads: int):
+    torch.set_num_threads(threads)
+
+
+def build_artifact(kind: str, inputs: dict, options: dict, output_dir: str):
+    """Run the converter for one artifact into output_dir."""
+    if kind == 'scaler':
+        create_scaler_json(inputs['scaler'], output_dir)
+        return
+    if kind == 'vocab':
+        copy_vocab_json(inputs['vocab'], output_dir)
+        return
+
+    # The converter falls back to random weights, which must never be published
+    if load_checkpoint(inputs['checkpoint'], torch.device('cpu'))[0] is None:
+        raise ValueError(f"cannot load checkpoint {inputs['checkpoint']} for {options['model_type']}")
+
+    if options['export_mode'] == 'split':
+        convert_split_model_to_onnx(inputs['checkpoint'], options['model_type'], output_dir)
+    elif options['export_mode'] == 'loop':
+        convert_loop_model_to_onnx(inputs['checkpoint'], options['model_type'], output_dir)
+    else:
+        convert_model_to_onnx(inputs['checkpoint'], options['model_type'], output_dir, options['top_k'],
+                              inputs.get('scaler', 'model/scaler.pkl'), options['export_mode'] == 'raw',
+                              inputs.get('vocab', 'model/vocab.json'))
+
+
+def inline_external_data(output_dir: Path):
+    """Move the weights of every ONNX model in output_dir from its .onnx.data file into the model.
+
+    publish() renames files by content hash, which would break the data file location
+    stored in the model, and a single file is one request for the browser.
+    """
+    for model_path in output_dir.glob('*.onnx'):
+        data_path = model_path.with_name(model_path.name + '.data')
+        if data_path.exists():
+            onnx.save(onnx.load(str(model_path)), str(model_path))
+            data_path.unlink()
+
+
+def build_into_cache(kind: str, inputs: dict, options: dict, cache_entry: str) -> float:
+    """Build one artifact and move it into its cache entry atomically; returns the build seconds."""
+    start = time.perf_counter()
+    cache_entry = Path(cache_entry)
+    staging_dir = Path(tempfile.mkdtemp(prefix=f".{cache_entry.name}.", dir=cache_entry.parent))
+    try:
+        build_artifact(kind, inputs, options, str(staging_dir))
+        inline_external_data(staging_dir)
+        if not any(staging_dir.iterdir()):
+            raise RuntimeError(f"the converter wrote no files for {kind} {options}")
+        os.replace(staging_dir, cache_entry)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    return time.perf_counter() - start
+
+
+def hashed_name(path: Path, digest: str) -> str:
+    """fin-o-small.onnx -> fin-o-small.<16 hex digits>.onnx"""
+    return f"{path.stem}.{digest[:16]}{path.suffix}"
+
+
+def publish(cache_entry: Path, output_dir: Path, url_prefix: str) -> dict:
+    """Copy the files of a cache entry into output_dir under content-hashed names."""
+    files = {}
+    for path in sorted(cache_entry.iterdir()):
+        digest = file_digest(path)
+        target = output_dir / hashed_name(path, digest)
+        if not target.exists():
+            partial = target.with_name(target.name + '.partial')
+            shutil.copyfile(path, partial)
+            os.replace(partial, target)
+        files[path.name] = {
+            'url': url_prefix + target.name,
+            'file': target.name,
+            'sha256': digest,
+            'bytes': target.stat().st_size,
+        }
+    return files
+
+
+def check_published_models(output_dir: Path, manifest: dict):
+    """Load every published model once in ONNX Runtime, so broken artifacts fail the build."""
+    import onnxruntime as ort
+
+    for name, entry in manifest['files'].items():
+        if name.endswith('.onnx'):
+            ort.InferenceSession(str(output_dir / entry['file']), providers=['CPUExecutionProvider'])
+
+
+def read_manifest(output_dir: Path) -> dict:
+    """The published manifest.json of output_dir, or an empty manifest."""
+    manifest_path = output_dir / 'manifest.json'
+    if not manifest_path.exists():
+        return {'files': {}, 'artifacts': {}}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def write_manifest(output_dir: Path, manifest: dict):
+    """Write manifest.json atomically and delete hashed files only the previous manifest referenced."""
+    manifest_path = output_dir / 'manifest.json'
+    previous_files = {entry['file'] for entry in read_manifest(output_dir).get('files', {}).values()}
+
+    partial = manifest_path.with_name('manifest.json.partial')
+    with open(partial, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(partial, manifest_path)
+
+    current_files = {entry['file'] for entry in manifest['files'].values()}
+    for name in previous_files - current_files:
+        (output_dir / name).unlink(missing_ok=True)
+
+
+def build_model_artifacts(variants: dict, args):
+    """Build (or reuse) every artifact, publish it and write the manifest; returns the manifest.
+
+    Artifacts of the previous manifest that are not part of this build (other export modes
+    or variants) stay published unless args.prune is set.
+    """
+    cache_dir = Path(args.cache_dir)
+    output_dir = Path(args.output_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    specs = [(name, kind, inputs, options, artifact_key(kind, inputs, options))
+             for name, kind, inputs, options in artifact_specs(variants, args)]
+
+    misses = []
+    for name, kind, inputs, options, key in specs:
+        cache_entry = cache_dir / key
+        if args.force and cache_entry.exists():
+            shutil.rmtree(cache_entry)
+        if cache_entry.exists():
+            print(f"✅ {name}: cache hit ({key[:16]})")
+        else:
+            misses.append((name, kind, inputs, options, key))
+
+    if misses:
+        jobs = min(args.jobs, len(misses))
+        threads = max(1, (os.cpu_count() or 1) // jobs)
+        print(f"🔄 Building {len(misses)} artifact(s) with {jobs} process(es), {threads} thread(s) each...")
+        with ProcessPoolExecutor(jobs, initializer=init_worker, initargs=(threads,)) as pool:
+            futures = {
+                name: pool.submit(build_into_cache, kind, inputs, options, str(cache_dir / key))
+                for name, kind, inputs, options, key in misses
+            }
+            for name, future in futures.items():
+                print(f"✅ {name}: built in {future.result():.1f}s")
+
+    manifest = {'version': MANIFEST_VERSION, 'files': {}, 'artifacts': {}}
+    if not args.prune:
+        previous = read_manifest(output_dir)
+        built = {name for name, *_ in specs}
+        for name, entry in previous.get('artifacts', {}).items():
+            if name not in built:
+                manifest['artifacts'][name] = entry
+                manifest['files'].update({file: previous['files'][file] for file in entry['files']})
+
+    for name, kind, inputs, options, key in specs:
+        files = publish(cache_dir / key, output_dir, args.url_prefix)
+        manifest['files'].update(files)
+        manifest['artifacts'][name] = {'cache_key': key, 'files': sorted(files)}
+
+    check_published_models(output_dir, manifest)
+    write_manifest(output_dir, manifest)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the Fin-O web model artifacts with a content-hashed cache')
+    parser.add_argument('--variant', action='append', default=None, metavar='TYPE=CHECKPOINT',
+                       help=f"Model variant to build (repeatable, default: {' '.join(DEFAULT_VARIANTS)})")
+    parser.add_argument('--scaler-path', type=str, default='model/scaler.pkl',
+                       help='Path to the scaler pickle file')
+    parser.add_argument('--vocab-path', type=str, default='model/vocab.json',
+                       help='Path to the vocab.json file')
+    parser.add_argument('--export-mode', choices=['full', 'split', 'raw', 'loop'], default='full',
+                       help='Converter export mode for every variant')
+    parser.add_argument('--postprocess-top-k', type=int, default=None, metavar='K',
+                       help='Converter --postprocess-top-k (full and raw exports)')
+    parser.add_argument('--output-dir', type=str, default='public/model',
+                       help='Directory the web app serves the artifacts from')
+    parser.add_argument('--url-prefix', type=str, default='/model/',
+                       help='URL of --output-dir in the web app')
+    parser.add_argument('--cache-dir', type=str, default='.cache/model-artifacts',
+                       help='Artifact cache directory')
+    parser.add_argument('--jobs', type=int, default=max(1, min(4, os.cpu_count() or 1)),
+                       help='Conversion processes')
+    parser.add_argument('--force', action='store_true',
+                       help='Rebuild every artifact')
+    parser.add_argument('--prune', action='store_true',
+                       help='Drop published artifacts that are not part of this build from the manifest')
+
+    args = parser.parse_args()
+
+    if args.postprocess_top_k is not None and args.export_mode not in ('full', 'raw'):
+        parser.error('--postprocess-top-k is only supported with --export-mode full or raw')
+
+    variants = {}
+    for spec in args.variant or DEFAULT_VARIANTS:
+        model_type, model_path = spec.split('=', 1)
+        if Path(model_path).exists():
+            variants[model_type] = model_path
+        else:
+            print(f"⚠️  Skipping Fin-O {model_type} ({model_path} not found)")
+
+    print(f"🚀 Building model artifacts for {', '.join(variants) or 'no model variants'}...")
+    start = time.perf_counter()
+    try:
+        manifest = build_model_artifacts(variants, args)
+    except ValueError as e:
+        print(f"❌ {e}")
+        raise SystemExit(1)
+
+    print(f"📊 Manifest {Path(args.output_dir) / 'manifest.json'} ({time.perf_counter() - start:.1f}s):")
+    for name, entry in manifest['files'].items():
+        print(f"   {name:<32} -> {entry['url']} ({entry['bytes'] / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
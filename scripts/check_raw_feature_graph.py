@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Parity check of the in-graph feature engineering (--export-mode raw) against
+preprocess_transactions.process_raw_data. Histories of several lengths, each starting at a
+user's first transaction, are fed to RawFeaturePreprocessor, eagerly and exported to ONNX,
+and the window at their end is compared with the rows the Python preprocessing produced for
+it; optionally the exported raw-input model is also compared with the PyTorch model run
+on the Python features.
+"""
+
+import argparse
+import json
+import pickle
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import onnxruntime as ort
+import pandas as pd
+import torch
+
+from convert_pytorch_to_onnx import (
+    FORECAST_HORIZON,
+    RAW_INPUT_NAMES,
+    SEQUENCE_LENGTH,
+    RawFeaturePreprocessor,
+    convert_model_to_onnx,
+    load_model,
+)
+from preprocess_transactions import process_raw_data, signed_amount, synthetic_transactions
+from window_dataset import INPUT_FEATURES
+
+
+def user_histories(raw_df: pd.DataFrame, processed_df: pd.DataFrame, history_length: int,
+                   sequence_length: int, max_users: int):
+    """Raw columns of the first history_length transactions of each user and the expected
+    features of the window at its end (its last sequence_length rows).
+
+    With the history starting at a user's first transaction, time deltas and running
+    averages over it equal the full-history features of process_raw_data, wherever the
+    window ends.
+    """
+    position = processed_df.groupby('user_id').cumcount().to_numpy()
+    history = processed_df.groupby('user_id')['user_id'].transform('size').to_numpy()
+    rows = processed_df[(position < history_length) & (history >= history_length)]
+    rows = rows[rows['user_id'].isin(rows['user_id'].unique()[:max_users])]
+
+    raw = raw_df.loc[rows.index]
+    num_users = len(rows) // history_length
+    shape = (num_users, history_length)
+
+    raw_columns = (
+        signed_amount(raw['amount'].to_numpy(dtype=np.float64), raw['action']).astype(np.float32).reshape(shape),
+        raw['oldBalanceOrig'].to_numpy(dtype=np.float32).reshape(shape),
+        rows['category_id'].to_numpy(dtype=np.int64).reshape(shape),
+        rows['merchant_id'].to_numpy(dtype=np.int64).reshape(shape),
+        raw['step'].to_numpy(dtype=np.int64).reshape(shape),
+    )
+    expected = rows[INPUT_FEATURES].to_numpy(dtype=np.float32).reshape(num_users, history_length, -1)
+    return raw_columns, expected[:, -sequence_length:]
+
+
+def export_preprocessor(preprocessor: RawFeaturePreprocessor, raw_columns, output_path: str):
+    """Export the preprocessor on its own, with dynamic batch and history axes."""
+    torch.onnx.export(
+        preprocessor,
+        tuple(torch.tensor(column) for column in raw_columns),
+        output_path,
+        opset_version=11,
+        dynamo=False,
+        input_names=RAW_INPUT_NAMES,
+        output_names=['input'],
+        dynamic_axes={**{name: {0: 'batch_size', 1: 'history_length'} for name in RAW_INPUT_NAMES},
+                      'input': {0: 'batch_size', 1: 'sequence_length'}},
+    )
+
+
+def compare_features(name: str, actual: np.ndarray, expected: np.ndarray, atol: float) -> bool:
+    """Per-feature max abs differences; category and merchant IDs must match exactly."""
+    ok = True
+    print(f"🔄 {name}:")
+    for i, feature in enumerate(INPUT_FEATURES):
+        max_diff = float(np.abs(actual[..., i] - expected[..., i]).max())
+        passed = max_diff == 0 if feature in ('category_id', 'merchant_id') else max_diff <= atol
+        ok = ok and passed
+        print(f"   {'✅' if passed else '❌'} {feature:<20} max abs diff {max_diff:.2e}")
+    return ok
+
+
+def compare_model(model_path: str, scaler, vocab_mappings: dict, raw_columns, expected: np.ndarray,
+                  atol: float) -> bool:
+    """Export the raw-input model and compare it with the PyTorch model on the Python features."""
+    model = load_model(model_path, torch.device('cpu'))
+    target = np.zeros((len(expected), FORECAST_HORIZON, 4), dtype=np.float32)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        scaler_path = Path(tmp_dir) / 'scaler.pkl'
+        vocab_path = Path(tmp_dir) / 'vocab.json'
+        with open(scaler_path, 'wb') as f:
+            pickle.dump(scaler, f)
+        with open(vocab_path, 'w') as f:
+            json.dump(vocab_mappings, f)
+
+        onnx_path = convert_model_to_onnx(model_path, 'check', tmp_dir, scaler_path=str(scaler_path),
+                                          raw_inputs=True, vocab_path=str(vocab_path))
+        session = ort.InferenceSession(str(onnx_path), providers=['CPUExecutionProvider'])
+        actual = session.run(None, {**dict(zip(RAW_INPUT_NAMES, raw_columns)), 'target': target})
+
+    with torch.no_grad():
+        reference = model(torch.from_numpy(expected), torch.from_numpy(target))
+
+    ok = True
+    print("🔄 Raw-input model vs PyTorch on Python features:")
+    for name, actual_output, reference_output in zip(['amount', 'category', 'merchant'], actual, reference):
+        max_diff = float(np.abs(actual_output - reference_output.numpy()).max())
+        ok = ok and max_diff <= atol
+        print(f"   {'✅' if max_diff <= atol else '❌'} {name:<20} max abs diff {max_diff:.2e}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the in-graph Fin-O feature engineering against Python')
+    parser.add_argument('--csv', type=str, default=None,
+                       help='Raw transactions CSV (t2.csv format); synthetic data is used if omitted')
+    parser.add_argument('--synthetic-rows', type=int, default=50_000,
+                       help='Number of synthetic transactions when no CSV is given')
+    parser.add_argument('--synthetic-users', type=int, default=200,
+                       help='Number of synthetic users when no CSV is given')
+    parser.add_argument('--max-users', type=int, default=64,
+                       help='Number of users to check')
+    parser.add_argument('--sequence-length', type=int, default=SEQUENCE_LENGTH,
+                       help='Encoder window of the preprocessor')
+    parser.add_argument('--history-lengths', type=int, nargs='+', default=None,
+                       help='Transactions fed per user; the window ends after this many (default: a third '
+                            'of the window, the window, and two histories ending at other offsets)')
+    parser.add_argument('--model-path', type=str, default=None,
+                       help='Also export this checkpoint with raw inputs and compare model outputs')
+    parser.add_argument('--atol', type=float, default=1e-4,
+                       help='Tolerance for scaled features and model outputs')
+
+    args = parser.parse_args()
+
+    raw_df = pd.read_csv(args.csv) if args.csv else synthetic_transactions(args.synthetic_rows, args.synthetic_users)
+    processed_df, vocab_mappings, scaler = process_raw_data(raw_df)
+    history_lengths = args.history_lengths or [max(1, args.sequence_length // 3), args.sequence_length,
+                                               2 * args.sequence_length + 7, 4 * args.sequence_length + 3]
+
+    histories = {}
+    for history_length in history_lengths:
+        raw_columns, expected = user_histories(raw_df, processed_df, history_length, args.sequence_length,
+                                               args.max_users)
+        if not len(expected):
+            raise SystemExit(f"❌ No user has {history_length} transactions")
+        histories[history_length] = raw_columns, expected
+
+    preprocessor = RawFeaturePreprocessor(scaler.mean_, scaler.scale_,
+                                          len(vocab_mappings['categories']), len(vocab_mappings['merchants']),
+                                          args.sequence_length).eval()
+    ok = True
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        onnx_path = str(Path(tmp_dir) / 'raw-features.onnx')
+        export_preprocessor(preprocessor, histories[max(histories)][0], onnx_path)
+        session = ort.InferenceSession(onnx_path, providers=['CPUExecutionProvider'])
+
+        for history_length, (raw_columns, expected) in histories.items():
+            print(f"🚀 Checking in-graph features for {len(expected)} users, window of "
+                  f"{expected.shape[1]} ending after transaction {history_length}")
+            with torch.no_grad():
+                eager = preprocessor(*(torch.tensor(column) for column in raw_columns)).numpy()
+            ok = compare_features('PyTorch', eager, expected, args.atol) and ok
+
+            features, = session.run(None, dict(zip(RAW_INPUT_NAMES, raw_columns)))
+            ok = compare_features('ONNX Runtime', features, expected, args.atol) and ok
+
+    if args.model_path:
+        raw_columns, expected = histories[max(histories)]
+        ok = compare_model(args.model_path, scaler, vocab_mappings, raw_columns, expected, args.atol) and ok
+
+    print("✅ In-graph features match" if ok else "❌ In-graph features differ")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
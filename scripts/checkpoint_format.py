@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Flat, memory-mapped checkpoint format for Fin-O weights (safetensors layout).
+A file is an 8-byte little-endian header length, a JSON header mapping every tensor name
+to its dtype, shape and byte range, plus a __metadata__ entry with the model's architecture
+hyperparameters, followed by the raw tensor bytes. Loading maps the file copy-on-write and
+returns tensors that are views of the mapping, so no tensor is deserialized or copied until
+it is written to. Also converts torch.save checkpoints and benchmarks loading against
+torch.load.
+"""
+
+import argparse
+import json
+import os
+import struct
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+
+METADATA_KEY = '__metadata__'
+
+# Architecture hyperparameters stored in the header, as build_model keyword arguments
+HYPERPARAMETERS = ['vocab_size_cat', 'vocab_size_merch', 'embedding_dim', 'hidden_dim', 'num_layers']
+
+# safetensors dtype names -> (torch dtype, numpy dtype of the raw bytes)
+DTYPES = {
+    'F64': (torch.float64, np.float64),
+    'F32': (torch.float32, np.float32),
+    'F16': (torch.float16, np.float16),
+    'BF16': (torch.bfloat16, np.uint16),
+    'I64': (torch.int64, np.int64),
+    'I32': (torch.int32, np.int32),
+    'I16': (torch.int16, np.int16),
+    'I8': (torch.int8, np.int8),
+    'U8': (torch.uint8, np.uint8),
+    'BOOL': (torch.bool, np.bool_),
+}
+DTYPE_NAMES = {torch_dtype: name for name, (torch_dtype, _) in DTYPES.items()}
+
+
+def is_tensor_file(path) -> bool:
+    """Whether path looks like a file of this format rather than a torch.save checkpoint."""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        prefix = f.read(9)
+    if len(prefix) < 9:
+        return False
+    header_size, = struct.unpack('<Q', prefix[:8])
+    return 8 + header_size <= size and prefix[8:9] == b'{'
+
+
+def save_tensor_file(state_dict: dict, path, metadata: dict = None):
+    """Write a state dict with string-valued metadata; written to a temporary file and renamed."""
+    # Larger element types first keeps every tensor aligned to its element size
+    names = sorted(state_dict, key=lambda name: (-state_dict[name].element_size(), name))
+
+    header = {}
+    offset = 0
+    for name in names:
+        tensor = state_dict[name]
+        size = tensor.numel() * tensor.element_size()
+        header[name] = {
+            'dtype': DTYPE_NAMES[tensor.dtype],
+            'shape': list(tensor.shape),
+            'data_offsets': [offset, offset + size],
+        }
+        offset += size
+    if metadata:
+        header[METADATA_KEY] = {key: str(value) for key, value in metadata.items()}
+
+    header_bytes = json.dumps(header, separators=(',', ':')).encode()
+    # Pad so the tensor data starts 8-byte aligned
+    header_bytes += b' ' * (-(8 + len(header_bytes)) % 8)
+
+    path = Path(path)
+    partial = path.with_name(path.name + '.partial')
+    with open(partial, 'wb') as f:
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for name in names:
+            tensor = state_dict[name].detach().cpu().contiguous()
+            if tensor.dtype == torch.bfloat16:
+                tensor = tensor.view(torch.uint16)
+            f.write(tensor.numpy().tobytes())
+    os.replace(partial, path)
+
+
+def read_header(path):
+    """(tensor entries, metadata, byte offset of the tensor data) of a file."""
+    with open(path, 'rb') as f:
+        header_size, = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(header_size))
+    metadata = header.pop(METADATA_KEY, {})
+    return header, metadata, 8 + header_size
+
+
+def load_tensor_file(path):
+    """(state dict, metadata) with every tensor a zero-copy view of a copy-on-write mapping of path."""
+    header, metadata, data_start = read_header(path)
+    data = np.memmap(path, dtype=np.uint8, mode='c', offset=data_start) if header else None
+
+    state_dict = {}
+    for name, entry in header.items():
+        torch_dtype, numpy_dtype = DTYPES[entry['dtype']]
+        start, end = entry['data_offsets']
+        array = data[start:end].view(numpy_dtype).reshape(entry['shape'])
+        tensor = torch.from_numpy(array)
+        state_dict[name] = tensor.view(torch_dtype) if torch_dtype == torch.bfloat16 else tensor
+    return state_dict, metadata
+
+
+def hyperparameters(metadata: dict) -> dict:
+    """build_model keyword arguments stored in the metadata of a file."""
+    return {key: int(metadata[key]) for key in HYPERPARAMETERS if key in metadata}
+
+
+def measure_load(checkpoint_format: str, path: str) -> dict:
+    """Build the model from path with the given loader; runs in a fresh process per measurement."""
+    from benchmark_inference import peak_rss_mb
+    from convert_pytorch_to_onnx import build_model, checkpoint_architecture, model_from_state_dict
+
+    device = torch.device('cpu')
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    if checkpoint_format == 'torch':
+        # What load_model did before this format: allocate and initialize, then copy in
+        state_dict = torch.load(path, map_location=device)
+        model = build_model(device, **checkpoint_architecture(state_dict))
+        model.load_state_dict(state_dict)
+    else:
+        state_dict, metadata = load_tensor_file(path)
+        model = model_from_state_dict(state_dict, hyperparameters(metadata), device)
+    elapsed = time.perf_counter() - start
+
+    return {'seconds': elapsed, 'peak_rss_mb': peak_rss_mb(), 'rss_increase_mb': peak_rss_mb() - rss_before}
+
+
+def benchmark(torch_path: str, tensor_path: str, runs: int):
+    """Median load time and peak RSS of torch.load and the mapped format, each in fresh processes."""
+    results = {}
+    for checkpoint_format, path in [('torch', torch_path), ('mmap', tensor_path)]:
+        measurements = []
+        for _ in range(runs):
+            output = subprocess.run(
+                [sys.executable, __file__, '--measure', checkpoint_format, path],
+                check=True, capture_output=True, text=True
+            ).stdout
+            measurements.append(json.loads(output.strip().splitlines()[-1]))
+        measurements.sort(key=lambda m: m['seconds'])
+        results[checkpoint_format] = measurements[len(measurements) // 2]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert Fin-O checkpoints to the mapped tensor format and '
+                                                 'benchmark loading against torch.load')
+    parser.add_argument('--convert', nargs=2, metavar=('CHECKPOINT', 'OUTPUT'),
+                       help='Convert a torch.save checkpoint, storing its architecture in the header')
+    parser.add_argument('--benchmark', nargs=2, metavar=('CHECKPOINT', 'TENSOR_FILE'),
+                       help='Compare loading a torch.save checkpoint with its converted file')
+    parser.add_argument('--runs', type=int, default=3,
+                       help='Fresh processes per loader in the benchmark')
+    parser.add_argument('--measure', nargs=2, help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure_load(*args.measure)))
+        return
+
+    if args.convert:
+        from convert_pytorch_to_onnx import load_checkpoint
+
+        source, output = args.convert
+        state_dict, architecture = load_checkpoint(source, torch.device('cpu'))
+        if state_dict is None:
+            raise SystemExit(1)
+        save_tensor_file(state_dict, output, architecture)
+        print(f"✅ Wrote {output} ({os.path.getsize(output) / 1e6:.1f} MB, {architecture})")
+
+    if args.benchmark:
+        results = benchmark(*args.benchmark, args.runs)
+        torch_result, mmap_result = results['torch'], results['mmap']
+        print(f"📊 Load time and memory (median of {args.runs} fresh process(es)):")
+        print(f"   {'':<12}{'seconds':>10}{'peak RSS MB':>14}{'RSS growth MB':>16}")
+        for name, result in [('torch.load', torch_result), ('mmap', mmap_result)]:
+            print(f"   {name:<12}{result['seconds']:>10.3f}{result['peak_rss_mb']:>14.1f}"
+                  f"{result['rss_increase_mb']:>16.1f}")
+        print(f"   mmap loads {torch_result['seconds'] / mmap_result['seconds']:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,24 @@ import numpy as np
 from pathlib import Path
 import argparse
 import os
+from contextlib import contextmanager
+
+from checkpoint_format import hyperparameters, is_tensor_file, load_tensor_file
+
+# Model configuration - CORRECTED to match actual trained model
+VOCAB_SIZE_CAT = 41  # Actual number from vocab.json
+VOCAB_SIZE_MERCH = 230  # Actual number from vocab.json
+EMBEDDING_DIM = 128
+HIDDEN_DIM = 512  # Both models use 512
+NUM_LAYERS = 4  # Both models use 4 layers
+DROPOUT_PROB = 0.2
+SEQUENCE_LENGTH = 50
+FORECAST_HORIZON = 10
+
+# preprocess_transactions.CALENDAR_ORIGIN (2024-01-01) as days since 1970-01-01
+CALENDAR_ORIGIN_DAYS = 19723
+RAW_INPUT_NAMES = ['transaction_amount', 'transaction_balance', 'transaction_category',
+                   'transaction_merchant', 'transaction_step']
 
 # Define the model architecture to match your training
 class Encoder(nn.Module):
@@ -28,7 +46,7 @@ class Encoder(nn.Module):
             dropout=dropout
         )
 
-    def forward(self, x):
+    def embed(self, x):
         numerical_feats = x[:, :, [0,1,4,5,6,7,8,9,10,11,12,13]]
         cat_ids = x[:, :, 2].long()
         merch_ids = x[:, :, 3].long()
@@ -36,11 +54,21 @@ class Encoder(nn.Module):
         cat_embeds = self.category_embedding(cat_ids)
         merch_embeds = self.merchant_embedding(merch_ids)
 
-        lstm_input = torch.cat((numerical_feats, cat_embeds, merch_embeds), dim=2)
+        return torch.cat((numerical_feats, cat_embeds, merch_embeds), dim=2)
+
+    def forward(self, x):
+        lstm_input = self.embed(x)
 
         _, (hidden, cell) = self.lstm(lstm_input)
         return hidden, cell
 
+    def step(self, x, hidden, cell):
+        """Advance an existing (hidden, cell) state over the transactions in x."""
+        lstm_input = self.embed(x)
+
+        _, (hidden, cell) = self.lstm(lstm_input, (hidden, cell))
+        return hidden, cell
+
 class Decoder(nn.Module):
     def __init__(self, vocab_size_cat, vocab_size_merch, embedding_dim, hidden_dim, num_layers, dropout):
         super().__init__()
@@ -62,17 +90,18 @@ class Decoder(nn.Module):
         self.fc_category = nn.Linear(hidden_dim, vocab_size_cat)
         self.fc_merchant = nn.Linear(hidden_dim, vocab_size_merch)
 
-    def forward(self, x_t, hidden, cell):
-        x_t = x_t.unsqueeze(1)
-
-        numerical_feat = x_t[:, :, 0].unsqueeze(-1)
-        cat_ids = x_t[:, :, 1].long()
-        merch_ids = x_t[:, :, 2].long()
+    def embed(self, x):
+        numerical_feat = x[:, :, 0].unsqueeze(-1)
+        cat_ids = x[:, :, 1].long()
+        merch_ids = x[:, :, 2].long()
 
         cat_embeds = self.category_embedding(cat_ids)
         merch_embeds = self.merchant_embedding(merch_ids)
 
-        lstm_input = torch.cat((numerical_feat, cat_embeds, merch_embeds), dim=2)
+        return torch.cat((numerical_feat, cat_embeds, merch_embeds), dim=2)
+
+    def forward(self, x_t, hidden, cell):
+        lstm_input = self.embed(x_t.unsqueeze(1))
 
         output, (hidden, cell) = self.lstm(lstm_input, (hidden, cell))
 
@@ -82,6 +111,19 @@ class Decoder(nn.Module):
 
         return pred_amount, pred_category, pred_merchant, hidden, cell
 
+    def forward_sequence(self, x, hidden, cell):
+        """Decode all steps of x (batch, steps, 3) in one LSTM call and one matmul per head.
+
+        Equivalent to calling forward once per step with x[:, t], for inputs known up front.
+        """
+        output, (hidden, cell) = self.lstm(self.embed(x), (hidden, cell))
+
+        pred_amount = self.fc_amount(output)
+        pred_category = self.fc_category(output)
+        pred_merchant = self.fc_merchant(output)
+
+        return pred_amount, pred_category, pred_merchant, hidden, cell
+
 class Seq2Seq(nn.Module):
     def __init__(self, encoder, decoder, device):
         super().__init__()
@@ -113,92 +155,636 @@ class Seq2Seq(nn.Module):
 
         return outputs_amount, outputs_category, outputs_merchant
 
-def load_model_weights(model_path: str, model: nn.Module, device: torch.device):
-    """Load model weights from the PyTorch checkpoint."""
+    def forward_fused(self, src, trg, teacher_forcing_mask=None):
+        """Fast path for forward() when every decoder input is known up front.
+
+        Without a mask this is forward() with full teacher forcing, but the decoder runs once
+        over the whole horizon instead of once per step. teacher_forcing_mask (batch, horizon),
+        True where step t is fed the ground truth, enables parallel scheduled sampling: a first
+        no-grad pass predicts every step from teacher-forced inputs, then steps with a False
+        mask are fed the previous step's prediction from that pass instead. Unlike forward()'s
+        free-running steps, those predictions never see earlier sampled inputs.
+        """
+        hidden, cell = self.encoder(src)
+        decoder_inputs = teacher_forced_inputs(trg)
+
+        if teacher_forcing_mask is not None:
+            with torch.no_grad():
+                pred_amount, pred_category, pred_merchant, _, _ = self.decoder.forward_sequence(
+                    decoder_inputs, hidden, cell
+                )
+                predicted = torch.cat((
+                    pred_amount,
+                    pred_category.argmax(-1, keepdim=True).float(),
+                    pred_merchant.argmax(-1, keepdim=True).float(),
+                ), dim=2)
+                # The prediction for step t - 1 is the candidate input of step t
+                predicted_inputs = torch.cat((decoder_inputs[:, :1], predicted[:, :-1]), dim=1)
+
+            decoder_inputs = torch.where(teacher_forcing_mask.unsqueeze(-1), decoder_inputs, predicted_inputs)
+
+        outputs_amount, outputs_category, outputs_merchant, _, _ = self.decoder.forward_sequence(
+            decoder_inputs, hidden, cell
+        )
+        return outputs_amount, outputs_category, outputs_merchant
+
+    def predict(self, src, forecast_horizon):
+        """Greedy autoregressive forecast, feeding each prediction back as the next decoder input."""
+        self.eval()
+        batch_size = src.shape[0]
+
+        outputs_amount = torch.zeros(batch_size, forecast_horizon, 1).to(self.device)
+        outputs_category = torch.zeros(batch_size, forecast_horizon, self.decoder.vocab_size_cat).to(self.device)
+        outputs_merchant = torch.zeros(batch_size, forecast_horizon, self.decoder.vocab_size_merch).to(self.device)
+
+        with torch.no_grad():
+            hidden, cell = self.encoder(src)
+
+            decoder_input = initial_decoder_input(src)
+
+            for t in range(forecast_horizon):
+                pred_amount, pred_category, pred_merchant, hidden, cell = self.decoder(decoder_input, hidden, cell)
+
+                outputs_amount[:, t, :] = pred_amount
+                outputs_category[:, t, :] = pred_category
+                outputs_merchant[:, t, :] = pred_merchant
+
+                decoder_input = next_decoder_input(pred_amount, pred_category, pred_merchant)
+
+        return outputs_amount, outputs_category, outputs_merchant
+
+class PostprocessedSeq2Seq(nn.Module):
+    """Seq2Seq followed by the post-processing the clients otherwise do themselves.
+
+    Returns the inverse-scaled amount and the top-k softmax probabilities and IDs of
+    category and merchant for every forecast step, instead of full logits. IDs are int32,
+    so every output value is 4 bytes like the float32 logits it replaces.
+    """
+    def __init__(self, model, amount_mean, amount_scale, top_k):
+        super().__init__()
+        self.model = model
+        self.amount_mean = amount_mean
+        self.amount_scale = amount_scale
+        self.top_k = top_k
+
+    def forward(self, src, trg):
+        pred_amount, pred_category, pred_merchant = self.model(src, trg)
+
+        amount = pred_amount.squeeze(-1) * self.amount_scale + self.amount_mean
+        category_probs, category_ids = torch.softmax(pred_category, dim=-1).topk(self.top_k, dim=-1)
+        merchant_probs, merchant_ids = torch.softmax(pred_merchant, dim=-1).topk(self.top_k, dim=-1)
+
+        return amount, category_ids.int(), category_probs, merchant_ids.int(), merchant_probs
+
+class RawFeaturePreprocessor(nn.Module):
+    """In-graph version of the feature engineering in preprocess_transactions.process_raw_data.
+
+    Takes the raw columns of one user's transaction history in step order (signed amount,
+    balance before, category ID, merchant ID and integer day step >= 0) and returns the
+    scaled 14-feature encoder input of its last sequence_length transactions. Time deltas
+    and the running merchant average of those rows look back over the whole history passed
+    in, so they match the training features when it starts at the user's first transaction.
+    """
+    def __init__(self, feature_mean, feature_scale, num_categories, num_merchants,
+                 sequence_length: int = SEQUENCE_LENGTH):
+        super().__init__()
+        self.register_buffer('feature_mean', torch.as_tensor(feature_mean, dtype=torch.float32))
+        self.register_buffer('feature_scale', torch.as_tensor(feature_scale, dtype=torch.float32))
+        self.num_categories = num_categories
+        self.num_merchants = num_merchants
+        self.sequence_length = sequence_length
+
+    @staticmethod
+    def calendar(step):
+        """Day of week (Monday = 0), day of month and month of day offsets from the calendar origin."""
+        # Civil date from days since 1970-01-01 (Howard Hinnant's days_from_civil, inverted)
+        days = step + CALENDAR_ORIGIN_DAYS
+        day_of_week = (days + 3) % 7
+        shifted = days + 719468
+        era = shifted // 146097
+        day_of_era = shifted - era * 146097
+        year_of_era = (day_of_era - day_of_era // 1460 + day_of_era // 36524 - day_of_era // 146096) // 365
+        day_of_year = day_of_era - (365 * year_of_era + year_of_era // 4 - year_of_era // 100)
+        month_index = (5 * day_of_year + 2) // 153
+        day_of_month = day_of_year - (153 * month_index + 2) // 5 + 1
+        month_of_year = month_index + 3 - 12 * (month_index >= 10).long()
+        return day_of_week.float(), day_of_month.float(), month_of_year.float()
+
+    @staticmethod
+    def time_since_previous(step, history_step, same_group):
+        """step minus the step of the previous transaction in the same group, 0 for the first one."""
+        # Steps are sorted, so the previous transaction of a group has the largest earlier step
+        previous_step = (same_group * history_step.unsqueeze(1)).amax(dim=-1)
+        return torch.where(same_group.sum(dim=-1) > 0, step - previous_step, torch.zeros_like(step))
+
+    def forward(self, amount, balance_before, category_id, merchant_id, step):
+        # Clamped as floats: opset 11 has no integer Clip
+        category_id = category_id.float().clamp(0, self.num_categories - 1)
+        merchant_id = merchant_id.float().clamp(0, self.num_merchants - 1)
+        history_step = step.float()
+
+        # Only the last sequence_length rows are encoded, each compared with the whole history,
+        # so the cost grows linearly with the history length
+        window = slice(-self.sequence_length, None)
+        positions = torch.arange(step.shape[1], device=step.device)
+        # earlier[i, j]: history transaction j comes before window transaction i
+        earlier = (positions[window].unsqueeze(1) > positions.unsqueeze(0)).float()
+        same_category = (category_id[:, window].unsqueeze(2) == category_id.unsqueeze(1)).float() * earlier
+        same_merchant = (merchant_id[:, window].unsqueeze(2) == merchant_id.unsqueeze(1)).float() * earlier
+
+        step_days = history_step[:, window]
+        time_delta = torch.cat([torch.zeros_like(history_step[:, :1]),
+                                history_step[:, 1:] - history_step[:, :-1]], dim=1)[:, window]
+        time_delta_category = self.time_since_previous(step_days, history_step, same_category)
+        time_delta_merchant = self.time_since_previous(step_days, history_step, same_merchant)
+        avg_amount_merchant = ((same_merchant * amount.unsqueeze(1)).sum(dim=-1)
+                               / same_merchant.sum(dim=-1).clamp(min=1))
+
+        day_of_week, day_of_month, month_of_year = self.calendar(step[:, window])
+        amount = amount[:, window]
+
+        # NUMERICAL_FEATURES order of preprocess_transactions
+        numerical = torch.stack([
+            amount, balance_before[:, window], time_delta,
+            time_delta_category, time_delta_merchant, avg_amount_merchant,
+            torch.sin(2 * np.pi * day_of_week / 7), torch.cos(2 * np.pi * day_of_week / 7),
+            torch.sin(2 * np.pi * day_of_month / 31), torch.cos(2 * np.pi * day_of_month / 31),
+            torch.sin(2 * np.pi * month_of_year / 12), torch.cos(2 * np.pi * month_of_year / 12),
+        ], dim=-1)
+        numerical = (numerical - self.feature_mean) / self.feature_scale
+
+        return torch.cat([
+            numerical[:, :, :2],
+            category_id[:, window].unsqueeze(-1),
+            merchant_id[:, window].unsqueeze(-1),
+            numerical[:, :, 2:],
+        ], dim=-1)
+
+class RawInputSeq2Seq(nn.Module):
+    """Runs RawFeaturePreprocessor in front of a (possibly post-processed) Seq2Seq."""
+    def __init__(self, preprocessor, model):
+        super().__init__()
+        self.preprocessor = preprocessor
+        self.model = model
+
+    def forward(self, amount, balance_before, category_id, merchant_id, step, trg):
+        src = self.preprocessor(amount, balance_before, category_id, merchant_id, step)
+        return self.model(src, trg)
+
+def initial_decoder_input(src):
+    """Decoder input for the first forecast step: amount, category and merchant of the last known transaction."""
+    return torch.stack([src[:, -1, 0], src[:, -1, 2], src[:, -1, 3]], dim=1)
+
+def teacher_forced_inputs(trg):
+    """Decoder inputs of every step under full teacher forcing, as fed by forward():
+    trg[:, 0] for the first two steps, then trg[:, t - 1] for step t."""
+    trg = trg[:, :, :3]
+    return torch.cat((trg[:, :1], trg[:, :-1]), dim=1)
+
+def scheduled_sampling_mask(batch_size, forecast_horizon, teacher_forcing_ratio, device=None):
+    """Per-sample, per-step teacher forcing decisions for Seq2Seq.forward_fused."""
+    return torch.rand(batch_size, forecast_horizon, device=device) < teacher_forcing_ratio
+
+def next_decoder_input(pred_amount, pred_category, pred_merchant):
+    """Decoder input for the next step built from the current prediction (greedy argmax)."""
+    top_category_id = pred_category.argmax(1).float()
+    top_merchant_id = pred_merchant.argmax(1).float()
+    return torch.cat((pred_amount, top_category_id.unsqueeze(1), top_merchant_id.unsqueeze(1)), dim=1)
+
+def build_model(device: torch.device = torch.device('cpu'), embedding_dim: int = EMBEDDING_DIM,
+                hidden_dim: int = HIDDEN_DIM, num_layers: int = NUM_LAYERS,
+                vocab_size_cat: int = VOCAB_SIZE_CAT, vocab_size_merch: int = VOCAB_SIZE_MERCH):
+    """Create an untrained Seq2Seq model; the defaults are the Fin-O architecture."""
+    encoder = Encoder(vocab_size_cat, vocab_size_merch, embedding_dim, hidden_dim, num_layers, DROPOUT_PROB)
+    decoder = Decoder(vocab_size_cat, vocab_size_merch, embedding_dim, hidden_dim, num_layers, DROPOUT_PROB)
+    return Seq2Seq(encoder, decoder, device).to(device)
+
+def checkpoint_architecture(state_dict):
+    """build_model keyword arguments matching the shapes of a Seq2Seq state dict."""
+    return {
+        'embedding_dim': state_dict['encoder.category_embedding.weight'].shape[1],
+        'hidden_dim': state_dict['encoder.lstm.weight_hh_l0'].shape[1],
+        'num_layers': sum(1 for key in state_dict if key.startswith('encoder.lstm.weight_ih_l')),
+        'vocab_size_cat': state_dict['encoder.category_embedding.weight'].shape[0],
+        'vocab_size_merch': state_dict['encoder.merchant_embedding.weight'].shape[0],
+    }
+
+def dummy_raw_transactions(batch_size: int = 1, sequence_length: int = SEQUENCE_LENGTH,
+                           vocab_size_cat: int = VOCAB_SIZE_CAT, vocab_size_merch: int = VOCAB_SIZE_MERCH):
+    """Random raw transaction columns in step order, in RawFeaturePreprocessor argument order."""
+    return (
+        torch.randn(batch_size, sequence_length) * 100,
+        torch.randn(batch_size, sequence_length) * 5000,
+        torch.randint(0, vocab_size_cat, (batch_size, sequence_length)),
+        torch.randint(0, vocab_size_merch, (batch_size, sequence_length)),
+        torch.randint(0, 730, (batch_size, sequence_length)).sort(dim=1).values,
+    )
+
+def dummy_sequence(batch_size: int = 1, sequence_length: int = SEQUENCE_LENGTH,
+                   vocab_size_cat: int = VOCAB_SIZE_CAT, vocab_size_merch: int = VOCAB_SIZE_MERCH):
+    """Random encoder input with category and merchant IDs in valid ranges."""
+    dummy_input = torch.randn(batch_size, sequence_length, 14)
+    dummy_input[:, :, 2] = torch.randint(0, vocab_size_cat, (batch_size, sequence_length))  # category_id
+    dummy_input[:, :, 3] = torch.randint(0, vocab_size_merch, (batch_size, sequence_length))  # merchant_id
+    return dummy_input
+
+def vocab_sizes(model):
+    """Category and merchant vocab sizes of a Seq2Seq model, as dummy input keyword arguments."""
+    return {'vocab_size_cat': model.decoder.vocab_size_cat, 'vocab_size_merch': model.decoder.vocab_size_merch}
+
+def load_checkpoint(model_path: str, device: torch.device):
+    """(state dict, build_model arguments) of a checkpoint, or (None, None) if it cannot be read.
+
+    Files in the mapped tensor format (checkpoint_format.py) are loaded zero-copy and carry
+    their architecture in the header; torch.save checkpoints are inferred from tensor shapes.
+    """
     try:
         if os.path.exists(model_path):
+            if is_tensor_file(model_path):
+                state_dict, metadata = load_tensor_file(model_path)
+                return state_dict, hyperparameters(metadata)
+            
             # Try loading as state dict
             checkpoint = torch.load(model_path, map_location=device)
             if isinstance(checkpoint, dict) and 'state_dict' in checkpoint:
-                model.load_state_dict(checkpoint['state_dict'])
-            else:
-                model.load_state_dict(checkpoint)
-            print(f"✅ Loaded model weights from {model_path}")
-            return True
+                checkpoint = checkpoint['state_dict']
+            return checkpoint, checkpoint_architecture(checkpoint)
         else:
             print(f"❌ Model file not found: {model_path}")
-            return False
+            return None, None
     except Exception as e:
         print(f"❌ Error loading model: {e}")
-        return False
+        return None, None
 
-def convert_model_to_onnx(model_path: str, model_type: str, output_dir: str):
-    """Convert PyTorch model to ONNX format."""
-    
-    # Model configuration - CORRECTED to match actual trained model
-    VOCAB_SIZE_CAT = 41  # Actual number from vocab.json
-    VOCAB_SIZE_MERCH = 230  # Actual number from vocab.json
-    EMBEDDING_DIM = 128
-    HIDDEN_DIM = 512  # Both models use 512
-    NUM_LAYERS = 4  # Both models use 4 layers
-    DROPOUT_PROB = 0.2
-    SEQUENCE_LENGTH = 50
-    FORECAST_HORIZON = 10
-    
-    device = torch.device('cpu')
-    
-    # Create model architecture
-    encoder = Encoder(VOCAB_SIZE_CAT, VOCAB_SIZE_MERCH, EMBEDDING_DIM, HIDDEN_DIM, NUM_LAYERS, DROPOUT_PROB)
-    decoder = Decoder(VOCAB_SIZE_CAT, VOCAB_SIZE_MERCH, EMBEDDING_DIM, HIDDEN_DIM, NUM_LAYERS, DROPOUT_PROB)
-    model = Seq2Seq(encoder, decoder, device)
-    
-    # Load trained weights
-    weights_loaded = load_model_weights(model_path, model, device)
+@contextmanager
+def skip_parameter_init():
+    """Turn the torch.nn.init functions used by the Fin-O layers into no-ops."""
+    names = ['normal_', 'uniform_', 'kaiming_uniform_']
+    originals = {name: getattr(nn.init, name) for name in names}
+    try:
+        for name in names:
+            setattr(nn.init, name, lambda tensor, *args, **kwargs: tensor)
+        yield
+    finally:
+        for name, function in originals.items():
+            setattr(nn.init, name, function)
+
+def model_from_state_dict(state_dict, architecture: dict, device: torch.device):
+    """Seq2Seq that uses the state dict's tensors as its parameters, without allocating or initializing others."""
+    # Random initialization would be thrown away (and normal_ on meta tensors imports torch._dynamo)
+    with torch.device('meta'), skip_parameter_init():
+        model = build_model(torch.device('meta'), **architecture)
+    model.load_state_dict(state_dict, assign=True)
+    model.device = device
+    return model.to(device)
+
+def load_model(model_path: str, device: torch.device):
+    """Build a Fin-O model shaped like the checkpoint, load its weights if available and switch to eval mode.
+
+    Checkpoints with other dimensions than the Fin-O defaults (e.g. distilled students)
+    get a matching architecture.
+    """
+    state_dict, architecture = load_checkpoint(model_path, device)
     
-    if not weights_loaded:
+    if state_dict is None:
         print("⚠️  Using random weights for ONNX export")
+        model = build_model(device)
+    else:
+        model = model_from_state_dict(state_dict, architecture, device)
+        print(f"✅ Loaded model weights from {model_path}")
     
     model.eval()
+    return model
+
+def convert_model_to_onnx(model_path: str, model_type: str, output_dir: str, top_k: int = None,
+                          scaler_path: str = 'model/scaler.pkl', raw_inputs: bool = False,
+                          vocab_path: str = 'model/vocab.json'):
+    """Convert PyTorch model to ONNX format.
+
+    With top_k, the graph ends in softmax, top-k and amount inverse scaling (see
+    PostprocessedSeq2Seq) instead of returning raw logits. With raw_inputs, it takes the
+    raw transaction columns of each user's full history (RAW_INPUT_NAMES) instead of the
+    14-feature input and is written to fin-o-{type}-raw.onnx, next to the feature-input graph.
+    """
     
-    # Create dummy input for ONNX export with valid indices
-    dummy_input = torch.randn(1, SEQUENCE_LENGTH, 14)  # batch_size=1, seq_len=50, features=14
+    device = torch.device('cpu')
     
-    # Set category and merchant IDs to valid ranges
-    dummy_input[:, :, 2] = torch.randint(0, VOCAB_SIZE_CAT, (1, SEQUENCE_LENGTH))  # category_id
-    dummy_input[:, :, 3] = torch.randint(0, VOCAB_SIZE_MERCH, (1, SEQUENCE_LENGTH))  # merchant_id
+    # Create model architecture and load trained weights
+    model = load_model(model_path, device)
+    vocab = vocab_sizes(model)
+    
+    if top_k is not None:
+        amount_mean, amount_scale = load_amount_scaler(scaler_path)
+        model = PostprocessedSeq2Seq(model, amount_mean, amount_scale, top_k).eval()
+        output_names = ['amount', 'category_topk_ids', 'category_topk_probs',
+                        'merchant_topk_ids', 'merchant_topk_probs']
+    else:
+        output_names = ['amount_output', 'category_output', 'merchant_output']
+    
+    if raw_inputs:
+        preprocessor = load_raw_feature_preprocessor(scaler_path, vocab_path, **vocab)
+        model = RawInputSeq2Seq(preprocessor, model).eval()
+        # A history longer than the encoder window, so the graph keeps its last rows
+        dummy_inputs = dummy_raw_transactions(1, 2 * SEQUENCE_LENGTH, **vocab)
+        input_names = RAW_INPUT_NAMES
+        input_axes = {name: {0: 'batch_size', 1: 'history_length'} for name in RAW_INPUT_NAMES}
+    else:
+        # Create dummy input for ONNX export with valid indices
+        dummy_inputs = (dummy_sequence(**vocab),)  # batch_size=1, seq_len=50, features=14
+        input_names = ['input']
+        input_axes = {'input': {0: 'batch_size'}}
     
     dummy_target = torch.randn(1, FORECAST_HORIZON, 4)  # batch_size=1, forecast_horizon=10, features=4
     
     # Set target category and merchant IDs to valid ranges
-    dummy_target[:, :, 1] = torch.randint(0, VOCAB_SIZE_CAT, (1, FORECAST_HORIZON))  # category_id
-    dummy_target[:, :, 2] = torch.randint(0, VOCAB_SIZE_MERCH, (1, FORECAST_HORIZON))  # merchant_id
+    dummy_target[:, :, 1] = torch.randint(0, vocab['vocab_size_cat'], (1, FORECAST_HORIZON))  # category_id
+    dummy_target[:, :, 2] = torch.randint(0, vocab['vocab_size_merch'], (1, FORECAST_HORIZON))  # merchant_id
     
-    # Export to ONNX
-    output_path = Path(output_dir) / f"fin-o-{model_type}.onnx"
+    # Export to ONNX; raw-input graphs take different inputs, so they get their own file
+    suffix = '-raw' if raw_inputs else ''
+    output_path = Path(output_dir) / f"fin-o-{model_type}{suffix}.onnx"
     
     print(f"🔄 Exporting model to {output_path}...")
     
     torch.onnx.export(
         model,
-        (dummy_input, dummy_target),
+        (*dummy_inputs, dummy_target),
         output_path,
         export_params=True,
         opset_version=11,
+        dynamo=False,
         do_constant_folding=True,
-        input_names=['input', 'target'],
-        output_names=['amount_output', 'category_output', 'merchant_output'],
+        input_names=input_names + ['target'],
+        output_names=output_names,
         dynamic_axes={
-            'input': {0: 'batch_size'},
+            **input_axes,
             'target': {0: 'batch_size'},
+            **{name: {0: 'batch_size'} for name in output_names}
+        }
+    )
+    
+    batch = 2
+    if raw_inputs:
+        feeds = dict(zip(input_names, (column.numpy()
+                                       for column in dummy_raw_transactions(batch, 3 * SEQUENCE_LENGTH, **vocab))))
+    else:
+        feeds = {'input': dummy_sequence(batch, **vocab).numpy()}
+    feeds['target'] = np.zeros((batch, FORECAST_HORIZON, 4), dtype=np.float32)
+    check_dynamic_batch(output_path, feeds, batch)
+    
+    print(f"✅ Model exported to {output_path}")
+    if top_k is not None:
+        logits_per_step = 1 + vocab['vocab_size_cat'] + vocab['vocab_size_merch']
+        outputs_per_step = 1 + 4 * top_k
+        print(f"   Post-processed outputs: {4 * outputs_per_step} bytes per step instead of {4 * logits_per_step} "
+              f"({logits_per_step / outputs_per_step:.0f}x less to transfer)")
+    return output_path
+
+def check_dynamic_batch(model_path, feeds: dict, batch_size: int):
+    """Run an exported graph in ONNX Runtime on a batch of batch_size; raises if its batch axis is not dynamic."""
+    import onnxruntime as ort
+    
+    session = ort.InferenceSession(str(model_path), providers=['CPUExecutionProvider'])
+    try:
+        outputs = session.run(None, feeds)
+    except Exception as e:
+        raise RuntimeError(f"{model_path} does not run at batch size {batch_size}: {e}") from e
+    if any(output.shape[0] != batch_size for output in outputs):
+        raise RuntimeError(f"{model_path} returned outputs of shapes {[output.shape for output in outputs]} "
+                           f"for a batch of {batch_size}")
+
+def convert_split_model_to_onnx(model_path: str, model_type: str, output_dir: str):
+    """Export the encoder and a single decoder step as two separate ONNX graphs.
+
+    Unlike the unrolled teacher-forced graph, callers can run the encoder once,
+    keep its (hidden, cell) state and run only as many decoder steps as they need,
+    feeding real predictions back in between steps.
+    """
+    
+    device = torch.device('cpu')
+    model = load_model(model_path, device)
+    
+    dummy_input = dummy_sequence(**vocab_sizes(model))  # batch_size=1, seq_len=50, features=14
+    
+    # Export encoder: input -> (hidden, cell)
+    encoder_path = Path(output_dir) / f"fin-o-{model_type}-encoder.onnx"
+    
+    print(f"🔄 Exporting encoder to {encoder_path}...")
+    
+    torch.onnx.export(
+        model.encoder,
+        (dummy_input,),
+        encoder_path,
+        export_params=True,
+        opset_version=11,
+        dynamo=False,
+        do_constant_folding=True,
+        input_names=['input'],
+        output_names=['hidden', 'cell'],
+        dynamic_axes={
+            'input': {0: 'batch_size', 1: 'sequence_length'},
+            'hidden': {1: 'batch_size'},
+            'cell': {1: 'batch_size'}
+        }
+    )
+    
+    print(f"✅ Encoder exported to {encoder_path}")
+    
+    # Export one decoder step: (x_t, hidden, cell) -> (amount, category, merchant, hidden', cell')
+    with torch.no_grad():
+        dummy_hidden, dummy_cell = model.encoder(dummy_input)
+    dummy_step_input = initial_decoder_input(dummy_input)  # batch_size=1, features=3
+    
+    decoder_path = Path(output_dir) / f"fin-o-{model_type}-decoder-step.onnx"
+    
+    print(f"🔄 Exporting decoder step to {decoder_path}...")
+    
+    torch.onnx.export(
+        model.decoder,
+        (dummy_step_input, dummy_hidden, dummy_cell),
+        decoder_path,
+        export_params=True,
+        opset_version=11,
+        dynamo=False,
+        do_constant_folding=True,
+        input_names=['x_t', 'hidden', 'cell'],
+        output_names=['amount_output', 'category_output', 'merchant_output', 'hidden_out', 'cell_out'],
+        dynamic_axes={
+            'x_t': {0: 'batch_size'},
+            'hidden': {1: 'batch_size'},
+            'cell': {1: 'batch_size'},
             'amount_output': {0: 'batch_size'},
             'category_output': {0: 'batch_size'},
-            'merchant_output': {0: 'batch_size'}
+            'merchant_output': {0: 'batch_size'},
+            'hidden_out': {1: 'batch_size'},
+            'cell_out': {1: 'batch_size'}
         }
     )
     
-    print(f"✅ Model exported to {output_path}")
+    print(f"✅ Decoder step exported to {decoder_path}")
+    return encoder_path, decoder_path
+
+def export_to_onnx_model(module: nn.Module, args, input_names, output_names, dynamic_axes):
+    """torch.onnx.export into memory; returns the onnx.ModelProto."""
+    import io
+    import onnx
+    
+    buffer = io.BytesIO()
+    torch.onnx.export(
+        module,
+        args,
+        buffer,
+        export_params=True,
+        opset_version=11,
+        dynamo=False,
+        do_constant_folding=True,
+        input_names=input_names,
+        output_names=output_names,
+        dynamic_axes=dynamic_axes
+    )
+    return onnx.load_from_string(buffer.getvalue())
+
+def convert_loop_model_to_onnx(model_path: str, model_type: str, output_dir: str):
+    """Export greedy decoding (Seq2Seq.predict) as one graph with a runtime forecast horizon.
+
+    The encoder graph is followed by an ONNX Loop over the single-step decoder graph that
+    feeds each step's amount and argmax category/merchant back in, so the graph takes
+    input and an int64 scalar horizon and only runs that many decoder steps. The horizon
+    must be at least 1: a Loop without iterations returns empty scan outputs without a batch dim.
+    """
+    import onnx
+    from onnx import TensorProto, compose, helper
+    
+    device = torch.device('cpu')
+    model = load_model(model_path, device)
+    
+    dummy_input = dummy_sequence(**vocab_sizes(model))
+    with torch.no_grad():
+        dummy_hidden, dummy_cell = model.encoder(dummy_input)
+    
+    encoder = compose.add_prefix(export_to_onnx_model(
+        model.encoder, (dummy_input,), ['input'], ['hidden', 'cell'],
+        {'input': {0: 'batch_size', 1: 'sequence_length'}, 'hidden': {1: 'batch_size'}, 'cell': {1: 'batch_size'}}
+    ), 'encoder/')
+    decoder = compose.add_prefix(export_to_onnx_model(
+        model.decoder, (initial_decoder_input(dummy_input), dummy_hidden, dummy_cell),
+        ['x_t', 'hidden', 'cell'],
+        ['amount_output', 'category_output', 'merchant_output', 'hidden_out', 'cell_out'],
+        {**{name: {0: 'batch_size'} for name in ['x_t', 'amount_output', 'category_output', 'merchant_output']},
+         **{name: {1: 'batch_size'} for name in ['hidden', 'cell', 'hidden_out', 'cell_out']}}
+    ), 'decoder/')
+    
+    # Loop body: (iteration, condition, x_t, hidden, cell) -> (condition, x_t', hidden', cell', step outputs)
+    feedback_nodes = [
+        helper.make_node('ArgMax', ['decoder/category_output'], ['loop/category_id'], axis=1, keepdims=1),
+        helper.make_node('ArgMax', ['decoder/merchant_output'], ['loop/merchant_id'], axis=1, keepdims=1),
+        helper.make_node('Cast', ['loop/category_id'], ['loop/category_input'], to=TensorProto.FLOAT),
+        helper.make_node('Cast', ['loop/merchant_id'], ['loop/merchant_input'], to=TensorProto.FLOAT),
+        helper.make_node('Concat', ['decoder/amount_output', 'loop/category_input', 'loop/merchant_input'],
+                         ['loop/x_next'], axis=1),
+        helper.make_node('Identity', ['loop/condition'], ['loop/condition_out']),
+    ]
+    decoder_inputs = {value.name: value for value in decoder.graph.input}
+    decoder_outputs = {value.name: value for value in decoder.graph.output}
+    body = helper.make_graph(
+        list(decoder.graph.node) + feedback_nodes,
+        'decoder_step',
+        [
+            helper.make_tensor_value_info('loop/iteration', TensorProto.INT64, []),
+            helper.make_tensor_value_info('loop/condition', TensorProto.BOOL, []),
+            decoder_inputs['decoder/x_t'],
+            decoder_inputs['decoder/hidden'],
+            decoder_inputs['decoder/cell'],
+        ],
+        [
+            helper.make_tensor_value_info('loop/condition_out', TensorProto.BOOL, []),
+            helper.make_tensor_value_info('loop/x_next', TensorProto.FLOAT, ['batch_size', 3]),
+            decoder_outputs['decoder/hidden_out'],
+            decoder_outputs['decoder/cell_out'],
+            decoder_outputs['decoder/amount_output'],
+            decoder_outputs['decoder/category_output'],
+            decoder_outputs['decoder/merchant_output'],
+        ]
+    )
+    
+    nodes = [
+        helper.make_node('Identity', ['input'], ['encoder/input']),
+        *encoder.graph.node,
+        # Amount, category and merchant of the last known transaction (initial_decoder_input)
+        helper.make_node('Gather', ['input', 'last_position'], ['last_transaction'], axis=1),
+        helper.make_node('Gather', ['last_transaction', 'decoder_input_features'], ['initial_x_t'], axis=1),
+        helper.make_node(
+            'Loop', ['horizon', '', 'initial_x_t', 'encoder/hidden', 'encoder/cell'],
+            ['final_x_t', 'final_hidden', 'final_cell', 'steps_amount', 'steps_category', 'steps_merchant'],
+            body=body
+        ),
+        # Loop stacks step outputs on a new leading axis: (horizon, batch, ...) -> (batch, horizon, ...)
+        helper.make_node('Transpose', ['steps_amount'], ['amount_output'], perm=[1, 0, 2]),
+        helper.make_node('Transpose', ['steps_category'], ['category_output'], perm=[1, 0, 2]),
+        helper.make_node('Transpose', ['steps_merchant'], ['merchant_output'], perm=[1, 0, 2]),
+    ]
+    
+    # The decoder weights live in the outer graph; the loop body reads them from outer scope
+    initializers = [
+        *encoder.graph.initializer,
+        *decoder.graph.initializer,
+        helper.make_tensor('last_position', TensorProto.INT64, [], [-1]),
+        helper.make_tensor('decoder_input_features', TensorProto.INT64, [3], [0, 2, 3]),
+    ]
+    
+    graph = helper.make_graph(
+        nodes,
+        'fin_o_loop',
+        [
+            helper.make_tensor_value_info('input', TensorProto.FLOAT, ['batch_size', 'sequence_length', 14]),
+            helper.make_tensor_value_info('horizon', TensorProto.INT64, []),
+        ],
+        [
+            helper.make_tensor_value_info('amount_output', TensorProto.FLOAT, ['batch_size', 'horizon', 1]),
+            helper.make_tensor_value_info('category_output', TensorProto.FLOAT,
+                                          ['batch_size', 'horizon', model.decoder.vocab_size_cat]),
+            helper.make_tensor_value_info('merchant_output', TensorProto.FLOAT,
+                                          ['batch_size', 'horizon', model.decoder.vocab_size_merch]),
+        ],
+        initializers
+    )
+    loop_model = helper.make_model(graph, opset_imports=list(encoder.opset_import),
+                                   producer_name='fin-o')
+    loop_model.ir_version = encoder.ir_version
+    onnx.checker.check_model(loop_model)
+    
+    output_path = Path(output_dir) / f"fin-o-{model_type}-loop.onnx"
+    print(f"🔄 Exporting greedy decoding loop to {output_path}...")
+    onnx.save(loop_model, str(output_path))
+    
+    print(f"✅ Loop model exported to {output_path}")
     return output_path
 
+def load_amount_scaler(scaler_path: str):
+    """Mean and scale of the amount column of the StandardScaler in scaler_path."""
+    if not Path(scaler_path).exists():
+        print(f"⚠️  Scaler file {scaler_path} not found, amounts will stay scaled")
+        return 0.0, 1.0
+    
+    with open(scaler_path, 'rb') as f:
+        scaler = pickle.load(f)
+    
+    # amount is the first of the scaled numerical features
+    return float(scaler.mean_[0]), float(scaler.scale_[0])
+
+def load_raw_feature_preprocessor(scaler_path: str, vocab_path: str, vocab_size_cat: int = VOCAB_SIZE_CAT,
+                                  vocab_size_merch: int = VOCAB_SIZE_MERCH):
+    """RawFeaturePreprocessor with the StandardScaler from scaler_path and vocab sizes from vocab_path."""
+    with open(scaler_path, 'rb') as f:
+        scaler = pickle.load(f)
+    with open(vocab_path) as f:
+        vocab = json.load(f)
+    
+    # IDs beyond the model's embeddings are clamped like in the TypeScript client
+    num_categories = min(len(vocab['categories']), vocab_size_cat)
+    num_merchants = min(len(vocab['merchants']), vocab_size_merch)
+    return RawFeaturePreprocessor(scaler.mean_, scaler.scale_, num_categories, num_merchants).eval()
+
 def create_scaler_json(scaler_path: str, output_dir: str):
     """Convert pickle scaler to JSON format."""
     if Path(scaler_path).exists():
@@ -258,9 +844,39 @@ def main():
                        help='Path to the vocab.json file')
     parser.add_argument('--output-dir', type=str, default='public/model',
                        help='Output directory for ONNX model and JSON files')
+    parser.add_argument('--export-mode', choices=['full', 'split', 'raw', 'loop'], default='full',
+                       help='full: one unrolled teacher-forced graph; '
+                            'split: separate encoder and single-step decoder graphs; '
+                            'raw: full graph that computes the input features from raw transaction histories (fin-o-<type>-raw.onnx); '
+                            'loop: greedy decoding graph with a runtime horizon input')
+    parser.add_argument('--postprocess-top-k', type=int, default=None, metavar='K',
+                       help='End the full graph in softmax, top-K category/merchant IDs and probabilities '
+                            'and inverse-scaled amounts (from --scaler-path) instead of raw logits')
+    parser.add_argument('--quantize', choices=['dynamic', 'static'], default=None,
+                       help='Also write an INT8 model (fin-o-{type}-int8.onnx) with a comparison report')
+    parser.add_argument('--calibration-data', type=str, default='processed_data',
+                       help='Directory with sequences_X.npy / sequences_y.npy for calibration and evaluation')
+    parser.add_argument('--calibration-samples', type=int, default=512,
+                       help='Number of sequences used to calibrate static quantization')
+    parser.add_argument('--eval-samples', type=int, default=2048,
+                       help='Number of held-out sequences used to compare fp32 and INT8 accuracy')
+    parser.add_argument('--optimize', action='store_true',
+                       help='Also write offline-optimized .onnx, .ort and fp16-weight artifacts with a manifest')
+    parser.add_argument('--optimization-level', choices=['basic', 'extended', 'all'], default='extended',
+                       help='ONNX Runtime graph optimization level applied offline')
+    parser.add_argument('--external-data', action='store_true',
+                       help='Store the weights of the optimized and fp16 artifacts as external data')
     
     args = parser.parse_args()
     
+    if args.quantize and args.export_mode != 'full':
+        parser.error('--quantize is only supported with --export-mode full')
+    if args.postprocess_top_k is not None:
+        if args.export_mode in ('split', 'loop'):
+            parser.error('--postprocess-top-k is only supported with --export-mode full or raw')
+        if args.quantize:
+            parser.error('--quantize compares raw logits and cannot be combined with --postprocess-top-k')
+    
     # Create output directory
     output_dir = Path(args.output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
@@ -268,7 +884,28 @@ def main():
     print(f"🚀 Converting Fin-O {args.model_type} model to ONNX format...")
     
     # Convert model to ONNX
-    convert_model_to_onnx(args.model_path, args.model_type, str(output_dir))
+    if args.export_mode == 'split':
+        onnx_paths = convert_split_model_to_onnx(args.model_path, args.model_type, str(output_dir))
+    elif args.export_mode == 'loop':
+        onnx_paths = [convert_loop_model_to_onnx(args.model_path, args.model_type, str(output_dir))]
+    else:
+        onnx_path = convert_model_to_onnx(args.model_path, args.model_type, str(output_dir),
+                                          args.postprocess_top_k, args.scaler_path,
+                                          args.export_mode == 'raw', args.vocab_path)
+        onnx_paths = [onnx_path]
+        
+        if args.quantize:
+            from quantize_onnx_model import quantize_and_report
+            quantize_and_report(onnx_path, args.model_type, str(output_dir), args.quantize,
+                                data_dir=args.calibration_data,
+                                calibration_samples=args.calibration_samples,
+                                eval_samples=args.eval_samples)
+    
+    if args.optimize:
+        from optimize_onnx_model import build_optimized_artifacts
+        for onnx_path in onnx_paths:
+            build_optimized_artifacts(onnx_path, level=args.optimization_level,
+                                      external_data=args.external_data)
     
     # Create scaler JSON
     create_scaler_json(args.scaler_path, str(output_dir))
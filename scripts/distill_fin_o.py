@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Knowledge distillation of a trained Fin-O Seq2Seq teacher into a smaller student.
+The student (configurable embedding dim, hidden size and layers) is trained with the
+train_fin_o.py loop on a mix of the notebook's Huber/cross-entropy targets, KL divergence
+to the teacher's temperature-softened category/merchant distributions and matching of the
+teacher's amount predictions. Both models are teacher-forced during distillation, so every
+step of the student is compared with the teacher on the same decoder inputs; validation is
+free-running as in the notebook. The best student is exported with the ONNX converter next
+to its checkpoints and its latency and accuracy are reported next to the teacher's;
+publishing it to the web app is a separate build_model_artifacts.py run.
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import onnxruntime as ort
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.optim.lr_scheduler import ReduceLROnPlateau
+
+from benchmark_inference import median_ms
+from convert_pytorch_to_onnx import (
+    FORECAST_HORIZON,
+    build_model,
+    convert_model_to_onnx,
+    dummy_sequence,
+    load_checkpoint,
+    load_model,
+    vocab_sizes,
+)
+from train_fin_o import (
+    EARLY_STOPPING_PATIENCE,
+    TrainingModel,
+    TrainingOptions,
+    add_training_arguments,
+    apply_performance_shorthands,
+    compute_loss,
+    load_datasets,
+    load_vocab_sizes,
+    notebook_forward,
+    numa_worker_init,
+    save_model,
+    train_model,
+    validate_model,
+)
+from window_dataset import batched_dataloader
+
+
+class DistillationModel(nn.Module):
+    """Teacher-forced student and frozen teacher outputs for the same batch."""
+
+    def __init__(self, student, teacher):
+        super().__init__()
+        self.student = student
+        self.teacher = teacher.requires_grad_(False)
+
+    def train(self, mode: bool = True):
+        # The teacher always runs without dropout
+        super().train(mode)
+        self.teacher.eval()
+        return self
+
+    def forward(self, src, trg):
+        with torch.no_grad():
+            teacher_outputs = self.teacher.forward_fused(src, trg)
+        return self.student.forward_fused(src, trg), teacher_outputs
+
+
+class DistillationLoss:
+    """(1 - alpha) * notebook loss + alpha * KL to the teacher + amount_weight * amount matching.
+
+    The KL terms use the notebook's category/merchant weights and are scaled by
+    temperature^2 so their gradients stay comparable across temperatures.
+    """
+
+    def __init__(self, criterion_h, criterion_ce, temperature: float = 2.0, alpha: float = 0.5,
+                 amount_weight: float = 0.5):
+        self.criterion_h = criterion_h
+        self.criterion_ce = criterion_ce
+        self.temperature = temperature
+        self.alpha = alpha
+        self.amount_weight = amount_weight
+
+    def kl_divergence(self, student_logits, teacher_logits):
+        student_log_probs = F.log_softmax(student_logits.float().flatten(0, 1) / self.temperature, dim=-1)
+        teacher_log_probs = F.log_softmax(teacher_logits.float().flatten(0, 1) / self.temperature, dim=-1)
+        kl = F.kl_div(student_log_probs, teacher_log_probs, reduction='batchmean', log_target=True)
+        return kl * self.temperature ** 2
+
+    def __call__(self, outputs, y_batch):
+        (student_amount, student_category, student_merchant), (teacher_amount, teacher_category, teacher_merchant) = outputs
+
+        hard_loss = compute_loss((student_amount, student_category, student_merchant), y_batch,
+                                 self.criterion_h, self.criterion_ce)
+        soft_loss = (self.kl_divergence(student_category, teacher_category) * 0.5
+                     + self.kl_divergence(student_merchant, teacher_merchant) * 0.4)
+        amount_loss = self.criterion_h(student_amount.float(), teacher_amount.float())
+
+        return (1 - self.alpha) * hard_loss + self.alpha * soft_loss + self.amount_weight * amount_loss
+
+
+def count_parameters(model: nn.Module) -> int:
+    return sum(p.numel() for p in model.parameters())
+
+
+def evaluate_accuracy(model, dataloader, device, options: TrainingOptions = None):
+    """Free-running top-1 category/merchant accuracy and amount MAE (scaled units) over all forecast steps."""
+    options = options or TrainingOptions()
+    model.eval()
+    correct_category = correct_merchant = 0
+    amount_error = 0.0
+    steps = 0
+    num_batches = options.num_batches(dataloader)
+
+    with torch.no_grad():
+        for i, (X_batch, y_batch) in enumerate(dataloader):
+            if i >= num_batches:
+                break
+            X_batch, y_batch = X_batch.to(device), y_batch.to(device)
+            pred_amount, pred_category, pred_merchant = notebook_forward(model, X_batch, y_batch, 0)
+
+            correct_category += (pred_category.argmax(-1) == y_batch[:, :, 1].long()).sum().item()
+            correct_merchant += (pred_merchant.argmax(-1) == y_batch[:, :, 2].long()).sum().item()
+            amount_error += (pred_amount.squeeze(-1) - y_batch[:, :, 0]).abs().sum().item()
+            steps += y_batch.shape[0] * y_batch.shape[1]
+
+    return {
+        'category_accuracy': correct_category / max(steps, 1),
+        'merchant_accuracy': correct_merchant / max(steps, 1),
+        'amount_mae': amount_error / max(steps, 1),
+    }
+
+
+def onnx_latency_ms(onnx_path: str, vocab: dict, runs: int = 50, threads: int = 1) -> float:
+    """Median single-request latency of a full Fin-O graph in ONNX Runtime; vocab as from vocab_sizes()."""
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = threads
+    session = ort.InferenceSession(str(onnx_path), sess_options=options, providers=['CPUExecutionProvider'])
+    feeds = {
+        'input': dummy_sequence(1, **vocab).numpy(),
+        'target': np.zeros((1, FORECAST_HORIZON, 4), dtype=np.float32),
+    }
+    return median_ms(lambda: session.run(None, feeds), runs)
+
+
+def compare_with_teacher(teacher, student, teacher_path: str, student_onnx_path: str, val_dataloader, device,
+                         options: TrainingOptions, runs: int):
+    """Print parameters, ONNX latency and validation accuracy of teacher and student side by side."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print("🔄 Exporting the teacher for the latency comparison...")
+        teacher_onnx_path = convert_model_to_onnx(teacher_path, 'teacher', tmp_dir)
+        teacher_latency = onnx_latency_ms(teacher_onnx_path, vocab_sizes(teacher), runs)
+    student_latency = onnx_latency_ms(student_onnx_path, vocab_sizes(student), runs)
+
+    print("🔄 Evaluating accuracy on the validation split...")
+    teacher_metrics = evaluate_accuracy(teacher, val_dataloader, device, options)
+    student_metrics = evaluate_accuracy(student, val_dataloader, device, options)
+
+    rows = [
+        ('parameters', count_parameters(teacher), count_parameters(student), '{:,}'),
+        ('latency (ms, batch 1)', teacher_latency, student_latency, '{:.2f}'),
+        ('category accuracy', teacher_metrics['category_accuracy'], student_metrics['category_accuracy'], '{:.2%}'),
+        ('merchant accuracy', teacher_metrics['merchant_accuracy'], student_metrics['merchant_accuracy'], '{:.2%}'),
+        ('amount MAE (scaled)', teacher_metrics['amount_mae'], student_metrics['amount_mae'], '{:.4f}'),
+    ]
+    print(f"📊 {'':<24}{'teacher':>14}{'student':>14}")
+    for name, teacher_value, student_value, fmt in rows:
+        print(f"   {name:<24}{fmt.format(teacher_value):>14}{fmt.format(student_value):>14}")
+    print(f"   Student is {teacher_latency / student_latency:.1f}x faster with "
+          f"{count_parameters(student) / count_parameters(teacher):.1%} of the parameters")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Distill a trained Fin-O teacher into a smaller student')
+    add_training_arguments(parser)
+    parser.set_defaults(output_dir='model/student')
+    parser.add_argument('--teacher', type=str, required=True,
+                       help='Trained Seq2Seq teacher checkpoint')
+
+    student = parser.add_argument_group('student')
+    student.add_argument('--student-embedding-dim', type=int, default=64,
+                         help='Student embedding dimension')
+    student.add_argument('--student-hidden-dim', type=int, default=256,
+                         help='Student LSTM hidden size')
+    student.add_argument('--student-layers', type=int, default=2,
+                         help='Student LSTM layers')
+    student.add_argument('--temperature', type=float, default=2.0,
+                         help='Softmax temperature of the KL terms')
+    student.add_argument('--alpha', type=float, default=0.5,
+                         help='Weight of the KL terms against the notebook loss')
+    student.add_argument('--amount-weight', type=float, default=0.5,
+                         help='Weight of matching the teacher amount predictions')
+
+    export = parser.add_argument_group('export')
+    export.add_argument('--export-type', type=str, default='small',
+                        help='Export the best student as fin-o-{type}.onnx')
+    export.add_argument('--export-dir', type=str, default=None,
+                        help='Output directory of the student ONNX model (default: --output-dir)')
+    export.add_argument('--latency-runs', type=int, default=50,
+                        help='Timed ONNX Runtime runs per model')
+
+    args = apply_performance_shorthands(parser.parse_args())
+    if args.fused_decoder:
+        parser.error('--fused-decoder is not supported: distillation always runs both models fused and teacher-forced')
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    options = TrainingOptions(args.bf16, args.accumulation_steps, args.limit_batches)
+
+    train_dataset, val_dataset = load_datasets(args.data_dir)
+    worker_init_fn = numa_worker_init if args.numa_workers else None
+    train_dataloader = batched_dataloader(train_dataset, args.batch_size, shuffle=True,
+                                          num_workers=args.num_workers, worker_init_fn=worker_init_fn)
+    val_dataloader = batched_dataloader(val_dataset, args.batch_size, shuffle=False,
+                                        num_workers=args.num_workers, worker_init_fn=worker_init_fn)
+
+    teacher = load_model(args.teacher, device)
+    teacher_vocab = vocab_sizes(teacher)
+    data_vocab = load_vocab_sizes(args.data_dir)
+    if (data_vocab['categories'], data_vocab['merchants']) != (teacher_vocab['vocab_size_cat'],
+                                                               teacher_vocab['vocab_size_merch']):
+        print(f"❌ {args.data_dir}/vocab.json has {data_vocab['categories']}/{data_vocab['merchants']} "
+              f"categories/merchants, the teacher {teacher_vocab['vocab_size_cat']}/{teacher_vocab['vocab_size_merch']}")
+        raise SystemExit(1)
+    student = build_model(device, args.student_embedding_dim, args.student_hidden_dim, args.student_layers,
+                          **teacher_vocab)
+    if args.resume:
+        student.load_state_dict(load_checkpoint(args.resume, device)[0])
+        print(f"✅ Resumed student from {args.resume}")
+
+    print(f"🚀 Distilling Fin-O teacher ({count_parameters(teacher):,} parameters) into a "
+          f"{args.student_layers}x{args.student_hidden_dim} student ({count_parameters(student):,} parameters) "
+          f"on {device}")
+    print(f"📊 Training samples: {len(train_dataset):,}, validation samples: {len(val_dataset):,}")
+
+    if args.compile:
+        student.encoder.compile()
+        student.decoder.compile()
+
+    distillation_model = DistillationModel(student, teacher)
+    validation_model = TrainingModel(student)
+
+    optimizer = torch.optim.Adam(student.parameters(), lr=args.learning_rate)
+    scheduler = ReduceLROnPlateau(optimizer, mode='min', factor=0.1, patience=2, threshold=0.01)
+    criterion_h = nn.HuberLoss()
+    criterion_ce = nn.CrossEntropyLoss()
+    loss_fn = DistillationLoss(criterion_h, criterion_ce, args.temperature, args.alpha, args.amount_weight)
+
+    best_val_loss = float('inf')
+    best_path = None
+    epochs_no_improve = 0
+
+    for epoch in range(args.epochs):
+        start = time.perf_counter()
+        avg_loss, samples = train_model(distillation_model, train_dataloader, optimizer, criterion_h, criterion_ce,
+                                        device, epoch, args.epochs, options, loss_fn=loss_fn)
+        train_time = time.perf_counter() - start
+
+        avg_val_loss = validate_model(validation_model, val_dataloader, criterion_h, criterion_ce, device, options)
+        scheduler.step(avg_val_loss)
+
+        print(f"📊 Epoch {epoch+1}/{args.epochs} -> distillation loss {avg_loss:.4f}, "
+              f"validation loss {avg_val_loss:.4f} | train {train_time:.1f}s ({samples / train_time:,.0f} samples/s)")
+        checkpoint_path = save_model(student.state_dict(), epoch, args.output_dir, args.gcs_bucket,
+                                     args.checkpoint_format)
+
+        if avg_val_loss < best_val_loss:
+            best_val_loss = avg_val_loss
+            best_path = checkpoint_path
+            epochs_no_improve = 0
+        else:
+            epochs_no_improve += 1
+            if epochs_no_improve >= EARLY_STOPPING_PATIENCE:
+                print(f"⚠️  Early stopping triggered after {epoch+1} epochs.")
+                break
+
+    print(f"✅ Distillation complete, best validation loss {best_val_loss:.4f} ({best_path})")
+
+    # The student is only published to the web app on request, never over the served model
+    export_dir = Path(args.export_dir or args.output_dir)
+    export_dir.mkdir(parents=True, exist_ok=True)
+    student_onnx_path = convert_model_to_onnx(str(best_path), args.export_type, str(export_dir))
+    best_student = load_model(str(best_path), device)
+    compare_with_teacher(teacher, best_student, args.teacher, student_onnx_path, val_dataloader, device,
+                         options, args.latency_runs)
+
+    print(f"📦 To publish the student as fin-o-{args.export_type}: python scripts/build_model_artifacts.py "
+          f"--variant {args.export_type}={best_path}")
+
+
+if __name__ == "__main__":
+    main()
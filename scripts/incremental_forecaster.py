@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Stateful incremental forecaster for Fin-O models.
+Keeps each user's encoder (hidden, cell) state and advances it by one LSTM step per
+new transaction instead of re-encoding the last SEQUENCE_LENGTH transactions.
+"""
+
+import argparse
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from convert_pytorch_to_onnx import (
+    SEQUENCE_LENGTH,
+    dummy_sequence,
+    load_model,
+    next_decoder_input,
+)
+
+
+class UserState:
+    """Encoder state of one user plus the inputs needed to forecast and re-sync."""
+
+    __slots__ = ('hidden', 'cell', 'last_input', 'window', 'num_observed')
+
+    def __init__(self, hidden, cell, last_input, window, num_observed):
+        self.hidden = hidden            # (num_layers, hidden_dim)
+        self.cell = cell                # (num_layers, hidden_dim)
+        self.last_input = last_input    # (14,) last observed transaction
+        self.window = window            # deque of the last SEQUENCE_LENGTH transactions
+        self.num_observed = num_observed
+
+
+class LRUStateStore:
+    """Bounded in-memory LRU store of UserState with optional spill to a memory-mapped file.
+
+    When the in-memory store is full, the least recently used state is written to a
+    fixed-size slot in the spill file (if configured) and dropped otherwise. Drops are
+    counted in `dropped`; the first drop caused by a full spill file prints a warning.
+    """
+
+    def __init__(self, capacity: int, num_layers: int, hidden_dim: int,
+                 spill_path: str = None, spill_capacity: int = 0,
+                 window_length: int = SEQUENCE_LENGTH, num_features: int = 14):
+        self.capacity = capacity
+        self.window_length = window_length
+        self._states = OrderedDict()
+
+        self._spill = None
+        self._spill_slots = {}
+        self._free_slots = []
+        if spill_path is not None and spill_capacity > 0:
+            # One record per slot: state, last input, window and counters
+            dtype = np.dtype([
+                ('hidden', np.float32, (num_layers, hidden_dim)),
+                ('cell', np.float32, (num_layers, hidden_dim)),
+                ('last_input', np.float32, (num_features,)),
+                ('window', np.float32, (window_length, num_features)),
+                ('window_size', np.int32),
+                ('num_observed', np.int64),
+            ])
+            Path(spill_path).parent.mkdir(parents=True, exist_ok=True)
+            self._spill = np.memmap(spill_path, dtype=dtype, mode='w+', shape=(spill_capacity,))
+            self._free_slots = list(range(spill_capacity - 1, -1, -1))
+
+        self.evictions = 0
+        self.spill_reads = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._states) + len(self._spill_slots)
+
+    def __contains__(self, user_id):
+        return user_id in self._states or user_id in self._spill_slots
+
+    def get(self, user_id):
+        """Return the state for user_id (promoting it from the spill file if needed) or None."""
+        state = self._states.get(user_id)
+        if state is not None:
+            self._states.move_to_end(user_id)
+            return state
+
+        slot = self._spill_slots.pop(user_id, None)
+        if slot is None:
+            return None
+
+        record = self._spill[slot]
+        window_size = int(record['window_size'])
+        state = UserState(
+            hidden=torch.from_numpy(np.array(record['hidden'])),
+            cell=torch.from_numpy(np.array(record['cell'])),
+            last_input=torch.from_numpy(np.array(record['last_input'])),
+            window=deque(torch.from_numpy(np.array(record['window'][:window_size])),
+                         maxlen=self.window_length),
+            num_observed=int(record['num_observed']),
+        )
+        self._free_slots.append(slot)
+        self.spill_reads += 1
+        self.put(user_id, state)
+        return state
+
+    def put(self, user_id, state: UserState):
+        # A spilled copy of this user is stale once the new state is stored
+        slot = self._spill_slots.pop(user_id, None)
+        if slot is not None:
+            self._free_slots.append(slot)
+
+        self._states[user_id] = state
+        self._states.move_to_end(user_id)
+
+        while len(self._states) > self.capacity:
+            evicted_id, evicted = self._states.popitem(last=False)
+            self.evictions += 1
+            self._spill_state(evicted_id, evicted)
+
+    def _spill_state(self, user_id, state: UserState):
+        if self._spill is None or not self._free_slots:
+            if self._spill is not None and not self.dropped:
+                print(f"⚠️  Spill file full ({len(self._spill)} states), dropping evicted user states; "
+                      f"their next observation starts from an empty state")
+            self.dropped += 1
+            return
+
+        slot = self._free_slots.pop()
+        record = self._spill[slot]
+        record['hidden'] = state.hidden.numpy()
+        record['cell'] = state.cell.numpy()
+        record['last_input'] = state.last_input.numpy()
+        window_size = len(state.window)
+        if window_size:
+            record['window'][:window_size] = torch.stack(list(state.window)).numpy()
+        record['window_size'] = window_size
+        record['num_observed'] = state.num_observed
+        self._spill[slot] = record
+        self._spill_slots[user_id] = slot
+
+
+class IncrementalForecaster:
+    """Forecast next transactions per user from an incrementally updated encoder state.
+
+    observe() advances a user's (hidden, cell) by one encoder LSTM step, so the cost per
+    event is one step instead of SEQUENCE_LENGTH. With resync_every set, every N-th
+    observation of a user re-encodes the last SEQUENCE_LENGTH transactions from scratch,
+    records how far the incremental state had drifted and replaces it with the full encoding.
+    drift_log keeps the last drift_log_size re-syncs; drift_summary() covers all of them.
+    """
+
+    def __init__(self, model, capacity: int = 100_000, spill_path: str = None,
+                 spill_capacity: int = 0, resync_every: int = None, drift_log_size: int = 10_000):
+        self.model = model.eval()
+        self.encoder = model.encoder
+        self.decoder = model.decoder
+        self.resync_every = resync_every
+
+        lstm = self.encoder.lstm
+        self.store = LRUStateStore(capacity, lstm.num_layers, lstm.hidden_size,
+                                   spill_path=spill_path, spill_capacity=spill_capacity)
+        self.drift_log = deque(maxlen=drift_log_size)
+        self.resyncs = 0
+        self.hidden_max_abs_diff_sum = 0.0
+        self.hidden_max_abs_diff_max = 0.0
+        self.hidden_rel_l2_sum = 0.0
+
+    def _zero_state(self, batch_size):
+        lstm = self.encoder.lstm
+        zeros = torch.zeros(lstm.num_layers, batch_size, lstm.hidden_size)
+        return zeros, zeros.clone()
+
+    @torch.no_grad()
+    def observe(self, user_id, txn):
+        """Advance user_id's state by one transaction (14 preprocessed features)."""
+        self.observe_batch([user_id], torch.as_tensor(txn, dtype=torch.float32).unsqueeze(0))
+
+    @torch.no_grad()
+    def observe_batch(self, user_ids, txns):
+        """Advance user states by one transaction per row, in as few LSTM calls as possible.
+
+        Distinct users share one call; a user that appears several times is advanced by each
+        of its transactions in order, one call per repeat.
+        """
+        txns = torch.as_tensor(txns, dtype=torch.float32)
+        rounds = []
+        seen = {}
+        for i, user_id in enumerate(user_ids):
+            repeat = seen.get(user_id, 0)
+            seen[user_id] = repeat + 1
+            if repeat == len(rounds):
+                rounds.append([])
+            rounds[repeat].append(i)
+
+        for rows in rounds:
+            self._observe_distinct([user_ids[i] for i in rows], txns[rows])
+
+    def _observe_distinct(self, user_ids, txns):
+        """Advance the states of distinct users by one transaction each in a single LSTM call."""
+        states = [self.store.get(user_id) for user_id in user_ids]
+
+        hidden, cell = self._zero_state(len(user_ids))
+        for i, state in enumerate(states):
+            if state is not None:
+                hidden[:, i] = state.hidden
+                cell[:, i] = state.cell
+
+        hidden, cell = self.encoder.step(txns.unsqueeze(1), hidden, cell)
+
+        for i, user_id in enumerate(user_ids):
+            state = states[i]
+            if state is None:
+                state = UserState(None, None, None, deque(maxlen=SEQUENCE_LENGTH), 0)
+            state.hidden = hidden[:, i].clone()
+            state.cell = cell[:, i].clone()
+            state.last_input = txns[i].clone()
+            state.window.append(txns[i].clone())
+            state.num_observed += 1
+
+            if self.resync_every and state.num_observed % self.resync_every == 0:
+                self._resync(user_id, state)
+
+            self.store.put(user_id, state)
+
+    def _resync(self, user_id, state: UserState):
+        """Replace the incremental state with a full re-encoding of the window and log the drift."""
+        window = torch.stack(list(state.window)).unsqueeze(0)
+        full_hidden, full_cell = self.encoder(window)
+        full_hidden, full_cell = full_hidden[:, 0], full_cell[:, 0]
+
+        entry = {
+            'user_id': user_id,
+            'num_observed': state.num_observed,
+            'hidden_max_abs_diff': float((state.hidden - full_hidden).abs().max()),
+            'cell_max_abs_diff': float((state.cell - full_cell).abs().max()),
+            'hidden_rel_l2': float((state.hidden - full_hidden).norm() / full_hidden.norm().clamp_min(1e-12)),
+        }
+        self.drift_log.append(entry)
+        self.resyncs += 1
+        self.hidden_max_abs_diff_sum += entry['hidden_max_abs_diff']
+        self.hidden_max_abs_diff_max = max(self.hidden_max_abs_diff_max, entry['hidden_max_abs_diff'])
+        self.hidden_rel_l2_sum += entry['hidden_rel_l2']
+
+        state.hidden = full_hidden.clone()
+        state.cell = full_cell.clone()
+
+    @torch.no_grad()
+    def forecast(self, user_id, horizon: int):
+        """Greedy forecast of the next `horizon` transactions; does not modify the stored state.
+
+        Returns (amount, category, merchant) with shapes (1, horizon, 1), (1, horizon, V_cat)
+        and (1, horizon, V_merch), like Seq2Seq.predict.
+        """
+        state = self.store.get(user_id)
+        if state is None:
+            raise KeyError(f"No observed transactions for user {user_id!r}")
+
+        hidden = state.hidden.unsqueeze(1)
+        cell = state.cell.unsqueeze(1)
+        decoder_input = state.last_input[[0, 2, 3]].unsqueeze(0)
+
+        outputs_amount, outputs_category, outputs_merchant = [], [], []
+        for _ in range(horizon):
+            pred_amount, pred_category, pred_merchant, hidden, cell = self.decoder(decoder_input, hidden, cell)
+
+            outputs_amount.append(pred_amount)
+            outputs_category.append(pred_category)
+            outputs_merchant.append(pred_merchant)
+
+            decoder_input = next_decoder_input(pred_amount, pred_category, pred_merchant)
+
+        return (
+            torch.stack(outputs_amount, dim=1),
+            torch.stack(outputs_category, dim=1),
+            torch.stack(outputs_merchant, dim=1),
+        )
+
+    def drift_summary(self):
+        """Aggregate the drift measured at each re-sync; the p99 is over the retained drift_log."""
+        if not self.resyncs:
+            return {}
+        rel_l2 = np.array([entry['hidden_rel_l2'] for entry in self.drift_log])
+        return {
+            'resyncs': self.resyncs,
+            'hidden_max_abs_diff_mean': self.hidden_max_abs_diff_sum / self.resyncs,
+            'hidden_max_abs_diff_max': self.hidden_max_abs_diff_max,
+            'hidden_rel_l2_mean': self.hidden_rel_l2_sum / self.resyncs,
+            'hidden_rel_l2_p99': float(np.percentile(rel_l2, 99)),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate a transaction stream with the incremental forecaster')
+    parser.add_argument('--model-path', type=str, required=True,
+                       help='Path to the PyTorch model file')
+    parser.add_argument('--num-users', type=int, default=100,
+                       help='Number of simulated users')
+    parser.add_argument('--num-events', type=int, default=2000,
+                       help='Number of simulated transactions')
+    parser.add_argument('--capacity', type=int, default=10_000,
+                       help='Maximum number of user states kept in memory')
+    parser.add_argument('--spill-path', type=str, default=None,
+                       help='Memory-mapped file for states evicted from memory')
+    parser.add_argument('--spill-capacity', type=int, default=0,
+                       help='Number of user states the spill file can hold')
+    parser.add_argument('--resync-every', type=int, default=None,
+                       help='Re-encode the full window every N observations of a user and log the drift')
+    parser.add_argument('--horizon', type=int, default=3,
+                       help='Forecast horizon used for the final forecast')
+
+    args = parser.parse_args()
+
+    model = load_model(args.model_path, torch.device('cpu'))
+    forecaster = IncrementalForecaster(model, capacity=args.capacity, spill_path=args.spill_path,
+                                       spill_capacity=args.spill_capacity, resync_every=args.resync_every)
+
+    events = dummy_sequence(1, args.num_events)[0]
+    user_ids = np.random.randint(0, args.num_users, size=args.num_events)
+
+    print(f"🚀 Streaming {args.num_events} transactions for {args.num_users} users...")
+
+    start = time.perf_counter()
+    for user_id, txn in zip(user_ids, events):
+        forecaster.observe(int(user_id), txn)
+    incremental_time = time.perf_counter() - start
+
+    # Baseline: re-encode a full SEQUENCE_LENGTH window for every event
+    window = dummy_sequence(1)
+    start = time.perf_counter()
+    with torch.no_grad():
+        for _ in range(min(args.num_events, 200)):
+            model.encoder(window)
+    full_time = (time.perf_counter() - start) / min(args.num_events, 200) * args.num_events
+
+    print(f"✅ Incremental: {incremental_time / args.num_events * 1e3:.3f} ms/event")
+    print(f"   Full {SEQUENCE_LENGTH}-step re-encode: {full_time / args.num_events * 1e3:.3f} ms/event "
+          f"({full_time / incremental_time:.1f}x slower)")
+    print(f"   States in store: {len(forecaster.store)}, evictions: {forecaster.store.evictions}, "
+          f"spill reads: {forecaster.store.spill_reads}, dropped: {forecaster.store.dropped}")
+
+    if args.resync_every:
+        print(f"📊 Drift at re-sync: {forecaster.drift_summary()}")
+
+    amount, category, merchant = forecaster.forecast(int(user_ids[-1]), args.horizon)
+    for t in range(args.horizon):
+        print(f"  - Step {t+1}: amount (scaled) {amount[0, t, 0]:.4f}, "
+              f"category {int(category[0, t].argmax())}, merchant {int(merchant[0, t].argmax())}")
+
+
+if __name__ == "__main__":
+    main()
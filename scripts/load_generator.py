@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Load generator for serve_onnx.py.
+Sends concurrent prediction requests and reports throughput and latency percentiles. With
+--compare it starts the service itself, once unbatched (--max-batch-size 1) and once with
+micro-batching, and prints both runs side by side.
+"""
+
+import argparse
+import http.client
+import json
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from convert_pytorch_to_onnx import SEQUENCE_LENGTH, VOCAB_SIZE_CAT, VOCAB_SIZE_MERCH
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float = 60):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def open_connection(host: str, port: int, unix_socket: str = None):
+    if unix_socket:
+        return UnixHTTPConnection(unix_socket)
+    return http.client.HTTPConnection(host, port, timeout=60)
+
+
+def request_json(connection, method: str, path: str, payload=None):
+    body = json.dumps(payload) if payload is not None else None
+    headers = {'Content-Type': 'application/json'} if body is not None else {}
+    connection.request(method, path, body=body, headers=headers)
+    response = connection.getresponse()
+    data = json.loads(response.read())
+    if response.status != 200:
+        raise RuntimeError(f"{method} {path} failed ({response.status}): {data.get('error')}")
+    return data
+
+
+def run_load(host: str, port: int, unix_socket: str, variant: str, concurrency: int,
+             requests_per_client: int, seed: int = 0):
+    """Run concurrency clients, each sending requests_per_client sequential requests."""
+    rng = np.random.default_rng(seed)
+    payloads = []
+    for _ in range(8):
+        model_input = rng.standard_normal((SEQUENCE_LENGTH, 14)).astype(np.float32)
+        # Category and merchant IDs have to be valid embedding indices
+        model_input[:, 2] = rng.integers(0, VOCAB_SIZE_CAT, SEQUENCE_LENGTH)
+        model_input[:, 3] = rng.integers(0, VOCAB_SIZE_MERCH, SEQUENCE_LENGTH)
+        payloads.append(json.dumps({'input': model_input.tolist()}))
+    latencies = [[] for _ in range(concurrency)]
+    errors = []
+
+    def client(index):
+        connection = open_connection(host, port, unix_socket)
+        try:
+            for i in range(requests_per_client):
+                start = time.perf_counter()
+                connection.request('POST', f'/predict/{variant}', body=payloads[(index + i) % len(payloads)],
+                                   headers={'Content-Type': 'application/json'})
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    raise RuntimeError(f"HTTP {response.status}")
+                latencies[index].append((time.perf_counter() - start) * 1e3)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    if errors:
+        raise RuntimeError(f"{len(errors)} client(s) failed, first error: {errors[0]}")
+
+    all_latencies = np.concatenate([np.asarray(l) for l in latencies])
+    return {
+        'requests': int(all_latencies.size),
+        'throughput_rps': all_latencies.size / elapsed,
+        'p50_ms': float(np.percentile(all_latencies, 50)),
+        'p99_ms': float(np.percentile(all_latencies, 99)),
+    }
+
+
+def wait_for_server(host: str, port: int, unix_socket: str, process, timeout: float = 120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            connection = open_connection(host, port, unix_socket)
+            request_json(connection, 'GET', '/metrics')
+            connection.close()
+            return
+        except (OSError, http.client.HTTPException):
+            time.sleep(0.2)
+    raise TimeoutError("Server did not start in time")
+
+
+def start_server(model_path: str, variant: str, host: str, port: int, unix_socket: str,
+                 max_batch_size: int, max_wait_ms: float, intra_op_threads: int):
+    command = [
+        sys.executable, str(Path(__file__).with_name('serve_onnx.py')),
+        '--model', f'{variant}={model_path}',
+        '--max-batch-size', str(max_batch_size),
+        '--max-wait-ms', str(max_wait_ms),
+        '--intra-op-threads', str(intra_op_threads),
+    ]
+    if unix_socket:
+        command += ['--unix-socket', unix_socket]
+    else:
+        command += ['--host', host, '--port', str(port)]
+
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    try:
+        wait_for_server(host, port, unix_socket, process)
+    except Exception:
+        process.kill()
+        raise
+    return process
+
+
+def print_result(label: str, result: dict):
+    print(f"   {label:<14} {result['throughput_rps']:9.1f} req/s  "
+          f"p50 {result['p50_ms']:8.1f} ms  p99 {result['p99_ms']:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load generator for the Fin-O scoring service')
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                       help='Service host')
+    parser.add_argument('--port', type=int, default=8000,
+                       help='Service port')
+    parser.add_argument('--unix-socket', type=str, default=None,
+                       help='Connect over this Unix socket instead of TCP')
+    parser.add_argument('--variant', type=str, default='small',
+                       help='Model variant to request')
+    parser.add_argument('--concurrency', type=int, default=32,
+                       help='Number of concurrent clients')
+    parser.add_argument('--requests', type=int, default=50,
+                       help='Requests sent by each client')
+    parser.add_argument('--compare', type=str, default=None, metavar='MODEL_PATH',
+                       help='Start serve_onnx.py with this model, unbatched and batched, and compare')
+    parser.add_argument('--max-batch-size', type=int, default=64,
+                       help='Max batch size of the batched run in --compare mode')
+    parser.add_argument('--max-wait-ms', type=float, default=2.0,
+                       help='Max wait of the batched run in --compare mode')
+    parser.add_argument('--intra-op-threads', type=int, default=0,
+                       help='ONNX Runtime intra-op threads of the servers started in --compare mode')
+
+    args = parser.parse_args()
+
+    print(f"🚀 {args.concurrency} clients x {args.requests} requests against '{args.variant}'")
+
+    if not args.compare:
+        connection = open_connection(args.host, args.port, args.unix_socket)
+        request_json(connection, 'GET', '/metrics')
+        connection.close()
+
+        result = run_load(args.host, args.port, args.unix_socket, args.variant,
+                          args.concurrency, args.requests)
+        print_result('current', result)
+
+        connection = open_connection(args.host, args.port, args.unix_socket)
+        metrics = request_json(connection, 'GET', '/metrics')[args.variant]
+        connection.close()
+        print(f"📊 Mean batch size {metrics['batch_size']['mean']:.1f}, "
+              f"mean queue depth {metrics['queue_depth']['mean']:.1f}")
+        return
+
+    results = {}
+    for label, max_batch_size in [('unbatched', 1), (f'batched ({args.max_batch_size})', args.max_batch_size)]:
+        print(f"🔄 Starting server with --max-batch-size {max_batch_size}...")
+        process = start_server(args.compare, args.variant, args.host, args.port, args.unix_socket,
+                               max_batch_size, args.max_wait_ms, args.intra_op_threads)
+        try:
+            # Warm up the session before measuring
+            run_load(args.host, args.port, args.unix_socket, args.variant, args.concurrency, 2)
+            results[label] = run_load(args.host, args.port, args.unix_socket, args.variant,
+                                      args.concurrency, args.requests)
+
+            connection = open_connection(args.host, args.port, args.unix_socket)
+            metrics = request_json(connection, 'GET', '/metrics')[args.variant]
+            connection.close()
+            results[label]['mean_batch_size'] = metrics['batch_size']['mean']
+        finally:
+            process.terminate()
+            process.wait()
+
+    print("📊 Results:")
+    for label, result in results.items():
+        print_result(label, result)
+        print(f"   {'':<14} mean batch size {result['mean_batch_size']:.1f}")
+
+    unbatched, batched = results.values()
+    print(f"✅ Micro-batching: {batched['throughput_rps'] / unbatched['throughput_rps']:.2f}x throughput, "
+          f"p99 {unbatched['p99_ms']:.1f} -> {batched['p99_ms']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Pre-optimized deployment artifacts for exported Fin-O ONNX models.
+Runs ONNX Runtime's graph optimizations once, offline, and saves the result as an optimized
+.onnx, an .ort flatbuffer and an fp16-weight variant, so sessions don't pay for optimization
+on every cold start. A manifest records each artifact's size and measured session-creation time.
+"""
+
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import onnx
+import onnxruntime as ort
+from onnx import helper, numpy_helper
+
+OPTIMIZATION_LEVELS = {
+    'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+def artifact_size(path: Path) -> int:
+    """Size of an ONNX artifact including its external data file, if any."""
+    size = path.stat().st_size
+    external_data = path.with_name(path.name + '.data')
+    if external_data.exists():
+        size += external_data.stat().st_size
+    return size
+
+
+def optimize_offline(onnx_path: Path, output_path: Path, level: str, save_format: str = 'ONNX'):
+    """Apply ONNX Runtime graph optimizations and write the optimized model to output_path."""
+    session_options = ort.SessionOptions()
+    session_options.graph_optimization_level = OPTIMIZATION_LEVELS[level]
+    session_options.optimized_model_filepath = str(output_path)
+    session_options.add_session_config_entry('session.save_model_format', save_format)
+    ort.InferenceSession(str(onnx_path), sess_options=session_options, providers=['CPUExecutionProvider'])
+    return output_path
+
+
+def convert_weights_to_fp16(model: onnx.ModelProto, min_elements: int = 1024) -> onnx.ModelProto:
+    """Store large float32 initializers as float16 and cast them back to float32 in-graph.
+
+    Halves the weight payload while keeping every operator in fp32, so the model still runs
+    on CPU execution providers without fp16 kernels. The Casts are constant-folded away when
+    the session is created.
+    """
+    graph = model.graph
+    cast_nodes = []
+    converted = []
+
+    for initializer in graph.initializer:
+        if initializer.data_type != onnx.TensorProto.FLOAT:
+            continue
+        weight = numpy_helper.to_array(initializer)
+        if weight.size < min_elements:
+            continue
+
+        fp16_name = f"{initializer.name}_fp16"
+        converted.append(numpy_helper.from_array(weight.astype(np.float16), fp16_name))
+        cast_nodes.append(helper.make_node('Cast', [fp16_name], [initializer.name],
+                                           to=onnx.TensorProto.FLOAT, name=f"{initializer.name}_cast"))
+
+    cast_outputs = {node.output[0] for node in cast_nodes}
+    kept = [init for init in graph.initializer if init.name not in cast_outputs]
+    del graph.initializer[:]
+    graph.initializer.extend(kept + converted)
+
+    nodes = cast_nodes + list(graph.node)
+    del graph.node[:]
+    graph.node.extend(nodes)
+    return model
+
+
+def save_with_external_data(model: onnx.ModelProto, output_path: Path):
+    """Save the model with all weights in a single external data file next to it."""
+    onnx.save_model(
+        model,
+        str(output_path),
+        save_as_external_data=True,
+        all_tensors_to_one_file=True,
+        location=output_path.name + '.data',
+        size_threshold=1024,
+    )
+    return output_path
+
+
+def measure_session_creation(model_path: Path, runs: int = 3, optimization_level: str = None):
+    """Median and minimum wall-clock time of ort.InferenceSession creation in milliseconds."""
+    session_options = ort.SessionOptions()
+    if optimization_level is not None:
+        session_options.graph_optimization_level = OPTIMIZATION_LEVELS[optimization_level]
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        ort.InferenceSession(str(model_path), sess_options=session_options, providers=['CPUExecutionProvider'])
+        timings.append((time.perf_counter() - start) * 1e3)
+
+    return {
+        'median_ms': float(np.median(timings)),
+        'min_ms': float(np.min(timings)),
+    }
+
+
+def build_optimized_artifacts(onnx_path: str, level: str = 'extended', external_data: bool = False,
+                              timing_runs: int = 3):
+    """Write optimized .onnx, .ort and fp16-weight variants of onnx_path plus a manifest.
+
+    Artifacts are named after the source model, e.g. fin-o-large.optimized.onnx,
+    fin-o-large.ort, fin-o-large.fp16.onnx and fin-o-large.manifest.json.
+    """
+    onnx_path = Path(onnx_path)
+    stem = onnx_path.stem
+    output_dir = onnx_path.parent
+
+    optimized_path = output_dir / f"{stem}.optimized.onnx"
+    ort_path = output_dir / f"{stem}.ort"
+    fp16_path = output_dir / f"{stem}.fp16.onnx"
+    manifest_path = output_dir / f"{stem}.manifest.json"
+
+    print(f"🔄 Optimizing {onnx_path} offline (level: {level})...")
+
+    optimize_offline(onnx_path, optimized_path, level)
+    if external_data:
+        save_with_external_data(onnx.load(str(optimized_path)), optimized_path)
+
+    optimize_offline(onnx_path, ort_path, level, save_format='ORT')
+
+    fp16_model = convert_weights_to_fp16(onnx.load(str(onnx_path)))
+    if external_data:
+        save_with_external_data(fp16_model, fp16_path)
+    else:
+        onnx.save_model(fp16_model, str(fp16_path))
+
+    # Pre-optimized artifacts are loaded with optimizations disabled; re-running them would
+    # only repeat work that was done offline.
+    artifacts = [
+        ('original', onnx_path, 'onnx', None),
+        ('optimized', optimized_path, 'onnx', 'basic'),
+        ('ort', ort_path, 'ort', 'basic'),
+        ('fp16', fp16_path, 'onnx', None),
+    ]
+
+    manifest = {
+        'model': stem,
+        'optimization_level': level,
+        'external_data': external_data,
+        'artifacts': {},
+    }
+
+    for name, path, model_format, load_level in artifacts:
+        entry = {
+            'path': path.name,
+            'format': model_format,
+            'size_bytes': artifact_size(path),
+            'session_options': {'graph_optimization_level': load_level or 'all'},
+            'session_creation': measure_session_creation(path, timing_runs, load_level),
+        }
+        manifest['artifacts'][name] = entry
+        print(f"   {name:<10} {entry['size_bytes'] / 1e6:8.1f} MB  "
+              f"{entry['session_creation']['median_ms']:8.1f} ms session creation")
+
+    manifest['fastest'] = min(
+        manifest['artifacts'],
+        key=lambda name: manifest['artifacts'][name]['session_creation']['median_ms'],
+    )
+
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    print(f"✅ Manifest written to {manifest_path} (fastest: {manifest['fastest']})")
+    return manifest_path
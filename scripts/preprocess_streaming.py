@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+Out-of-core, multi-core preprocessing of transaction CSVs into the window-index format.
+
+Pass 1 streams the CSV in chunks, assigns global vocab IDs in order of first appearance
+(identical to pd.factorize over the whole file) and hash-partitions rows by user into
+on-disk shards. Pass 2 computes the features of each shard in a process pool and writes
+them straight to their final rows of features.npy, returning mergeable moments for the
+StandardScaler. Pass 3 scales the feature matrix in place, in parallel row blocks.
+Peak memory is bounded by the chunk size and the size of one shard.
+"""
+
+import argparse
+import json
+import pickle
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+from preprocess_transactions import (
+    NUMERICAL_FEATURES,
+    compute_features,
+    group_starts,
+    process_raw_data,
+    signed_amount,
+    synthetic_transactions,
+)
+from window_dataset import (
+    FORMAT_VERSION,
+    INPUT_FEATURES,
+    TARGET_FEATURES,
+    compute_window_starts,
+    write_window_index,
+)
+
+RAW_COLUMNS = ['step', 'action', 'amount', 'nameOrig', 'oldBalanceOrig', 'nameDest']
+
+SHARD_DTYPE = np.dtype([
+    ('user_id', np.int64),
+    ('category_id', np.int64),
+    ('merchant_id', np.int64),
+    ('step', np.float64),
+    ('amount', np.float64),
+    ('balance_before', np.float64),
+])
+
+# Columns of the 14-feature input layout holding NUMERICAL_FEATURES, in order
+NUMERICAL_COLUMNS = [INPUT_FEATURES.index(name) for name in NUMERICAL_FEATURES]
+
+
+class StreamingVocab:
+    """Assigns IDs in order of first appearance across chunks, like pd.factorize on the full column."""
+
+    def __init__(self):
+        self.ids = {}
+        self.values = []
+
+    def encode(self, column: pd.Series) -> np.ndarray:
+        codes, uniques = pd.factorize(column)
+        mapping = np.empty(len(uniques), dtype=np.int64)
+        for i, value in enumerate(uniques):
+            value_id = self.ids.get(value)
+            if value_id is None:
+                value_id = len(self.values)
+                self.ids[value] = value_id
+                self.values.append(value)
+            mapping[i] = value_id
+        return mapping[codes]
+
+
+def partition_csv(csv_path: str, shard_dir: Path, num_shards: int, chunk_size: int):
+    """Pass 1: encode vocab IDs and write every chunk's rows to their user's shard."""
+    user_vocab, category_vocab, merchant_vocab = StreamingVocab(), StreamingVocab(), StreamingVocab()
+    user_counts = np.zeros(0, dtype=np.int64)
+
+    for shard in range(num_shards):
+        (shard_dir / f"shard-{shard:04d}").mkdir(parents=True, exist_ok=True)
+
+    num_rows = 0
+    for chunk_index, chunk in enumerate(pd.read_csv(csv_path, usecols=RAW_COLUMNS, chunksize=chunk_size)):
+        rows = np.empty(len(chunk), dtype=SHARD_DTYPE)
+        rows['user_id'] = user_vocab.encode(chunk['nameOrig'])
+        rows['category_id'] = category_vocab.encode(chunk['action'])
+        rows['merchant_id'] = merchant_vocab.encode(chunk['nameDest'])
+        rows['step'] = chunk['step'].to_numpy()
+        rows['amount'] = signed_amount(chunk['amount'].to_numpy(dtype=np.float64), chunk['action'])
+        rows['balance_before'] = chunk['oldBalanceOrig'].to_numpy()
+
+        counts = np.bincount(rows['user_id'], minlength=len(user_vocab.values))
+        counts[:len(user_counts)] += user_counts
+        user_counts = counts
+
+        # Users are hashed by their global ID; every row of a user lands in the same shard
+        shards = rows['user_id'] % num_shards
+        order = np.argsort(shards, kind='stable')
+        bounds = np.searchsorted(shards[order], np.arange(num_shards + 1))
+        for shard in range(num_shards):
+            if bounds[shard] < bounds[shard + 1]:
+                np.save(shard_dir / f"shard-{shard:04d}" / f"chunk-{chunk_index:06d}.npy",
+                        rows[order[bounds[shard]:bounds[shard + 1]]])
+
+        num_rows += len(chunk)
+
+    vocab_mappings = {
+        'categories': list(category_vocab.values),
+        'merchants': list(merchant_vocab.values)
+    }
+    return num_rows, user_counts, vocab_mappings, user_vocab.values
+
+
+def process_shard(shard_path: str, features_path: str, user_offsets_path: str):
+    """Pass 2 worker: compute one shard's features and write them to their final rows.
+
+    Returns (count, mean, M2) of the unscaled numerical features for the scaler merge.
+    """
+    chunk_files = sorted(Path(shard_path).glob('chunk-*.npy'))
+    if not chunk_files:
+        return 0, np.zeros(len(NUMERICAL_FEATURES)), np.zeros(len(NUMERICAL_FEATURES))
+
+    # Chunks are concatenated in file order, so the stable sort inside compute_features
+    # breaks ties between equal steps exactly like the single-process pipeline
+    rows = np.concatenate([np.load(path) for path in chunk_files])
+
+    order, numerical = compute_features(
+        rows['user_id'], rows['category_id'], rows['merchant_id'],
+        rows['step'], rows['amount'], rows['balance_before'],
+    )
+    user_id = rows['user_id'][order]
+
+    user_offsets = np.load(user_offsets_path, mmap_mode='r')
+    positions = np.arange(len(user_id))
+    rank_within_user = positions - np.maximum.accumulate(np.where(group_starts(user_id), positions, 0))
+    destination = user_offsets[user_id] + rank_within_user
+
+    shard_features = np.empty((len(user_id), len(INPUT_FEATURES)), dtype=np.float32)
+    shard_features[:, NUMERICAL_COLUMNS] = numerical
+    shard_features[:, INPUT_FEATURES.index('category_id')] = rows['category_id'][order]
+    shard_features[:, INPUT_FEATURES.index('merchant_id')] = rows['merchant_id'][order]
+
+    features = np.load(features_path, mmap_mode='r+')
+    features[destination] = shard_features
+    features.flush()
+
+    values = numerical.astype(np.float64)
+    mean = values.mean(axis=0)
+    m2 = ((values - mean) ** 2).sum(axis=0)
+    return len(values), mean, m2
+
+
+def merge_moments(moments):
+    """Combine per-shard (count, mean, M2) with Chan et al.'s parallel variance update.
+
+    Raises ValueError when no shard has rows, since there is nothing to fit the scaler on.
+    """
+    total_count, total_mean, total_m2 = 0, None, None
+    for count, mean, m2 in moments:
+        if count == 0:
+            continue
+        if total_mean is None:
+            total_count, total_mean, total_m2 = count, mean, m2
+            continue
+        combined = total_count + count
+        delta = mean - total_mean
+        total_mean = total_mean + delta * count / combined
+        total_m2 = total_m2 + m2 + delta ** 2 * total_count * count / combined
+        total_count = combined
+    if total_mean is None:
+        raise ValueError("No transactions to fit the scaler on (empty CSV or no shards)")
+    return total_count, total_mean, total_m2
+
+
+def scaler_from_moments(count: int, mean: np.ndarray, m2: np.ndarray) -> StandardScaler:
+    """A fitted StandardScaler equivalent to fit() on all rows."""
+    if count <= 0:
+        raise ValueError(f"Cannot fit a scaler on {count} rows")
+    scaler = StandardScaler()
+    scaler.n_features_in_ = len(mean)
+    scaler.n_samples_seen_ = np.int64(count)
+    scaler.mean_ = mean
+    scaler.var_ = m2 / count
+    scale = np.sqrt(scaler.var_)
+    scaler.scale_ = np.where(scale == 0, 1.0, scale)
+    return scaler
+
+
+def scale_rows(features_path: str, start: int, stop: int, mean: np.ndarray, scale: np.ndarray):
+    """Pass 3 worker: StandardScaler.transform of one row block of features.npy, in place."""
+    features = np.load(features_path, mmap_mode='r+')
+    block = features[start:stop][:, NUMERICAL_COLUMNS]
+    block -= mean
+    block /= scale
+    features[start:stop, NUMERICAL_COLUMNS] = block
+    features.flush()
+
+
+def preprocess_csv(csv_path: str, output_dir: str, sequence_length: int = 50, forecast_horizon: int = 10,
+                   workers: int = None, num_shards: int = 64, chunk_size: int = 1_000_000,
+                   scale_block_rows: int = 1_000_000, work_dir: str = None):
+    """Stream csv_path into the window-index format in output_dir; returns per-stage timings."""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    shard_dir = Path(tempfile.mkdtemp(prefix='fin-o-shards-', dir=work_dir))
+    timings = {}
+
+    try:
+        start = time.perf_counter()
+        num_rows, user_counts, vocab_mappings, user_names = partition_csv(csv_path, shard_dir, num_shards,
+                                                                          chunk_size)
+        timings['partition_s'] = time.perf_counter() - start
+        if num_rows == 0:
+            raise ValueError(f"{csv_path} contains no transactions")
+
+        user_offsets = np.concatenate([[0], np.cumsum(user_counts)]).astype(np.int64)
+        user_offsets_path = output_dir / 'user_offsets.npy'
+        np.save(user_offsets_path, user_offsets)
+        np.save(output_dir / 'user_ids.npy', np.asarray(user_names, dtype=str))
+
+        features_path = output_dir / 'features.npy'
+        np.lib.format.open_memmap(features_path, mode='w+', dtype=np.float32,
+                                  shape=(num_rows, len(INPUT_FEATURES))).flush()
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            start = time.perf_counter()
+            shard_paths = [str(shard_dir / f"shard-{shard:04d}") for shard in range(num_shards)]
+            moments = list(pool.map(process_shard, shard_paths,
+                                    [str(features_path)] * num_shards, [str(user_offsets_path)] * num_shards))
+            timings['features_s'] = time.perf_counter() - start
+
+            scaler = scaler_from_moments(*merge_moments(moments))
+
+            start = time.perf_counter()
+            blocks = range(0, num_rows, scale_block_rows)
+            list(pool.map(scale_rows, [str(features_path)] * len(blocks), blocks,
+                          [min(b + scale_block_rows, num_rows) for b in blocks],
+                          [scaler.mean_] * len(blocks), [scaler.scale_] * len(blocks)))
+            timings['scale_s'] = time.perf_counter() - start
+    finally:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+
+    window_starts = compute_window_starts(user_offsets, sequence_length, forecast_horizon)
+    np.save(output_dir / 'window_starts.npy', window_starts)
+
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'sequence_length': sequence_length,
+        'forecast_horizon': forecast_horizon,
+        'num_rows': num_rows,
+        'num_users': len(user_offsets) - 1,
+        'num_windows': len(window_starts),
+        'input_features': INPUT_FEATURES,
+        'target_features': TARGET_FEATURES,
+    }
+    with open(output_dir / 'meta.json', 'w') as f:
+        json.dump(meta, f, indent=2)
+    with open(output_dir / 'vocab.json', 'w') as f:
+        json.dump(vocab_mappings, f, indent=4)
+    with open(output_dir / 'scaler.pkl', 'wb') as f:
+        pickle.dump(scaler, f)
+
+    return meta, timings
+
+
+def check_parity(csv_path: str, streaming_dir: Path) -> bool:
+    """Compare the streaming output with process_raw_data + write_window_index on the full CSV."""
+    with open(streaming_dir / 'meta.json') as f:
+        meta = json.load(f)
+
+    with tempfile.TemporaryDirectory() as reference_dir:
+        raw_df = pd.read_csv(csv_path)
+        processed_df, vocab_mappings, scaler = process_raw_data(raw_df)
+        write_window_index(processed_df, reference_dir, meta['sequence_length'], meta['forecast_horizon'],
+                           pd.factorize(raw_df['nameOrig'])[1])
+
+        ok = True
+        for name in ['user_offsets.npy', 'user_ids.npy', 'window_starts.npy']:
+            equal = np.array_equal(np.load(Path(reference_dir) / name), np.load(streaming_dir / name))
+            ok = ok and equal
+            print(f"{'✅' if equal else '❌'} {name} identical")
+
+        with open(streaming_dir / 'vocab.json') as f:
+            equal = json.load(f) == vocab_mappings
+        ok = ok and equal
+        print(f"{'✅' if equal else '❌'} vocab identical")
+
+        expected = np.load(Path(reference_dir) / 'features.npy')
+        actual = np.load(streaming_dir / 'features.npy')
+        id_columns = [INPUT_FEATURES.index('category_id'), INPUT_FEATURES.index('merchant_id')]
+        equal = np.array_equal(expected[:, id_columns], actual[:, id_columns])
+        ok = ok and equal
+        print(f"{'✅' if equal else '❌'} category/merchant IDs identical")
+
+        # The scaler is merged from per-shard moments, so scaled features may differ from a
+        # single StandardScaler.fit in the last float32 bit
+        max_diff = float(np.abs(expected - actual).max())
+        ok = ok and max_diff <= 1e-5
+        print(f"{'✅' if max_diff <= 1e-5 else '❌'} features: max abs diff {max_diff:.2e}")
+
+        with open(streaming_dir / 'scaler.pkl', 'rb') as f:
+            streaming_scaler = pickle.load(f)
+        close = (np.allclose(streaming_scaler.mean_, scaler.mean_, rtol=1e-9, atol=1e-9) and
+                 np.allclose(streaming_scaler.scale_, scaler.scale_, rtol=1e-9))
+        ok = ok and close
+        print(f"{'✅' if close else '❌'} scaler statistics match")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Out-of-core, multi-core Fin-O preprocessing')
+    parser.add_argument('--csv', type=str, default=None,
+                       help='Raw transactions CSV (t2.csv format)')
+    parser.add_argument('--synthetic-rows', type=int, default=None,
+                       help='Write a synthetic CSV with this many rows and process it instead')
+    parser.add_argument('--output-dir', type=str, default='processed_data',
+                       help='Output directory for the window-index dataset, vocab.json and scaler.pkl')
+    parser.add_argument('--sequence-length', type=int, default=50,
+                       help='Number of transactions in each input window')
+    parser.add_argument('--forecast-horizon', type=int, default=10,
+                       help='Number of transactions to forecast after each window')
+    parser.add_argument('--workers', type=int, default=None,
+                       help='Worker processes (default: all cores)')
+    parser.add_argument('--num-shards', type=int, default=64,
+                       help='Number of user hash partitions; more shards means less memory per worker')
+    parser.add_argument('--chunk-size', type=int, default=1_000_000,
+                       help='CSV rows read per chunk')
+    parser.add_argument('--work-dir', type=str, default=None,
+                       help='Directory for temporary shards (default: system temp dir)')
+    parser.add_argument('--check-parity', action='store_true',
+                       help='Compare against the single-process pipeline (loads the whole CSV)')
+
+    args = parser.parse_args()
+
+    csv_path = args.csv
+    if args.synthetic_rows:
+        csv_path = Path(args.output_dir) / 'synthetic.csv'
+        csv_path.parent.mkdir(parents=True, exist_ok=True)
+        synthetic_transactions(args.synthetic_rows, num_users=max(args.synthetic_rows // 300, 1)).to_csv(
+            csv_path, index=False
+        )
+    elif csv_path is None:
+        parser.error('--csv or --synthetic-rows is required')
+
+    print(f"🚀 Streaming {csv_path} into {args.output_dir}...")
+
+    start = time.perf_counter()
+    try:
+        meta, timings = preprocess_csv(
+            csv_path, args.output_dir, args.sequence_length, args.forecast_horizon,
+            workers=args.workers, num_shards=args.num_shards, chunk_size=args.chunk_size, work_dir=args.work_dir,
+        )
+    except ValueError as e:
+        print(f"❌ {e}")
+        raise SystemExit(1)
+    elapsed = time.perf_counter() - start
+
+    print(f"✅ {meta['num_windows']:,} windows over {meta['num_rows']:,} rows in {elapsed:.1f} s "
+          f"({meta['num_rows'] / elapsed:,.0f} rows/s)")
+    print(f"   partition {timings['partition_s']:.1f} s | features {timings['features_s']:.1f} s | "
+          f"scale {timings['scale_s']:.1f} s")
+
+    if args.check_parity and not check_parity(csv_path, Path(args.output_dir)):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
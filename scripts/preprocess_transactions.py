@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Feature engineering for Fin-O training data.
+Vectorized replacement for process_raw_data in model/model.ipynb: the same 12 numerical
+features computed with cumulative-sum/cumcount arithmetic over one stable sort, lookup
+tables for the calendar encodings and float32 columns throughout.
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+CALENDAR_ORIGIN = '2024-01-01'
+
+NUMERICAL_FEATURES = [
+    'amount', 'balance_before', 'time_delta',
+    'time_delta_category', 'time_delta_merchant', 'avg_amount_merchant',
+    'day_of_week_sin', 'day_of_week_cos',
+    'day_of_month_sin', 'day_of_month_cos',
+    'month_of_year_sin', 'month_of_year_cos'
+]
+
+ID_FEATURES = ['user_id', 'category_id', 'merchant_id']
+
+# Cyclical encodings indexed by day of week (0-6), day of month (1-31) and month (1-12)
+DAY_OF_WEEK_SIN = np.sin(2 * np.pi * np.arange(7) / 7)
+DAY_OF_WEEK_COS = np.cos(2 * np.pi * np.arange(7) / 7)
+DAY_OF_MONTH_SIN = np.sin(2 * np.pi * np.arange(32) / 31)
+DAY_OF_MONTH_COS = np.cos(2 * np.pi * np.arange(32) / 31)
+MONTH_OF_YEAR_SIN = np.sin(2 * np.pi * np.arange(13) / 12)
+MONTH_OF_YEAR_COS = np.cos(2 * np.pi * np.arange(13) / 12)
+
+
+def process_raw_data_reference(df: pd.DataFrame):
+    """process_raw_data as implemented in model/model.ipynb, kept for parity checks and benchmarks."""
+    is_income = df['action'].str.contains("INCOME", case=False)
+
+    df['amount'] = df['amount'] * is_income.replace({True: 1, False: -1})
+    df['user_id'], user_vocab = pd.factorize(df['nameOrig'])
+    df['category_id'], cat_vocab = pd.factorize(df['action'])
+    df['merchant_id'], merch_vocab = pd.factorize(df['nameDest'])
+    df = df.rename(columns={"oldBalanceOrig": "balance_before"})
+    df = df.sort_values(by=['user_id', 'step'])
+    df['time_delta'] = df.groupby('user_id')['step'].diff().fillna(0)
+    df['time_delta_category'] = df.groupby(['user_id', 'category_id'])['step'].diff().fillna(0)
+    df['time_delta_merchant'] = df.groupby(['user_id', 'merchant_id'])['step'].diff().fillna(0)
+    expanding_mean = df.groupby(['user_id', 'merchant_id'])['amount'].expanding().mean()
+    df['avg_amount_merchant'] = expanding_mean.reset_index(level=[0,1], drop=True)
+    df['avg_amount_merchant'] = df.groupby(['user_id', 'merchant_id'])['avg_amount_merchant'].shift(1).fillna(0)
+
+    df['datetime'] = pd.to_datetime(df['step'], unit='D', origin=CALENDAR_ORIGIN)
+    df['day_of_week'] = df['datetime'].dt.dayofweek
+    df['month_of_year'] = df['datetime'].dt.month
+    df['day_of_month'] = df['datetime'].dt.day
+    df['day_of_week_sin'] = np.sin(2 * np.pi * df['day_of_week'] / 7)
+    df['day_of_week_cos'] = np.cos(2 * np.pi * df['day_of_week'] / 7)
+    df['day_of_month_sin'] = np.sin(2 * np.pi * df['day_of_month'] / 31)
+    df['day_of_month_cos'] = np.cos(2 * np.pi * df['day_of_month'] / 31)
+    df['month_of_year_sin'] = np.sin(2 * np.pi * df['month_of_year'] / 12)
+    df['month_of_year_cos'] = np.cos(2 * np.pi * df['month_of_year'] / 12)
+
+    scaler = StandardScaler()
+    df[NUMERICAL_FEATURES] = scaler.fit_transform(df[NUMERICAL_FEATURES])
+
+    features_to_keep = ID_FEATURES + NUMERICAL_FEATURES
+
+    vocab_mappings = {
+        'categories': list(cat_vocab),
+        'merchants': list(merch_vocab)
+    }
+
+    return df[features_to_keep], vocab_mappings, scaler
+
+
+def signed_amount(amount: np.ndarray, action: pd.Series) -> np.ndarray:
+    """Income keeps its sign, every other action becomes an outflow."""
+    is_income = action.str.contains("INCOME", case=False).to_numpy()
+    return np.where(is_income, amount, -amount)
+
+
+def group_starts(keys: np.ndarray) -> np.ndarray:
+    """Boolean mask marking the first row of each run of equal keys."""
+    starts = np.empty(len(keys), dtype=bool)
+    if len(keys):
+        starts[0] = True
+        np.not_equal(keys[1:], keys[:-1], out=starts[1:])
+    return starts
+
+
+def group_diff(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """values[i] - values[i-1] within each group, 0 on the first row of a group."""
+    diff = np.empty(len(values), dtype=np.float64)
+    if len(values):
+        diff[0] = 0
+        np.subtract(values[1:], values[:-1], out=diff[1:])
+        diff[starts] = 0
+    return diff
+
+
+def group_prior_mean(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Mean of the earlier values in each group (expanding mean shifted by one), 0 on the first row."""
+    positions = np.arange(len(values))
+    group_start = np.maximum.accumulate(np.where(starts, positions, 0))
+
+    # The running sum restarts at every group, so each row's result depends only on its own
+    # group; a single global cumsum would make results depend on the rows of other users.
+    group_ids = np.cumsum(starts) - 1
+    prior_sum = pd.Series(values).groupby(group_ids).cumsum().to_numpy() - values
+    prior_count = positions - group_start
+
+    mean = np.zeros(len(values), dtype=np.float64)
+    np.divide(prior_sum, prior_count, out=mean, where=prior_count > 0)
+    return mean
+
+
+def calendar_features(step: np.ndarray) -> dict:
+    """Cyclical day-of-week/day-of-month/month encodings of day offsets from CALENDAR_ORIGIN.
+
+    Month and day of month are looked up from a table covering the observed range of days
+    instead of building one datetime per row.
+    """
+    days = np.floor(step).astype(np.int64)
+    first_day = int(days.min()) if len(days) else 0
+    last_day = int(days.max()) if len(days) else 0
+
+    dates = pd.to_datetime(np.arange(first_day, last_day + 1), unit='D', origin=CALENDAR_ORIGIN)
+    offsets = days - first_day
+    day_of_week = dates.dayofweek.to_numpy()[offsets]
+    day_of_month = dates.day.to_numpy()[offsets]
+    month_of_year = dates.month.to_numpy()[offsets]
+
+    return {
+        'day_of_week_sin': DAY_OF_WEEK_SIN[day_of_week],
+        'day_of_week_cos': DAY_OF_WEEK_COS[day_of_week],
+        'day_of_month_sin': DAY_OF_MONTH_SIN[day_of_month],
+        'day_of_month_cos': DAY_OF_MONTH_COS[day_of_month],
+        'month_of_year_sin': MONTH_OF_YEAR_SIN[month_of_year],
+        'month_of_year_cos': MONTH_OF_YEAR_COS[month_of_year],
+    }
+
+
+def compute_features(user_id: np.ndarray, category_id: np.ndarray, merchant_id: np.ndarray,
+                     step: np.ndarray, amount: np.ndarray, balance_before: np.ndarray):
+    """Unscaled numerical features for rows sorted by (user_id, step).
+
+    Returns the stable sort order applied to the inputs and an (n, 12) float32 matrix with
+    columns in NUMERICAL_FEATURES order.
+    """
+    order = np.lexsort((step, user_id))
+    user_id = user_id[order]
+    category_id = category_id[order]
+    merchant_id = merchant_id[order]
+    step = np.asarray(step, dtype=np.float64)[order]
+    amount = np.asarray(amount, dtype=np.float64)[order]
+
+    features = np.empty((len(order), len(NUMERICAL_FEATURES)), dtype=np.float32)
+    features[:, 0] = amount
+    features[:, 1] = balance_before[order]
+    features[:, 2] = group_diff(step, group_starts(user_id))
+
+    # (user, category) and (user, merchant) groups: a stable sort on the combined key keeps
+    # rows of a group in step order, so group-wise diffs and prefix sums are plain array ops.
+    category_key = user_id.astype(np.int64) * (int(category_id.max()) + 1) + category_id
+    category_order = np.argsort(category_key, kind='stable')
+    features[category_order, 3] = group_diff(step[category_order], group_starts(category_key[category_order]))
+
+    merchant_key = user_id.astype(np.int64) * (int(merchant_id.max()) + 1) + merchant_id
+    merchant_order = np.argsort(merchant_key, kind='stable')
+    merchant_starts = group_starts(merchant_key[merchant_order])
+    features[merchant_order, 4] = group_diff(step[merchant_order], merchant_starts)
+    features[merchant_order, 5] = group_prior_mean(amount[merchant_order], merchant_starts)
+
+    for column, values in calendar_features(step).items():
+        features[:, NUMERICAL_FEATURES.index(column)] = values
+
+    return order, features
+
+
+def process_raw_data(df: pd.DataFrame):
+    """Vectorized process_raw_data; same outputs as the notebook version, with float32 features.
+
+    Does not modify df.
+    """
+    user_id, _ = pd.factorize(df['nameOrig'])
+    category_id, cat_vocab = pd.factorize(df['action'])
+    merchant_id, merch_vocab = pd.factorize(df['nameDest'])
+
+    amount = signed_amount(df['amount'].to_numpy(dtype=np.float64), df['action'])
+
+    order, features = compute_features(
+        user_id, category_id, merchant_id,
+        df['step'].to_numpy(), amount, df['oldBalanceOrig'].to_numpy(),
+    )
+
+    scaler = StandardScaler()
+    features = scaler.fit_transform(features)
+
+    columns = {
+        'user_id': user_id[order],
+        'category_id': category_id[order],
+        'merchant_id': merchant_id[order],
+    }
+    for i, name in enumerate(NUMERICAL_FEATURES):
+        columns[name] = features[:, i]
+
+    processed_df = pd.DataFrame(columns, index=df.index[order])
+
+    vocab_mappings = {
+        'categories': list(cat_vocab),
+        'merchants': list(merch_vocab)
+    }
+
+    return processed_df, vocab_mappings, scaler
+
+
+def synthetic_transactions(num_rows: int, num_users: int = 1000, num_days: int = 730, seed: int = 0) -> pd.DataFrame:
+    """Random transactions with the columns of t2.csv used by process_raw_data."""
+    rng = np.random.default_rng(seed)
+    actions = np.array([f"ACTION_{i}" for i in range(38)] + ['INCOME_GENERAL', 'INCOME_BONUS', 'income_refund'])
+    merchants = np.array([f"Merchant {i}" for i in range(230)])
+
+    return pd.DataFrame({
+        'step': rng.integers(0, num_days, num_rows),
+        'action': actions[rng.integers(0, len(actions), num_rows)],
+        'amount': rng.gamma(2.0, 50.0, num_rows).round(2),
+        'nameOrig': np.char.add('C', rng.integers(0, num_users, num_rows).astype(str)),
+        'oldBalanceOrig': rng.normal(10000, 5000, num_rows).round(2),
+        'nameDest': merchants[rng.integers(0, len(merchants), num_rows)],
+    })
+
+
+def check_parity(raw_df: pd.DataFrame, atol: float = 1e-4) -> bool:
+    """Compare process_raw_data against the notebook implementation."""
+    expected, expected_vocab, expected_scaler = process_raw_data_reference(raw_df.copy())
+    actual, actual_vocab, actual_scaler = process_raw_data(raw_df)
+
+    ok = True
+
+    def report(name, passed, detail=''):
+        nonlocal ok
+        ok = ok and passed
+        print(f"{'✅' if passed else '❌'} {name}{detail}")
+
+    report('row order', expected.index.equals(actual.index))
+    report('vocab', expected_vocab == actual_vocab)
+    for column in ID_FEATURES:
+        report(column, np.array_equal(expected[column].to_numpy(), actual[column].to_numpy()))
+    for column in NUMERICAL_FEATURES:
+        max_diff = float(np.abs(expected[column].to_numpy() - actual[column].to_numpy()).max())
+        report(column, max_diff <= atol, f": max abs diff {max_diff:.2e}")
+    mean_diff = float(np.abs(expected_scaler.mean_ - actual_scaler.mean_).max())
+    report('scaler mean', np.allclose(expected_scaler.mean_, actual_scaler.mean_, rtol=1e-5),
+           f": max abs diff {mean_diff:.2e}")
+    report('scaler scale', np.allclose(expected_scaler.scale_, actual_scaler.scale_, rtol=1e-5))
+    report('float32 features', all(actual[column].dtype == np.float32 for column in NUMERICAL_FEATURES))
+    return ok
+
+
+def benchmark(process, raw_df: pd.DataFrame, copy_input: bool):
+    """Rows/second and peak traced memory of one process_raw_data implementation."""
+    data = raw_df.copy() if copy_input else raw_df
+    tracemalloc.start()
+    start = time.perf_counter()
+    process(data)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(raw_df) / elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check and benchmark the vectorized Fin-O feature engineering')
+    parser.add_argument('--csv', type=str, default=None,
+                       help='Raw transactions CSV (t2.csv format); synthetic data is used if omitted')
+    parser.add_argument('--synthetic-rows', type=int, default=200_000,
+                       help='Number of synthetic transactions when no CSV is given')
+    parser.add_argument('--synthetic-users', type=int, default=1000,
+                       help='Number of synthetic users when no CSV is given')
+    parser.add_argument('--skip-parity', action='store_true',
+                       help='Only run the benchmark')
+
+    args = parser.parse_args()
+
+    if args.csv:
+        raw_df = pd.read_csv(args.csv)
+    else:
+        raw_df = synthetic_transactions(args.synthetic_rows, args.synthetic_users)
+
+    print(f"🚀 Processing {len(raw_df):,} transactions...")
+
+    if not args.skip_parity and not check_parity(raw_df):
+        raise SystemExit(1)
+
+    reference_rate, reference_peak = benchmark(process_raw_data_reference, raw_df, copy_input=True)
+    vectorized_rate, vectorized_peak = benchmark(process_raw_data, raw_df, copy_input=False)
+
+    print(f"📊 Notebook:   {reference_rate:12,.0f} rows/s, peak {reference_peak / 1e6:8.1f} MB")
+    print(f"📊 Vectorized: {vectorized_rate:12,.0f} rows/s, peak {vectorized_peak / 1e6:8.1f} MB "
+          f"({vectorized_rate / reference_rate:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
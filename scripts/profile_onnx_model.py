@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+"""
+Per-operator profile of an exported Fin-O graph.
+Runs ONNX Runtime with profiling enabled (and optionally the PyTorch profiler on the eager
+model) over real windows or random inputs, attributes every kernel to an operator type and
+a logical stage (encoder, decoder step t, output heads, Seq2Seq glue such as the output
+scatter) and prints ranked hotspot tables. The raw traces are kept as Chrome-trace files
+(chrome://tracing, Perfetto).
+"""
+
+import argparse
+import ast
+import json
+import re
+import shutil
+import tempfile
+from collections import defaultdict, deque
+from pathlib import Path
+
+import numpy as np
+import onnxruntime as ort
+import torch
+
+from convert_pytorch_to_onnx import (
+    FORECAST_HORIZON,
+    build_model,
+    convert_loop_model_to_onnx,
+    convert_model_to_onnx,
+    dummy_sequence,
+    load_model,
+    vocab_sizes,
+)
+from window_dataset import BatchedSequenceDataset, BatchedWindowDataset
+
+HEAD_MODULES = {'fc_amount', 'fc_category', 'fc_merchant'}
+# Control-flow nodes whose kernel time is the time of their subgraph nodes
+CONTAINER_OPS = {'Loop', 'If', 'Scan'}
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    'disabled': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+def representative_inputs(data_dir: str, batch_size: int, seed: int = 0):
+    """(input, target) of batch_size random windows from a processed dataset directory."""
+    data_dir = Path(data_dir)
+    if (data_dir / 'meta.json').exists():
+        dataset = BatchedWindowDataset(data_dir)
+    else:
+        dataset = BatchedSequenceDataset(data_dir / 'sequences_X.npy', data_dir / 'sequences_y.npy')
+    batch_indices = np.random.default_rng(seed).choice(len(dataset), batch_size, replace=False)
+    src, trg = dataset[batch_indices]
+    return src.numpy(), trg.numpy()
+
+
+def scope_modules(node_name: str):
+    """(module, call index) of every scope of an exported node name.
+
+    The exporter names nodes after the module calls that produced them and numbers repeated
+    calls: '/decoder/lstm_3/LSTM' -> [('decoder', 0), ('lstm', 3)].
+    """
+    parts = [part for part in node_name.split('/') if part]
+    scopes = [re.fullmatch(r'(.*?)(?:_(\d+))?', part).groups() for part in parts[:-1]]
+    return [(module, int(index or 0)) for module, index in scopes]
+
+
+def scope_stage(node_name: str):
+    """Stage of a node from its module scopes, or None for nodes without any."""
+    modules = [module for module, _ in scope_modules(node_name)]
+    if not modules:
+        return None
+    if HEAD_MODULES & set(modules):
+        return 'heads'
+    if 'encoder' in modules:
+        return 'encoder'
+    if 'decoder' in modules:
+        return 'decoder step'
+    if 'preprocessor' in modules:
+        return 'feature engineering'
+    return 'glue'
+
+
+def lstm_call(node_name: str):
+    """Call index of the LSTM scope of a node (its decoder step in unrolled graphs), or None."""
+    for module, index in scope_modules(node_name):
+        if module == 'lstm':
+            return index
+    return None
+
+
+def stage_label(stage: str, step) -> str:
+    return stage if step is None else f"{stage} {step}"
+
+
+def scoped_name(node) -> str:
+    """Node name with its module scopes, '/decoder/lstm_3/LSTM' style.
+
+    The TorchScript exporter puts the scopes into node names. The dynamo exporter names
+    nodes like 'node_select_scatter_2' and keeps the scopes in metadata
+    (['', 'decoder', 'decoder.lstm', 'lstm_4'] -> '/decoder/lstm/lstm_4/node_LSTM_595').
+    """
+    metadata = {prop.key: prop.value for prop in node.metadata_props}
+    if 'pkg.torch.onnx.name_scopes' not in metadata:
+        return node.name
+    scopes = ast.literal_eval(metadata['pkg.torch.onnx.name_scopes'])
+    return '/'.join([scope.split('.')[-1] for scope in scopes] + [node.name])
+
+
+def graph_stages(onnx_path) -> dict:
+    """Stage label of every node of the main graph of an exported model.
+
+    Decoder LSTM calls are numbered by their order in the graph, since every step's LSTM
+    consumes the previous step's state. Other decoder nodes take the step of the nearest
+    LSTM they feed, or follow (output squeeze); their own scope numbers are not reliable
+    because the exporter merges identical computations across steps (steps 0 and 1 embed the
+    same target row). Unscoped nodes (LSTM weight identities, index arithmetic of the output
+    scatter) take the stage of their nearest labelled consumer.
+    """
+    import onnx
+
+    graph = onnx.load(str(onnx_path), load_external_data=False).graph
+    producers = {output: node for node in graph.node for output in node.output}
+    consumers = defaultdict(list)
+    for node in graph.node:
+        for name in node.input:
+            consumers[name].append(node)
+
+    def downstream(node):
+        return [consumer for output in node.output for consumer in consumers[output]]
+
+    def upstream(node):
+        return [producers[name] for name in node.input if name in producers]
+
+    def nearest(node, neighbours, label):
+        """label() of the closest node in breadth-first order for which it is not None."""
+        seen = {node.name}
+        queue = deque([node])
+        while queue:
+            for neighbour in neighbours(queue.popleft()):
+                if neighbour.name in seen:
+                    continue
+                seen.add(neighbour.name)
+                result = label(neighbour)
+                if result is not None:
+                    return result
+                queue.append(neighbour)
+        return None
+
+    names = {node.name: scoped_name(node) for node in graph.node}
+    stages = {node.name: scope_stage(names[node.name]) for node in graph.node}
+
+    # One LSTM call exports one LSTM node per layer, all under the call's scope
+    lstm_steps = {}
+    for node in graph.node:
+        if stages[node.name] == 'decoder step' and node.op_type == 'LSTM':
+            lstm_steps.setdefault(names[node.name].rpartition('/')[0], len(lstm_steps))
+
+    def decoder_lstm_step(node):
+        if stages[node.name] == 'decoder step' and node.op_type == 'LSTM':
+            return lstm_steps[names[node.name].rpartition('/')[0]]
+        return None
+
+    labels = {}
+    for node in graph.node:
+        stage = stages[node.name]
+        if stage == 'decoder step':
+            step = decoder_lstm_step(node)
+            if step is None:
+                step = nearest(node, downstream, decoder_lstm_step)
+            if step is None:
+                step = nearest(node, upstream, decoder_lstm_step)
+            labels[node.name] = stage_label(stage, step)
+        elif stage is not None:
+            labels[node.name] = stage
+
+    for node in graph.node:
+        if stages[node.name] is None:
+            labels[node.name] = nearest(node, downstream, lambda consumer: labels.get(consumer.name)) or 'glue'
+
+    if not any(label == 'encoder' or label.startswith('decoder') for label in labels.values()):
+        raise RuntimeError(f"No node of {onnx_path} could be attributed to the encoder or decoder; "
+                           "export it with convert_pytorch_to_onnx.py, which keeps module scopes")
+    return labels
+
+
+def node_label(node_name: str, labels: dict, occurrence: int) -> str:
+    """Stage label of a profiled node; occurrence is how often the node already ran in this run.
+
+    Nodes outside the main graph (Loop bodies, nodes created by ONNX Runtime's optimizer)
+    are labelled from their name. Loop bodies run the same decoder nodes once per step, so
+    there the occurrence is the step.
+    """
+    if node_name in labels:
+        return labels[node_name]
+    stage = scope_stage(node_name) or 'glue'
+    if stage == 'decoder step':
+        return stage_label(stage, (lstm_call(node_name) or 0) + occurrence)
+    return stage
+
+
+def ort_kernel_events(trace: list, warmup: int):
+    """Node kernel events of the measured runs (after warmup) in execution order, and those runs.
+
+    Events are (run, node name, op type, microseconds); runs are (start, end) timestamps.
+    """
+    runs = sorted((event['ts'], event['ts'] + event['dur']) for event in trace
+                  if event.get('cat') == 'Session' and event.get('name') == 'model_run')
+    runs = runs[warmup:]
+
+    events = []
+    for event in trace:
+        if event.get('cat') != 'Node' or not event['name'].endswith('_kernel_time'):
+            continue
+        for run, (start, end) in enumerate(runs):
+            if start <= event['ts'] <= end:
+                events.append((run, event['ts'], event['name'][:-len('_kernel_time')],
+                               event['args']['op_name'], event['dur']))
+                break
+    events.sort(key=lambda item: item[:2])
+    return [(run, node_name, op_type, duration) for run, _, node_name, op_type, duration in events], runs
+
+
+def aggregate_ort_trace(trace: list, labels: dict, warmup: int):
+    """Kernel microseconds per run and calls per run by (stage label, op type), and the mean run wall time."""
+    events, runs = ort_kernel_events(trace, warmup)
+    num_runs = len(runs)
+
+    totals = defaultdict(lambda: [0.0, 0])
+    occurrences = defaultdict(int)
+    for run, node_name, op_type, duration in events:
+        if op_type in CONTAINER_OPS:
+            continue
+        label = node_label(node_name, labels, occurrences[run, node_name])
+        occurrences[run, node_name] += 1
+        entry = totals[label, op_type]
+        entry[0] += duration / num_runs
+        entry[1] += 1 / num_runs
+
+    wall_us = float(np.mean([end - start for start, end in runs])) if runs else 0.0
+    return dict(totals), wall_us
+
+
+class StageLabels:
+    """Forward hooks that wrap the encoder, every decoder call and the heads in record_function ranges."""
+
+    def __init__(self, model):
+        self.model = model
+        self.ranges = []
+        self.decoder_step = 0
+        self.handles = []
+
+        modules = [('encoder', model.encoder), ('decoder step', model.decoder)]
+        modules += [('heads', getattr(model.decoder, name)) for name in sorted(HEAD_MODULES)]
+        for name, module in modules:
+            self.handles.append(module.register_forward_pre_hook(self.enter(name)))
+            self.handles.append(module.register_forward_hook(self.exit))
+
+    def enter(self, name: str):
+        def hook(module, args):
+            label = name
+            if name == 'decoder step':
+                label = stage_label(name, self.decoder_step)
+                self.decoder_step += 1
+            record = torch.profiler.record_function(label)
+            record.__enter__()
+            self.ranges.append(record)
+        return hook
+
+    def exit(self, module, args, output):
+        self.ranges.pop().__exit__(None, None, None)
+
+    def reset(self):
+        self.decoder_step = 0
+
+    def remove(self):
+        for handle in self.handles:
+            handle.remove()
+
+
+def aggregate_torch_profile(events, num_runs: int):
+    """Self CPU microseconds per run and calls per run by (stage label, op) from profiler events.
+
+    Every op is attributed to its innermost stage range; time spent in a stage range
+    outside any op (Python and module call overhead) is reported as op '(python)'.
+    """
+    stage_names = re.compile(r'encoder|heads|decoder step \d+')
+    totals = defaultdict(lambda: [0.0, 0])
+    for event in events:
+        if event.name == 'fin-o run':
+            continue
+        if stage_names.fullmatch(event.name):
+            stage, op = event.name, '(python)'
+        else:
+            parent = event.cpu_parent
+            while parent is not None and not stage_names.fullmatch(parent.name):
+                parent = parent.cpu_parent
+            stage, op = (parent.name if parent is not None else 'glue'), event.name
+        entry = totals[stage, op]
+        entry[0] += event.self_cpu_time_total / num_runs
+        entry[1] += 1 / num_runs
+    return dict(totals)
+
+
+def profile_eager(model, src: np.ndarray, trg: np.ndarray, horizon, runs: int, warmup: int, trace_path: Path):
+    """PyTorch profiler over the eager model running the same computation as the ONNX graph."""
+    from torch.profiler import ProfilerActivity, profile, record_function
+
+    src, trg = torch.from_numpy(src), torch.from_numpy(trg)
+
+    def step():
+        with torch.no_grad(), record_function('fin-o run'):
+            if horizon is None:
+                model(src, trg, 0.0)
+            else:
+                model.predict(src, horizon)
+
+    labels = StageLabels(model)
+    try:
+        for _ in range(warmup):
+            labels.reset()
+            step()
+        with profile(activities=[ProfilerActivity.CPU]) as prof:
+            for _ in range(runs):
+                labels.reset()
+                step()
+    finally:
+        labels.remove()
+
+    prof.export_chrome_trace(str(trace_path))
+    return aggregate_torch_profile(prof.events(), runs)
+
+
+def stage_sort_key(stage: str):
+    order = ['feature engineering', 'encoder', 'decoder step', 'heads', 'glue']
+    name, _, step = stage.rpartition(' ') if stage.startswith('decoder step') else (stage, '', '0')
+    return (order.index(name) if name in order else len(order), int(step))
+
+
+def print_report(title: str, totals: dict, top: int, wall_us: float = None):
+    """Stage, op type and (stage, op type) hotspot tables of one profile."""
+    kernel_us = sum(duration for duration, _ in totals.values())
+    print(f"\n📊 {title}: {kernel_us / 1e3:.3f} ms of kernel time per run", end='')
+    if wall_us:
+        print(f" ({wall_us / 1e3:.3f} ms wall, {100 * kernel_us / wall_us:.0f}% in kernels)", end='')
+    print()
+
+    def table(header: str, rows, limit=None):
+        rows = list(rows)[:limit]
+        print(f"   {header:<40}{'ms/run':>10}{'share':>8}{'calls/run':>11}")
+        for name, (duration, calls) in rows:
+            print(f"   {name:<40}{duration / 1e3:>10.3f}{100 * duration / kernel_us:>7.1f}%{calls:>11.0f}")
+        print()
+
+    by_stage = defaultdict(lambda: [0.0, 0])
+    by_op = defaultdict(lambda: [0.0, 0])
+    for (stage, op), (duration, calls) in totals.items():
+        for entry in (by_stage[stage], by_op[op]):
+            entry[0] += duration
+            entry[1] += calls
+
+    table('stage', sorted(by_stage.items(), key=lambda item: stage_sort_key(item[0])))
+    table('op type', sorted(by_op.items(), key=lambda item: -item[1][0]), top)
+    hotspots = sorted(totals.items(), key=lambda item: -item[1][0])
+    table('hotspot (stage / op type)', [(f"{stage} / {op}", value) for (stage, op), value in hotspots], top)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-operator and per-stage profile of an exported Fin-O graph')
+    parser.add_argument('--model-path', type=str, default=None,
+                       help='PyTorch checkpoint to export and profile (default: random weights)')
+    parser.add_argument('--onnx-model', type=str, default=None,
+                       help='Profile this exported full or loop graph instead of exporting one')
+    parser.add_argument('--model-type', type=str, default='large',
+                       help='Name of the exported graph (fin-o-<type>.onnx), used for the trace files')
+    parser.add_argument('--export-mode', choices=['full', 'loop'], default='full',
+                       help='Graph to export: unrolled teacher-forced (full) or greedy ONNX Loop (loop)')
+    parser.add_argument('--postprocess-top-k', type=int, default=None, metavar='K',
+                       help='Export the full graph with in-graph softmax/top-k (see the converter)')
+    parser.add_argument('--data-dir', type=str, default=None,
+                       help='Processed dataset to draw input windows from (default: random inputs)')
+    parser.add_argument('--horizon', type=int, default=FORECAST_HORIZON,
+                       help='Decoder steps for loop graphs')
+    parser.add_argument('--batch-size', type=int, default=1,
+                       help='Windows per run')
+    parser.add_argument('--runs', type=int, default=20,
+                       help='Profiled runs')
+    parser.add_argument('--warmup', type=int, default=3,
+                       help='Runs before the profiled ones (excluded from the tables)')
+    parser.add_argument('--threads', type=int, default=1,
+                       help='Intra-op threads for ONNX Runtime and PyTorch')
+    parser.add_argument('--graph-optimization', choices=list(GRAPH_OPTIMIZATION_LEVELS), default='all',
+                       help="ONNX Runtime graph optimization level ('disabled' keeps the exported nodes)")
+    parser.add_argument('--torch-profiler', action='store_true',
+                       help='Also profile the eager PyTorch model (--model-path, or random weights)')
+    parser.add_argument('--top', type=int, default=15,
+                       help='Rows of the op type and hotspot tables')
+    parser.add_argument('--output-dir', type=str, default='profiles',
+                       help='Directory for the Chrome-trace files')
+
+    args = parser.parse_args()
+
+    if args.horizon < 1:
+        parser.error('--horizon must be at least 1')
+    if args.postprocess_top_k is not None and (args.onnx_model or args.export_mode != 'full'):
+        parser.error('--postprocess-top-k is only supported when exporting a full graph')
+
+    torch.set_num_threads(args.threads)
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path = args.model_path
+        if model_path is None:
+            model_path = str(Path(tmp_dir) / 'random.pth')
+            torch.save(build_model().state_dict(), model_path)
+        model = load_model(model_path, torch.device('cpu'))
+
+        onnx_path = args.onnx_model
+        if onnx_path is None and args.export_mode == 'loop':
+            onnx_path = convert_loop_model_to_onnx(model_path, args.model_type, tmp_dir)
+        elif onnx_path is None:
+            onnx_path = convert_model_to_onnx(model_path, args.model_type, tmp_dir, args.postprocess_top_k)
+        labels = graph_stages(onnx_path)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = args.threads
+        options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[args.graph_optimization]
+        options.enable_profiling = True
+        options.profile_file_prefix = str(Path(tmp_dir) / 'ort-profile')
+        session = ort.InferenceSession(str(onnx_path), sess_options=options, providers=['CPUExecutionProvider'])
+
+        if args.data_dir:
+            src, trg = representative_inputs(args.data_dir, args.batch_size)
+        else:
+            src = dummy_sequence(args.batch_size, **vocab_sizes(model)).numpy()
+            trg = np.zeros((args.batch_size, FORECAST_HORIZON, 4), dtype=np.float32)
+
+        input_names = [graph_input.name for graph_input in session.get_inputs()]
+        loop_graph = 'horizon' in input_names
+        feeds = {'input': src, 'target': trg, 'horizon': np.array(args.horizon, dtype=np.int64)}
+        unsupported = set(input_names) - set(feeds)
+        if unsupported:
+            parser.error(f"cannot feed graph inputs {sorted(unsupported)}; profile a full or loop export")
+        feeds = {name: feeds[name] for name in input_names}
+
+        print(f"🚀 Profiling {onnx_path} ({args.warmup} warmup + {args.runs} runs, batch {args.batch_size}, "
+              f"{args.threads} thread(s), graph optimization {args.graph_optimization})...")
+        for _ in range(args.warmup + args.runs):
+            session.run(None, feeds)
+
+        ort_trace_path = output_dir / f"{Path(onnx_path).stem}-ort-trace.json"
+        shutil.move(session.end_profiling(), ort_trace_path)
+
+    with open(ort_trace_path) as f:
+        ort_totals, wall_us = aggregate_ort_trace(json.load(f), labels, args.warmup)
+    print_report('ONNX Runtime', ort_totals, args.top, wall_us)
+    print(f"✅ Chrome trace written to {ort_trace_path}")
+
+    if args.torch_profiler:
+        torch_trace_path = output_dir / f"{Path(onnx_path).stem}-torch-trace.json"
+        horizon = args.horizon if loop_graph else None
+        torch_totals = profile_eager(model, src, trg, horizon, args.runs, args.warmup, torch_trace_path)
+        print_report('PyTorch eager (self CPU time)', torch_totals, args.top)
+        print(f"✅ Chrome trace written to {torch_trace_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+INT8 quantization of exported Fin-O ONNX models.
+Dynamic mode quantizes weights ahead of time and activations at runtime; static mode
+calibrates activation ranges on a sample of the memory-mapped processed_data/sequences_X.npy.
+Writes fin-o-{type}-int8.onnx next to the fp32 model plus a JSON comparison report.
+"""
+
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import onnx
+import onnxruntime as ort
+from onnx import numpy_helper
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    QuantFormat,
+    QuantType,
+    quant_pre_process,
+    quantize_dynamic,
+    quantize_static,
+)
+
+from convert_pytorch_to_onnx import FORECAST_HORIZON, dummy_sequence
+from optimize_onnx_model import artifact_size
+
+
+def load_processed_data(data_dir: str):
+    """Memory-map sequences_X.npy / sequences_y.npy produced by the training notebook."""
+    x_path = Path(data_dir) / 'sequences_X.npy'
+    y_path = Path(data_dir) / 'sequences_y.npy'
+    if not x_path.exists():
+        return None, None
+
+    sequences_X = np.load(x_path, mmap_mode='r')
+    sequences_y = np.load(y_path, mmap_mode='r') if y_path.exists() else None
+    return sequences_X, sequences_y
+
+
+def split_sample_indices(num_samples: int, calibration_samples: int, eval_samples: int, seed: int = 42):
+    """Disjoint random calibration and held-out index sets, sorted for memmap locality."""
+    rng = np.random.default_rng(seed)
+    permutation = rng.permutation(num_samples)
+    calibration = np.sort(permutation[:calibration_samples])
+    held_out = np.sort(permutation[calibration_samples:calibration_samples + eval_samples])
+    return calibration, held_out
+
+
+def model_feeds(sequences_X, sequences_y, indices):
+    """Inputs for the full teacher-forced graph; targets are zero-filled when unavailable."""
+    inputs = np.asarray(sequences_X[indices], dtype=np.float32)
+    if sequences_y is not None:
+        targets = np.asarray(sequences_y[indices], dtype=np.float32)
+    else:
+        targets = np.zeros((len(indices), FORECAST_HORIZON, 4), dtype=np.float32)
+    return {'input': inputs, 'target': targets}
+
+
+class SequenceCalibrationReader(CalibrationDataReader):
+    """Feeds calibration batches read from the memory-mapped sequence files."""
+
+    def __init__(self, sequences_X, sequences_y, indices, batch_size: int = 32):
+        self.sequences_X = sequences_X
+        self.sequences_y = sequences_y
+        self.batches = [indices[i:i + batch_size] for i in range(0, len(indices), batch_size)]
+        self.position = 0
+
+    def get_next(self):
+        if self.position >= len(self.batches):
+            return None
+        batch = self.batches[self.position]
+        self.position += 1
+        return model_feeds(self.sequences_X, self.sequences_y, batch)
+
+    def rewind(self):
+        self.position = 0
+
+
+def prepare_for_quantization(model: onnx.ModelProto) -> onnx.ModelProto:
+    """Rewrite the exported graph into a form ONNX Runtime's quantizer handles.
+
+    The unrolled decoder reaches its shared LSTM weights through Identity nodes, which hides
+    them from the quantizer, and reuses the same head weights in ten Gemm(transB=1) nodes,
+    which the quantizer would transpose once per node. Identities are bypassed and each
+    shared Gemm weight is transposed exactly once.
+    """
+    graph = model.graph
+    initializers = {init.name: init for init in graph.initializer}
+    graph_outputs = {output.name for output in graph.output}
+
+    aliases = {}
+    for node in graph.node:
+        if node.op_type == 'Identity' and node.input[0] in initializers and node.output[0] not in graph_outputs:
+            aliases[node.output[0]] = node.input[0]
+
+    transposed = {}
+    for node in graph.node:
+        for i, name in enumerate(node.input):
+            if name in aliases:
+                node.input[i] = aliases[name]
+
+        if node.op_type != 'Gemm' or node.input[1] not in initializers:
+            continue
+        trans_b = next((attr for attr in node.attribute if attr.name == 'transB'), None)
+        if trans_b is None or trans_b.i != 1:
+            continue
+        weight_name = node.input[1]
+        if weight_name not in transposed:
+            weight = numpy_helper.to_array(initializers[weight_name]).T.copy()
+            graph.initializer.append(numpy_helper.from_array(weight, f"{weight_name}_transposed"))
+            transposed[weight_name] = f"{weight_name}_transposed"
+        node.input[1] = transposed[weight_name]
+        trans_b.i = 0
+
+    kept = [node for node in graph.node if node.output[0] not in aliases]
+    del graph.node[:]
+    graph.node.extend(kept)
+
+    used = {name for node in graph.node for name in node.input} | graph_outputs
+    unused = [init for init in graph.initializer if init.name not in used]
+    for init in unused:
+        graph.initializer.remove(init)
+    return model
+
+
+def quantize_model(fp32_path: str, int8_path: str, mode: str, calibration_reader: CalibrationDataReader = None):
+    """Quantize fp32_path to int8_path with ONNX Runtime's dynamic or static (QDQ) quantization."""
+    if mode == 'static' and calibration_reader is None:
+        raise ValueError("Static quantization needs calibration data")
+
+    model = prepare_for_quantization(onnx.load(fp32_path))
+    opset = next(entry.version for entry in model.opset_import if entry.domain in ('', 'ai.onnx'))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        prepared_path = Path(tmp_dir) / 'prepared.onnx'
+        onnx.save(model, str(prepared_path))
+
+        if mode == 'dynamic':
+            # Covers the LSTM weights (DynamicQuantizeLSTM) as well as the MatMul heads, as long
+            # as the LSTM weights are initializers
+            quantize_dynamic(str(prepared_path), int8_path, weight_type=QuantType.QInt8)
+            num_lstms = sum(node.op_type == 'LSTM' for node in model.graph.node)
+            quantized = onnx.load(int8_path, load_external_data=False).graph.node
+            num_quantized = sum(node.op_type == 'DynamicQuantizeLSTM' for node in quantized)
+            if num_quantized != num_lstms:
+                raise RuntimeError(f"Only {num_quantized} of {num_lstms} LSTM nodes were quantized; "
+                                   "export the model with convert_pytorch_to_onnx.py so the LSTM "
+                                   "weights are initializers")
+            return
+
+        preprocessed_path = Path(tmp_dir) / 'preprocessed.onnx'
+        quant_pre_process(str(prepared_path), str(preprocessed_path), skip_symbolic_shape=True)
+        # QDQ has no LSTM support, so static mode quantizes the MatMul heads and leaves the
+        # LSTMs in fp32. Per-channel scales need DequantizeLinear's axis attribute (opset 13+).
+        quantize_static(
+            str(preprocessed_path),
+            int8_path,
+            calibration_reader,
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=opset >= 13,
+        )
+
+
+def create_session(model_path: str, intra_op_threads: int = 0) -> ort.InferenceSession:
+    session_options = ort.SessionOptions()
+    session_options.intra_op_num_threads = intra_op_threads
+    return ort.InferenceSession(str(model_path), sess_options=session_options,
+                                providers=['CPUExecutionProvider'])
+
+
+def measure_latency(session: ort.InferenceSession, feeds: dict, runs: int = 100, warmup: int = 10):
+    """p50/p99 wall-clock latency of session.run in milliseconds."""
+    for _ in range(warmup):
+        session.run(None, feeds)
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        session.run(None, feeds)
+        timings.append((time.perf_counter() - start) * 1e3)
+
+    return {
+        'p50_ms': float(np.percentile(timings, 50)),
+        'p99_ms': float(np.percentile(timings, 99)),
+    }
+
+
+def evaluate_accuracy(session: ort.InferenceSession, sequences_X, sequences_y, indices, batch_size: int = 256):
+    """Amount MAE (scaled units) and category/merchant top-1 accuracy on the held-out slice."""
+    abs_error_sum = 0.0
+    category_correct = 0
+    merchant_correct = 0
+    count = 0
+
+    for start in range(0, len(indices), batch_size):
+        batch = indices[start:start + batch_size]
+        feeds = model_feeds(sequences_X, sequences_y, batch)
+        amount, category, merchant = session.run(None, feeds)
+        targets = feeds['target']
+
+        abs_error_sum += float(np.abs(amount[..., 0] - targets[..., 0]).sum())
+        category_correct += int((category.argmax(-1) == targets[..., 1].astype(np.int64)).sum())
+        merchant_correct += int((merchant.argmax(-1) == targets[..., 2].astype(np.int64)).sum())
+        count += targets.shape[0] * targets.shape[1]
+
+    return {
+        'amount_mae': abs_error_sum / count,
+        'category_top1': category_correct / count,
+        'merchant_top1': merchant_correct / count,
+    }
+
+
+def quantize_and_report(fp32_path: str, model_type: str, output_dir: str, mode: str,
+                        data_dir: str = 'processed_data', calibration_samples: int = 512,
+                        eval_samples: int = 2048, latency_runs: int = 100):
+    """Write fin-o-{type}-int8.onnx and fin-o-{type}-int8-report.json next to the fp32 model."""
+    int8_path = Path(output_dir) / f"fin-o-{model_type}-int8.onnx"
+    report_path = Path(output_dir) / f"fin-o-{model_type}-int8-report.json"
+
+    sequences_X, sequences_y = load_processed_data(data_dir)
+    if sequences_X is not None:
+        calibration_indices, held_out_indices = split_sample_indices(
+            len(sequences_X), calibration_samples, eval_samples
+        )
+    elif mode == 'static':
+        raise FileNotFoundError(f"Static quantization needs {Path(data_dir) / 'sequences_X.npy'}")
+    else:
+        print(f"⚠️  No processed data in {data_dir}, skipping the accuracy comparison")
+
+    print(f"🔄 Quantizing ({mode}) {fp32_path} -> {int8_path}...")
+
+    calibration_reader = None
+    if mode == 'static':
+        calibration_reader = SequenceCalibrationReader(sequences_X, sequences_y, calibration_indices)
+    quantize_model(str(fp32_path), str(int8_path), mode, calibration_reader)
+
+    print(f"✅ Quantized model written to {int8_path}")
+
+    fp32_session = create_session(fp32_path)
+    int8_session = create_session(int8_path)
+
+    if sequences_X is not None:
+        latency_feeds = model_feeds(sequences_X, sequences_y, held_out_indices[:1])
+    else:
+        latency_feeds = {
+            'input': dummy_sequence().numpy(),
+            'target': np.zeros((1, FORECAST_HORIZON, 4), dtype=np.float32),
+        }
+
+    report = {
+        'model_type': model_type,
+        'mode': mode,
+        'fp32': {
+            'path': str(fp32_path),
+            'size_bytes': artifact_size(Path(fp32_path)),
+            'latency': measure_latency(fp32_session, latency_feeds, runs=latency_runs),
+        },
+        'int8': {
+            'path': str(int8_path),
+            'size_bytes': artifact_size(int8_path),
+            'latency': measure_latency(int8_session, latency_feeds, runs=latency_runs),
+        },
+    }
+    if calibration_reader is not None:
+        report['calibration_samples'] = len(calibration_indices)
+
+    if sequences_X is not None and sequences_y is not None:
+        report['held_out_samples'] = len(held_out_indices)
+        report['fp32']['accuracy'] = evaluate_accuracy(fp32_session, sequences_X, sequences_y, held_out_indices)
+        report['int8']['accuracy'] = evaluate_accuracy(int8_session, sequences_X, sequences_y, held_out_indices)
+        report['shift'] = {
+            metric: report['int8']['accuracy'][metric] - report['fp32']['accuracy'][metric]
+            for metric in report['fp32']['accuracy']
+        }
+
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    size_ratio = report['fp32']['size_bytes'] / report['int8']['size_bytes']
+    print(f"✅ Report written to {report_path}")
+    print(f"   Size: {report['fp32']['size_bytes'] / 1e6:.1f} MB -> "
+          f"{report['int8']['size_bytes'] / 1e6:.1f} MB ({size_ratio:.1f}x smaller)")
+    print(f"   p50 latency: {report['fp32']['latency']['p50_ms']:.2f} ms -> "
+          f"{report['int8']['latency']['p50_ms']:.2f} ms")
+    if 'shift' in report:
+        print(f"   Shift: {report['shift']}")
+
+    return int8_path, report
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Reference runner for the split Fin-O ONNX export (encoder + single decoder step).
+Runs the same greedy autoregressive loop as Seq2Seq.predict in the training notebook,
+using ONNX Runtime, and can check the result against the PyTorch model.
+"""
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import onnxruntime as ort
+
+
+def load_split_sessions(model_dir: str, model_type: str, session_options: ort.SessionOptions = None):
+    """Create ONNX Runtime sessions for fin-o-{type}-encoder.onnx and fin-o-{type}-decoder-step.onnx."""
+    encoder_path = Path(model_dir) / f"fin-o-{model_type}-encoder.onnx"
+    decoder_path = Path(model_dir) / f"fin-o-{model_type}-decoder-step.onnx"
+
+    providers = ['CPUExecutionProvider']
+    encoder_session = ort.InferenceSession(str(encoder_path), sess_options=session_options, providers=providers)
+    decoder_session = ort.InferenceSession(str(decoder_path), sess_options=session_options, providers=providers)
+    return encoder_session, decoder_session
+
+
+def encode(encoder_session: ort.InferenceSession, src: np.ndarray):
+    """Run the encoder once and return its (hidden, cell) state."""
+    hidden, cell = encoder_session.run(['hidden', 'cell'], {'input': src.astype(np.float32)})
+    return hidden, cell
+
+
+def initial_decoder_input(src: np.ndarray) -> np.ndarray:
+    """Amount, category and merchant of the last known transaction."""
+    return src[:, -1, [0, 2, 3]].astype(np.float32)
+
+
+def decode(decoder_session: ort.InferenceSession, decoder_input: np.ndarray, hidden: np.ndarray,
+           cell: np.ndarray, forecast_horizon: int):
+    """Greedy decoding from a given state; returns (amount, category, merchant, hidden, cell)."""
+    outputs_amount, outputs_category, outputs_merchant = [], [], []
+
+    for _ in range(forecast_horizon):
+        pred_amount, pred_category, pred_merchant, hidden, cell = decoder_session.run(
+            None, {'x_t': decoder_input, 'hidden': hidden, 'cell': cell}
+        )
+
+        outputs_amount.append(pred_amount)
+        outputs_category.append(pred_category)
+        outputs_merchant.append(pred_merchant)
+
+        # Feed the current prediction back in as the next decoder input
+        decoder_input = np.concatenate([
+            pred_amount,
+            pred_category.argmax(axis=1)[:, None].astype(np.float32),
+            pred_merchant.argmax(axis=1)[:, None].astype(np.float32),
+        ], axis=1)
+
+    return (
+        np.stack(outputs_amount, axis=1),
+        np.stack(outputs_category, axis=1),
+        np.stack(outputs_merchant, axis=1),
+        hidden,
+        cell,
+    )
+
+
+def greedy_forecast(encoder_session: ort.InferenceSession, decoder_session: ort.InferenceSession,
+                    src: np.ndarray, forecast_horizon: int):
+    """ONNX Runtime equivalent of Seq2Seq.predict: returns (amount, category, merchant) outputs."""
+    hidden, cell = encode(encoder_session, src)
+    amount, category, merchant, _, _ = decode(
+        decoder_session, initial_decoder_input(src), hidden, cell, forecast_horizon
+    )
+    return amount, category, merchant
+
+
+def verify_against_pytorch(model_path: str, encoder_session, decoder_session, batch_size: int,
+                           forecast_horizon: int, atol: float = 1e-4):
+    """Compare the ONNX greedy loop with Seq2Seq.predict on random input.
+
+    Raises ValueError if the checkpoint cannot be loaded, since random weights would
+    never match the exported ones.
+    """
+    import torch
+    from convert_pytorch_to_onnx import dummy_sequence, load_checkpoint, model_from_state_dict, vocab_sizes
+
+    device = torch.device('cpu')
+    state_dict, architecture = load_checkpoint(model_path, device)
+    if state_dict is None:
+        raise ValueError(f"cannot load checkpoint {model_path} to verify against")
+    model = model_from_state_dict(state_dict, architecture, device).eval()
+    print(f"✅ Loaded model weights from {model_path}")
+    src = dummy_sequence(batch_size, **vocab_sizes(model))
+
+    torch_outputs = model.predict(src, forecast_horizon)
+    onnx_outputs = greedy_forecast(encoder_session, decoder_session, src.numpy(), forecast_horizon)
+
+    ok = True
+    for name, expected, actual in zip(['amount', 'category', 'merchant'], torch_outputs, onnx_outputs):
+        max_diff = float(np.abs(expected.numpy() - actual).max())
+        status = "✅" if max_diff <= atol else "❌"
+        ok = ok and max_diff <= atol
+        print(f"{status} {name}: max abs diff {max_diff:.2e}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the split Fin-O ONNX models with greedy decoding')
+    parser.add_argument('--model-type', choices=['small', 'large'], required=True,
+                       help='Type of model to run')
+    parser.add_argument('--model-dir', type=str, default='public/model',
+                       help='Directory containing the split ONNX files')
+    parser.add_argument('--horizon', type=int, default=10,
+                       help='Number of decoder steps to run')
+    parser.add_argument('--batch-size', type=int, default=1,
+                       help='Batch size of the random input')
+    parser.add_argument('--verify', type=str, default=None, metavar='MODEL_PATH',
+                       help='Compare against Seq2Seq.predict using this PyTorch checkpoint')
+
+    args = parser.parse_args()
+
+    encoder_session, decoder_session = load_split_sessions(args.model_dir, args.model_type)
+
+    if args.verify is not None:
+        try:
+            ok = verify_against_pytorch(args.verify, encoder_session, decoder_session,
+                                        args.batch_size, args.horizon)
+        except ValueError as e:
+            print(f"❌ {e}")
+            raise SystemExit(1)
+        raise SystemExit(0 if ok else 1)
+
+    from convert_pytorch_to_onnx import dummy_sequence
+
+    src = dummy_sequence(args.batch_size).numpy()
+    amount, category, merchant = greedy_forecast(encoder_session, decoder_session, src, args.horizon)
+
+    for t in range(args.horizon):
+        print(f"  - Step {t+1}: amount (scaled) {amount[0, t, 0]:.4f}, "
+              f"category {int(category[0, t].argmax())}, merchant {int(merchant[0, t].argmax())}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Local micro-batching scoring service for exported Fin-O ONNX models.
+Keeps one ONNX Runtime session per model variant and gathers concurrent requests into
+dynamic micro-batches (bounded by a max batch size and a max wait), using the dynamic
+batch_size axis of the exported graphs. Serves JSON over HTTP or a Unix socket.
+
+    POST /predict/<variant>   {"input": [[14 features] x 50]}
+    GET  /metrics             queue depth, batch size and latency histograms
+"""
+
+import argparse
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import onnxruntime as ort
+
+
+class Histogram:
+    """Fixed-bucket histogram; bucket i counts values <= bounds[i], the last bucket the rest."""
+
+    def __init__(self, bounds):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = int(np.searchsorted(self.bounds, value))
+        with self.lock:
+            self.counts[index] += 1
+            self.total += 1
+            self.sum += value
+
+    def to_dict(self):
+        with self.lock:
+            labels = [f"<={bound}" for bound in self.bounds] + [f">{self.bounds[-1]}"]
+            return {
+                'buckets': dict(zip(labels, self.counts)),
+                'count': self.total,
+                'mean': self.sum / self.total if self.total else 0.0,
+            }
+
+
+class PendingRequest:
+    __slots__ = ('input', 'future', 'enqueued_at')
+
+    def __init__(self, model_input: np.ndarray):
+        self.input = model_input
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """Runs one ONNX Runtime session and serves queued requests in dynamic micro-batches."""
+
+    def __init__(self, model_path: str, max_batch_size: int = 64, max_wait_ms: float = 2.0,
+                 intra_op_threads: int = 0, inter_op_threads: int = 0):
+        session_options = ort.SessionOptions()
+        session_options.intra_op_num_threads = intra_op_threads
+        session_options.inter_op_num_threads = inter_op_threads
+        self.session = ort.InferenceSession(model_path, sess_options=session_options,
+                                            providers=['CPUExecutionProvider'])
+        self.output_names = [output.name for output in self.session.get_outputs()]
+        inputs = {model_input.name: model_input for model_input in self.session.get_inputs()}
+        unsupported = sorted(set(inputs) - {'input', 'target'})
+        if 'input' not in inputs or unsupported:
+            raise ValueError(f"{model_path} takes inputs {sorted(inputs)}; only graphs with an 'input' "
+                             f"(and optionally 'target') input can be served, such as the full export")
+        self.input_shape = tuple(inputs['input'].shape[1:])
+
+        # The full export also takes a teacher-forcing target; like FinOModel.runInference,
+        # serve it zero-filled
+        self.extra_inputs = {name: list(model_input.shape[1:]) for name, model_input in inputs.items()
+                             if name != 'input'}
+
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1e3
+        self.requests = queue.Queue()
+
+        self.batch_sizes = Histogram([1, 2, 4, 8, 16, 32, 64, 128, 256, 512])
+        self.queue_depths = Histogram([0, 1, 2, 4, 8, 16, 32, 64, 128, 256])
+        self.latencies_ms = Histogram([1, 2, 5, 10, 20, 50, 100, 200, 500, 1000])
+
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, model_input: np.ndarray) -> Future:
+        """Queue one (sequence_length, 14) input; the future resolves to this request's outputs."""
+        model_input = np.asarray(model_input, dtype=np.float32)
+        # Reject malformed inputs here, before they can fail a whole micro-batch
+        if model_input.shape != self.input_shape:
+            raise ValueError(f"Expected input of shape {self.input_shape}, got {model_input.shape}")
+
+        request = PendingRequest(model_input)
+        self.requests.put(request)
+        return request.future
+
+    def _collect_batch(self):
+        batch = [self.requests.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            self.queue_depths.observe(self.requests.qsize())
+            self.batch_sizes.observe(len(batch))
+
+            try:
+                feeds = {'input': np.stack([request.input for request in batch])}
+                for name, shape in self.extra_inputs.items():
+                    feeds[name] = np.zeros([len(batch)] + shape, dtype=np.float32)
+                outputs = self.session.run(self.output_names, feeds)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            now = time.perf_counter()
+            for i, request in enumerate(batch):
+                request.future.set_result({name: output[i] for name, output in zip(self.output_names, outputs)})
+                self.latencies_ms.observe((now - request.enqueued_at) * 1e3)
+
+    def metrics(self):
+        return {
+            'queue_depth': self.queue_depths.to_dict(),
+            'batch_size': self.batch_sizes.to_dict(),
+            'latency_ms': self.latencies_ms.to_dict(),
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1e3,
+        }
+
+
+def format_prediction(outputs: dict):
+    """Amount and category/merchant prediction for each forecast step.
+
+    Graphs exported with --postprocess-top-k already return unscaled amounts and
+    top-k IDs and probabilities, which are passed through.
+    """
+    if 'category_topk_ids' in outputs:
+        return {
+            'amount': outputs['amount'].tolist(),
+            'category_id': outputs['category_topk_ids'][..., 0].tolist(),
+            'category_topk_ids': outputs['category_topk_ids'].tolist(),
+            'category_topk_probs': outputs['category_topk_probs'].tolist(),
+            'merchant_id': outputs['merchant_topk_ids'][..., 0].tolist(),
+            'merchant_topk_ids': outputs['merchant_topk_ids'].tolist(),
+            'merchant_topk_probs': outputs['merchant_topk_probs'].tolist(),
+        }
+    return {
+        'amount': outputs['amount_output'][:, 0].tolist(),
+        'category_id': outputs['category_output'].argmax(-1).tolist(),
+        'merchant_id': outputs['merchant_output'].argmax(-1).tolist(),
+    }
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    batchers = {}
+
+    def _send_json(self, status: int, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self._send_json(200, {name: batcher.metrics() for name, batcher in self.batchers.items()})
+        else:
+            self._send_json(404, {'error': f'Unknown path {self.path}'})
+
+    def do_POST(self):
+        variant = self.path.rsplit('/', 1)[-1]
+        batcher = self.batchers.get(variant)
+        if not self.path.startswith('/predict/') or batcher is None:
+            self._send_json(404, {'error': f'Unknown model variant {variant!r}'})
+            return
+
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            outputs = batcher.submit(payload['input']).result()
+        except (KeyError, ValueError) as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+            return
+
+        self._send_json(200, format_prediction(outputs))
+
+    def address_string(self):
+        # Unix socket clients have no (host, port) address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class ThreadingTCPHTTPServer(ThreadingHTTPServer):
+    request_queue_size = 128
+
+
+def create_server(batchers: dict, host: str = '127.0.0.1', port: int = 8000, unix_socket: str = None):
+    """HTTP server dispatching /predict/<variant> to the given micro-batchers."""
+    handler = type('Handler', (PredictionHandler,), {'batchers': batchers})
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.unlink(unix_socket)
+        return ThreadingUnixHTTPServer(unix_socket, handler)
+    return ThreadingTCPHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-batching scoring service for Fin-O ONNX models')
+    parser.add_argument('--model', action='append', required=True, metavar='VARIANT=PATH',
+                       help='Model variant to serve, e.g. small=public/model/fin-o-small.onnx (repeatable)')
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                       help='Host to listen on')
+    parser.add_argument('--port', type=int, default=8000,
+                       help='Port to listen on')
+    parser.add_argument('--unix-socket', type=str, default=None,
+                       help='Listen on this Unix socket instead of TCP')
+    parser.add_argument('--max-batch-size', type=int, default=64,
+                       help='Largest micro-batch passed to session.run (1 disables batching)')
+    parser.add_argument('--max-wait-ms', type=float, default=2.0,
+                       help='How long the first request of a batch waits for more requests')
+    parser.add_argument('--intra-op-threads', type=int, default=0,
+                       help='ONNX Runtime intra-op threads per session (0: runtime default)')
+    parser.add_argument('--inter-op-threads', type=int, default=0,
+                       help='ONNX Runtime inter-op threads per session (0: runtime default)')
+
+    args = parser.parse_args()
+
+    batchers = {}
+    for spec in args.model:
+        variant, model_path = spec.split('=', 1)
+        batchers[variant] = MicroBatcher(model_path, args.max_batch_size, args.max_wait_ms,
+                                         args.intra_op_threads, args.inter_op_threads)
+        print(f"✅ Loaded {variant} from {model_path}")
+
+    server = create_server(batchers, args.host, args.port, args.unix_socket)
+    address = args.unix_socket or f"http://{args.host}:{args.port}"
+    print(f"🚀 Serving {', '.join(batchers)} on {address} "
+          f"(max batch {args.max_batch_size}, max wait {args.max_wait_ms} ms)")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
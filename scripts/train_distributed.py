@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Data-parallel Fin-O training with DistributedDataParallel over the gloo backend.
+Runs the train_fin_o.py loop on every rank with a DistributedSampler over the
+train/validation split. Validation loss is all-reduced; only rank 0 steps
+ReduceLROnPlateau, decides on early stopping and writes checkpoints, and broadcasts
+the learning rate and stop decision to the other ranks.
+
+Local processes on one host:   python scripts/train_distributed.py --nproc 4 ...
+Several hosts:                 torchrun --nnodes 2 --nproc-per-node 4 ... scripts/train_distributed.py ...
+Scaling report:                python scripts/train_distributed.py --scaling 1 2 4 --limit-batches 20 ...
+"""
+
+import argparse
+import json
+import os
+import socket
+import tempfile
+import time
+from pathlib import Path
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+import torch.nn as nn
+from torch.nn.parallel import DistributedDataParallel
+from torch.optim.lr_scheduler import ReduceLROnPlateau
+from torch.utils.data.distributed import DistributedSampler
+
+from convert_pytorch_to_onnx import build_model, load_checkpoint
+from train_fin_o import (
+    EARLY_STOPPING_PATIENCE,
+    TrainingModel,
+    TrainingOptions,
+    add_training_arguments,
+    apply_performance_shorthands,
+    load_datasets,
+    load_vocab_sizes,
+    numa_worker_init,
+    save_model,
+    train_model,
+    validate_model,
+)
+from window_dataset import batched_dataloader
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def all_reduce_sum(*values):
+    """Sum floats across all ranks."""
+    tensor = torch.tensor(values, dtype=torch.float64)
+    dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor.tolist()
+
+
+def run_training(rank: int, world_size: int, args, local_world_size: int = None, results_path: str = None):
+    """Training loop of one rank; MASTER_ADDR / MASTER_PORT must be set in the environment."""
+    dist.init_process_group('gloo', rank=rank, world_size=world_size)
+    is_main = rank == 0
+    local_world_size = local_world_size or world_size
+
+    torch.set_num_threads(args.threads or max(1, (os.cpu_count() or 1) // local_world_size))
+    device = torch.device('cpu')
+    options = TrainingOptions(args.bf16, args.accumulation_steps, args.limit_batches)
+
+    # --batch-size stays the effective batch size of one optimizer step across all ranks
+    rank_batch_size = max(1, args.batch_size // world_size)
+
+    train_dataset, val_dataset = load_datasets(args.data_dir)
+    train_sampler = DistributedSampler(train_dataset, world_size, rank, shuffle=True, seed=42)
+    val_sampler = DistributedSampler(val_dataset, world_size, rank, shuffle=False)
+    worker_init_fn = numa_worker_init if args.numa_workers else None
+    train_dataloader = batched_dataloader(train_dataset, rank_batch_size, shuffle=True, num_workers=args.num_workers,
+                                          sampler=train_sampler, worker_init_fn=worker_init_fn)
+    val_dataloader = batched_dataloader(val_dataset, rank_batch_size, shuffle=False, num_workers=args.num_workers,
+                                        sampler=val_sampler, worker_init_fn=worker_init_fn)
+
+    if is_main:
+        print(f"🚀 Training Fin-O on {world_size} rank(s), {torch.get_num_threads()} threads each, "
+              f"batch {rank_batch_size} per rank ({rank_batch_size * world_size} per step)")
+        print(f"📊 Training samples: {len(train_dataset):,}, validation samples: {len(val_dataset):,}")
+
+    vocab_sizes = load_vocab_sizes(args.data_dir)
+    model = build_model(device, vocab_size_cat=vocab_sizes['categories'], vocab_size_merch=vocab_sizes['merchants'])
+    if args.resume:
+        model.load_state_dict(load_checkpoint(args.resume, device)[0])
+    if args.compile:
+        model.encoder.compile()
+        model.decoder.compile()
+
+    # DDP broadcasts rank 0's initial weights to every other rank
+    training_model = DistributedDataParallel(TrainingModel(model, args.fused_decoder))
+
+    optimizer = torch.optim.Adam(model.parameters(), lr=args.learning_rate)
+    scheduler = ReduceLROnPlateau(optimizer, mode='min', factor=0.1, patience=2, threshold=0.01)
+    criterion_h = nn.HuberLoss()
+    criterion_ce = nn.CrossEntropyLoss()
+
+    best_val_loss = float('inf')
+    epochs_no_improve = 0
+    total_samples = 0
+    total_train_time = 0.0
+
+    for epoch in range(args.epochs):
+        train_sampler.set_epoch(epoch)
+
+        dist.barrier()
+        start = time.perf_counter()
+        avg_loss, samples = train_model(training_model, train_dataloader, optimizer, criterion_h, criterion_ce,
+                                        device, epoch, args.epochs, options, verbose=is_main)
+        dist.barrier()
+        train_time = time.perf_counter() - start
+
+        local_val_loss = validate_model(training_model.module, val_dataloader, criterion_h, criterion_ce,
+                                        device, options)
+        val_batches = options.num_batches(val_dataloader)
+        loss_sum, samples, val_loss_sum, val_batches = all_reduce_sum(
+            avg_loss, samples, local_val_loss * val_batches, val_batches
+        )
+        avg_loss = loss_sum / world_size
+        avg_val_loss = val_loss_sum / max(val_batches, 1)
+
+        total_samples += samples
+        total_train_time += train_time
+
+        # Only rank 0 schedules; every rank then adopts its learning rate and stop decision
+        decision = torch.zeros(2, dtype=torch.float64)
+        if is_main:
+            scheduler.step(avg_val_loss)
+
+            if avg_val_loss < best_val_loss:
+                best_val_loss = avg_val_loss
+                epochs_no_improve = 0
+            else:
+                epochs_no_improve += 1
+
+            print(f"📊 Epoch {epoch+1}/{args.epochs} -> loss {avg_loss:.4f}, validation loss {avg_val_loss:.4f} | "
+                  f"train {train_time:.1f}s ({samples / train_time:,.0f} samples/s)")
+            save_model(model.state_dict(), epoch, args.output_dir, args.gcs_bucket, args.checkpoint_format)
+
+            decision[0] = optimizer.param_groups[0]['lr']
+            decision[1] = float(epochs_no_improve >= EARLY_STOPPING_PATIENCE)
+
+        dist.broadcast(decision, src=0)
+        for param_group in optimizer.param_groups:
+            param_group['lr'] = float(decision[0])
+
+        if decision[1]:
+            if is_main:
+                print(f"⚠️  Early stopping triggered after {epoch+1} epochs.")
+            break
+
+    if is_main:
+        print(f"✅ Training complete, best validation loss: {best_val_loss:.4f}")
+        if results_path:
+            with open(results_path, 'w') as f:
+                json.dump({'world_size': world_size, 'samples': total_samples,
+                           'train_seconds': total_train_time}, f)
+
+    dist.destroy_process_group()
+
+
+def launch_local(nproc: int, args, results_path: str = None):
+    """Run nproc ranks as local processes."""
+    os.environ['MASTER_ADDR'] = '127.0.0.1'
+    os.environ['MASTER_PORT'] = str(free_port())
+    mp.spawn(run_training, args=(nproc, args, nproc, results_path), nprocs=nproc, join=True)
+
+
+def scaling_report(world_sizes, args):
+    """Train with each number of local ranks and report samples/second and scaling efficiency."""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for world_size in world_sizes:
+            print(f"🔄 Running with {world_size} rank(s)...")
+            results_path = Path(tmp_dir) / f"world-{world_size}.json"
+            launch_local(world_size, args, str(results_path))
+            with open(results_path) as f:
+                result = json.load(f)
+            results[world_size] = result['samples'] / result['train_seconds']
+
+    baseline_size = world_sizes[0]
+    print("📊 Scaling (samples/s):")
+    for world_size, samples_per_second in results.items():
+        speedup = samples_per_second / results[baseline_size]
+        efficiency = speedup / (world_size / baseline_size)
+        print(f"   {world_size:>3} rank(s) {samples_per_second:10.1f}  {speedup:5.2f}x  {efficiency:6.1%} efficiency")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Data-parallel Fin-O training with DDP over gloo')
+    add_training_arguments(parser)
+    parser.add_argument('--nproc', type=int, default=2,
+                       help='Number of local ranks to start (ignored under torchrun)')
+    parser.add_argument('--scaling', type=int, nargs='+', default=None, metavar='N',
+                       help='Report samples/s scaling over these numbers of local ranks')
+
+    args = apply_performance_shorthands(parser.parse_args())
+
+    if args.scaling:
+        scaling_report(args.scaling, args)
+    elif 'RANK' in os.environ and 'WORLD_SIZE' in os.environ:
+        # Started by torchrun, which also provides MASTER_ADDR / MASTER_PORT
+        run_training(int(os.environ['RANK']), int(os.environ['WORLD_SIZE']), args,
+                     int(os.environ.get('LOCAL_WORLD_SIZE', os.environ['WORLD_SIZE'])))
+    else:
+        launch_local(args.nproc, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Training entry point for the Fin-O Seq2Seq model.
+Runs the training loop of model/model.ipynb (train_model / validate_model / save_model,
+ReduceLROnPlateau and early stopping) on the window-index dataset or the legacy
+sequences_X.npy / sequences_y.npy files. An opt-in performance mode for CPU-only hosts adds
+torch.compile, bf16 autocast, thread tuning, NUMA-aware DataLoader workers and gradient
+accumulation, and every epoch logs samples/second so runs can be compared.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
+import numpy as np
+import torch
+import torch.nn as nn
+from sklearn.model_selection import train_test_split
+from torch.optim.lr_scheduler import ReduceLROnPlateau
+
+from convert_pytorch_to_onnx import (
+    build_model,
+    checkpoint_architecture,
+    load_checkpoint,
+    next_decoder_input,
+    scheduled_sampling_mask,
+)
+from checkpoint_format import save_tensor_file
+from window_dataset import BatchedSequenceDataset, BatchedWindowDataset, batched_dataloader
+
+BATCH_SIZE = 2048
+LEARNING_RATE = 0.003
+NUM_EPOCHS = 10
+TEACHER_FORCING_RATIO = 0.5
+EARLY_STOPPING_PATIENCE = 3
+
+
+def notebook_forward(model, src, trg, teacher_forcing_ratio=TEACHER_FORCING_RATIO):
+    """Seq2Seq.forward as trained in model/model.ipynb.
+
+    The exported Seq2Seq.forward always teacher-forces; training flips a coin per step
+    between the ground truth and the model's own previous prediction.
+    """
+    hidden, cell = model.encoder(src)
+    decoder_input = trg[:, 0, :3]
+
+    outputs_amount, outputs_category, outputs_merchant = [], [], []
+    for t in range(trg.shape[1]):
+        pred_amount, pred_category, pred_merchant, hidden, cell = model.decoder(decoder_input, hidden, cell)
+
+        outputs_amount.append(pred_amount)
+        outputs_category.append(pred_category)
+        outputs_merchant.append(pred_merchant)
+
+        if random.random() < teacher_forcing_ratio:
+            decoder_input = trg[:, t, :3]
+        else:
+            decoder_input = next_decoder_input(pred_amount, pred_category, pred_merchant)
+
+    return torch.stack(outputs_amount, 1), torch.stack(outputs_category, 1), torch.stack(outputs_merchant, 1)
+
+
+def compute_loss(outputs, y_batch, criterion_h, criterion_ce):
+    """Combined loss of the notebook (the amount term is weighted 0)."""
+    pred_amount, pred_category, pred_merchant = outputs
+    loss_amount = criterion_h(pred_amount.squeeze(-1).float(), y_batch[:, :, 0])
+    loss_category = criterion_ce(
+        pred_category.reshape(-1, pred_category.shape[-1]).float(),
+        y_batch[:, :, 1].reshape(-1).long()
+    )
+    loss_merchant = criterion_ce(
+        pred_merchant.reshape(-1, pred_merchant.shape[-1]).float(),
+        y_batch[:, :, 2].reshape(-1).long()
+    )
+    return loss_amount * 0.0 + loss_category * 0.5 + loss_merchant * 0.4
+
+
+class TrainingModel(nn.Module):
+    """Seq2Seq with its training-time forward as forward(), so it can be wrapped in DistributedDataParallel.
+
+    In training mode, fused_decoder uses Seq2Seq.forward_fused with parallel scheduled
+    sampling instead of the notebook's step loop. Evaluation always runs the step loop.
+    """
+
+    def __init__(self, seq2seq, fused_decoder: bool = False):
+        super().__init__()
+        self.model = seq2seq
+        self.fused_decoder = fused_decoder
+
+    def forward(self, src, trg, teacher_forcing_ratio=TEACHER_FORCING_RATIO):
+        if self.fused_decoder and self.training:
+            mask = scheduled_sampling_mask(src.shape[0], trg.shape[1], teacher_forcing_ratio, src.device)
+            return self.model.forward_fused(src, trg, mask)
+        return notebook_forward(self.model, src, trg, teacher_forcing_ratio)
+
+
+class TrainingOptions:
+    """Performance settings of the training loop; the defaults reproduce the notebook."""
+
+    def __init__(self, bf16: bool = False, accumulation_steps: int = 1, limit_batches: int = None):
+        self.bf16 = bf16
+        self.accumulation_steps = accumulation_steps
+        self.limit_batches = limit_batches
+
+    def autocast(self, device: torch.device):
+        return torch.autocast(device.type, dtype=torch.bfloat16, enabled=self.bf16)
+
+    def num_batches(self, dataloader) -> int:
+        return len(dataloader) if self.limit_batches is None else min(len(dataloader), self.limit_batches)
+
+
+def train_model(model, dataloader, optimizer, criterion_h, criterion_ce, device, epoch, num_epochs,
+                options: TrainingOptions = None, verbose: bool = True, loss_fn=None):
+    """One training epoch of a TrainingModel (optionally DDP-wrapped); returns (average loss, samples seen).
+
+    With gradient accumulation each loaded batch is split into micro-batches whose gradients
+    are summed before a single optimizer step, so the effective batch size is unchanged
+    while activation memory shrinks by the number of accumulation steps.
+    loss_fn(outputs, y_batch) replaces compute_loss for models with other outputs.
+    """
+    options = options or TrainingOptions()
+    if loss_fn is None:
+        def loss_fn(outputs, y_batch):
+            return compute_loss(outputs, y_batch, criterion_h, criterion_ce)
+    model.train()
+    epoch_loss = 0.0
+    samples = 0
+    batches = 0
+    num_batches = options.num_batches(dataloader)
+
+    for i, (X_batch, y_batch) in enumerate(dataloader):
+        if i >= num_batches:
+            break
+        X_batch = X_batch.to(device, non_blocking=True)
+        y_batch = y_batch.to(device, non_blocking=True)
+
+        optimizer.zero_grad()
+        batch_loss = 0.0
+
+        micro_batches = list(zip(X_batch.chunk(options.accumulation_steps),
+                                 y_batch.chunk(options.accumulation_steps)))
+        for j, (X_micro, y_micro) in enumerate(micro_batches):
+            # Under DDP, only the last micro-batch all-reduces the accumulated gradients
+            is_last = j == len(micro_batches) - 1
+            sync = nullcontext() if is_last or not hasattr(model, 'no_sync') else model.no_sync()
+
+            with sync:
+                with options.autocast(device):
+                    outputs = model(X_micro, y_micro)
+                    loss = loss_fn(outputs, y_micro) * (len(X_micro) / len(X_batch))
+
+                loss.backward()
+            batch_loss += loss.item()
+
+        torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=2.0)
+        optimizer.step()
+
+        epoch_loss += batch_loss
+        samples += len(X_batch)
+        batches += 1
+
+        if verbose:
+            print(f"\rEpoch {epoch+1}/{num_epochs} | Batch {int((i+1)/num_batches*100)}% | Loss: {batch_loss:.4f}", end="")
+
+    if verbose:
+        print()
+    return epoch_loss / max(batches, 1), samples
+
+
+def validate_model(model, dataloader, criterion_h, criterion_ce, device,
+                   options: TrainingOptions = None):
+    """Free-running validation loss (teacher_forcing_ratio=0) of a TrainingModel, as in the notebook."""
+    options = options or TrainingOptions()
+    model.eval()
+    total_loss = 0.0
+    num_batches = options.num_batches(dataloader)
+
+    with torch.no_grad():
+        for i, (X_batch, y_batch) in enumerate(dataloader):
+            if i >= num_batches:
+                break
+            X_batch, y_batch = X_batch.to(device), y_batch.to(device)
+
+            with options.autocast(device):
+                outputs = model(X_batch, y_batch, teacher_forcing_ratio=0)
+                total_loss += compute_loss(outputs, y_batch, criterion_h, criterion_ce).item()
+
+    return total_loss / max(num_batches, 1)
+
+
+def save_model(model_state_dict, epoch, output_dir: str = 'model', bucket_name: str = None,
+               checkpoint_format: str = 'torch'):
+    """Save the epoch's weights locally and optionally upload them to GCS.
+
+    checkpoint_format 'safetensors' writes the memory-mapped format of checkpoint_format.py
+    with the architecture in its header instead of a torch.save pickle.
+    """
+    local_save_dir = Path(output_dir)
+    local_save_dir.mkdir(parents=True, exist_ok=True)
+    suffix = '.safetensors' if checkpoint_format == 'safetensors' else '.pth'
+    local_model_path = local_save_dir / f'model_epoch_{epoch+1}{suffix}'
+    if checkpoint_format == 'safetensors':
+        save_tensor_file(model_state_dict, local_model_path, checkpoint_architecture(model_state_dict))
+    else:
+        torch.save(model_state_dict, local_model_path)
+    print(f"✅ Model saved locally to '{local_model_path}'")
+
+    if bucket_name:
+        gcs_model_path = f'gs://{bucket_name}/models/{local_model_path.name}'
+        print(f"🔄 Uploading model to GCS: {gcs_model_path}")
+        subprocess.run(['gcloud', 'storage', 'cp', str(local_model_path), gcs_model_path], check=True)
+        print("✅ Upload complete.")
+
+    return local_model_path
+
+
+def numa_node_cpus():
+    """CPU ids of each NUMA node, or [] when the topology is not available."""
+    nodes = []
+    for node_dir in sorted(Path('/sys/devices/system/node').glob('node[0-9]*')):
+        cpus = set()
+        for part in (node_dir / 'cpulist').read_text().strip().split(','):
+            if part:
+                first, _, last = part.partition('-')
+                cpus.update(range(int(first), int(last or first) + 1))
+        if cpus:
+            nodes.append(cpus)
+    return nodes
+
+
+def numa_worker_init(worker_id: int):
+    """Pin DataLoader worker i to NUMA node i mod num_nodes and keep it single-threaded."""
+    torch.set_num_threads(1)
+    nodes = numa_node_cpus()
+    if len(nodes) > 1:
+        os.sched_setaffinity(0, nodes[worker_id % len(nodes)])
+
+
+def load_vocab_sizes(data_dir: str) -> dict:
+    """Category/merchant vocab sizes of a dataset, read from the vocab.json written next to it."""
+    with open(Path(data_dir) / 'vocab.json') as f:
+        vocab_mappings = json.load(f)
+    return {'categories': len(vocab_mappings['categories']), 'merchants': len(vocab_mappings['merchants'])}
+
+
+def load_datasets(data_dir: str, validation_split: float = 0.2):
+    """Train/validation batched datasets split like the notebook (train_test_split, seed 42)."""
+    data_dir = Path(data_dir)
+    vocab_sizes = load_vocab_sizes(data_dir)
+
+    if (data_dir / 'meta.json').exists():
+        def make_dataset(indices, check_vocab):
+            return BatchedWindowDataset(data_dir, vocab_sizes if check_vocab else None, indices)
+        with open(data_dir / 'meta.json') as f:
+            num_samples = json.load(f)['num_windows']
+    else:
+        x_path, y_path = data_dir / 'sequences_X.npy', data_dir / 'sequences_y.npy'
+
+        def make_dataset(indices, check_vocab):
+            return BatchedSequenceDataset(x_path, y_path, vocab_sizes if check_vocab else None, indices)
+        num_samples = np.load(x_path, mmap_mode='r').shape[0]
+
+    train_indices, val_indices = train_test_split(
+        np.arange(num_samples),
+        test_size=validation_split,
+        random_state=42,
+        shuffle=True
+    )
+    # Both splits share one feature matrix, so the vocab only needs to be checked once
+    return make_dataset(train_indices, True), make_dataset(val_indices, False)
+
+
+def add_training_arguments(parser: argparse.ArgumentParser):
+    """Data, checkpoint, optimization and performance-mode flags shared by the training entry points."""
+    parser.add_argument('--data-dir', type=str, default='processed_data',
+                       help='Window-index dataset directory, or a directory with sequences_X.npy / sequences_y.npy; '
+                            'either needs the vocab.json written by preprocessing')
+    parser.add_argument('--output-dir', type=str, default='model',
+                       help='Directory for per-epoch checkpoints')
+    parser.add_argument('--gcs-bucket', type=str, default=None,
+                       help='Also upload every checkpoint to gs://<bucket>/models/')
+    parser.add_argument('--resume', type=str, default=None,
+                       help='Checkpoint to continue training from')
+    parser.add_argument('--checkpoint-format', choices=['torch', 'safetensors'], default='torch',
+                       help='torch.save pickles, or memory-mapped files with the architecture in the header')
+    parser.add_argument('--epochs', type=int, default=NUM_EPOCHS,
+                       help='Number of epochs')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                       help='Effective batch size per optimizer step')
+    parser.add_argument('--learning-rate', type=float, default=LEARNING_RATE,
+                       help='Adam learning rate')
+    parser.add_argument('--num-workers', type=int, default=4,
+                       help='DataLoader worker processes')
+    parser.add_argument('--limit-batches', type=int, default=None,
+                       help='Only run this many batches per epoch (for quick throughput measurements)')
+
+    perf = parser.add_argument_group('performance mode')
+    perf.add_argument('--perf', action='store_true',
+                      help='Shorthand for --compile --bf16 --numa-workers')
+    perf.add_argument('--compile', action='store_true',
+                      help='torch.compile the encoder and decoder')
+    perf.add_argument('--bf16', action='store_true',
+                      help='bf16 autocast for forward passes and losses')
+    perf.add_argument('--threads', type=int, default=None,
+                      help='torch intra-op threads (default: torch default)')
+    perf.add_argument('--numa-workers', action='store_true',
+                      help='Pin DataLoader workers round-robin to NUMA nodes')
+    perf.add_argument('--accumulation-steps', type=int, default=1,
+                      help='Split each batch into this many micro-batches with gradient accumulation')
+    perf.add_argument('--fused-decoder', action='store_true',
+                      help='Train with Seq2Seq.forward_fused and parallel scheduled sampling')
+
+
+def apply_performance_shorthands(args):
+    if args.perf:
+        args.compile = args.bf16 = args.numa_workers = True
+    return args
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the Fin-O Seq2Seq model')
+    add_training_arguments(parser)
+
+    args = apply_performance_shorthands(parser.parse_args())
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    options = TrainingOptions(args.bf16, args.accumulation_steps, args.limit_batches)
+
+    print(f"🚀 Training Fin-O on {device} ({torch.get_num_threads()} threads, batch {args.batch_size}, "
+          f"{args.accumulation_steps} accumulation step(s), compile={args.compile}, bf16={args.bf16})")
+
+    train_dataset, val_dataset = load_datasets(args.data_dir)
+    worker_init_fn = numa_worker_init if args.numa_workers else None
+    train_dataloader = batched_dataloader(train_dataset, args.batch_size, shuffle=True,
+                                          num_workers=args.num_workers, worker_init_fn=worker_init_fn)
+    val_dataloader = batched_dataloader(val_dataset, args.batch_size, shuffle=False,
+                                        num_workers=args.num_workers, worker_init_fn=worker_init_fn)
+
+    print(f"📊 Training samples: {len(train_dataset):,}, validation samples: {len(val_dataset):,}")
+
+    vocab_sizes = load_vocab_sizes(args.data_dir)
+    model = build_model(device, vocab_size_cat=vocab_sizes['categories'], vocab_size_merch=vocab_sizes['merchants'])
+    if args.resume:
+        model.load_state_dict(load_checkpoint(args.resume, device)[0])
+        print(f"✅ Resumed from {args.resume}")
+    if args.compile:
+        # Module.compile keeps the state_dict keys unchanged, so checkpoints stay loadable
+        model.encoder.compile()
+        model.decoder.compile()
+
+    training_model = TrainingModel(model, args.fused_decoder)
+
+    optimizer = torch.optim.Adam(model.parameters(), lr=args.learning_rate)
+    scheduler = ReduceLROnPlateau(optimizer, mode='min', factor=0.1, patience=2, threshold=0.01)
+    criterion_h = nn.HuberLoss()
+    criterion_ce = nn.CrossEntropyLoss()
+
+    best_val_loss = float('inf')
+    epochs_no_improve = 0
+
+    for epoch in range(args.epochs):
+        start = time.perf_counter()
+        avg_loss, samples = train_model(training_model, train_dataloader, optimizer, criterion_h, criterion_ce,
+                                        device, epoch, args.epochs, options)
+        train_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        avg_val_loss = validate_model(training_model, val_dataloader, criterion_h, criterion_ce, device, options)
+        val_time = time.perf_counter() - start
+
+        scheduler.step(avg_val_loss)
+
+        if avg_val_loss < best_val_loss:
+            best_val_loss = avg_val_loss
+            epochs_no_improve = 0
+        else:
+            epochs_no_improve += 1
+
+        print(f"📊 Epoch {epoch+1}/{args.epochs} -> loss {avg_loss:.4f}, validation loss {avg_val_loss:.4f} | "
+              f"train {train_time:.1f}s ({samples / train_time:,.0f} samples/s), validation {val_time:.1f}s")
+        save_model(model.state_dict(), epoch, args.output_dir, args.gcs_bucket, args.checkpoint_format)
+
+        if epochs_no_improve >= EARLY_STOPPING_PATIENCE:
+            print(f"⚠️  Early stopping triggered after {epoch+1} epochs.")
+            break
+
+    print(f"✅ Training complete, best validation loss: {best_val_loss:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Compact window-index dataset format for Fin-O training.
+Instead of materializing every overlapping (50 x 14) window like create_sequences in
+model/model.ipynb, stores each transaction once:
+
+    features.npy       (num_rows, 14) float32, rows sorted by user and step
+    user_offsets.npy   (num_users + 1,) int64, rows of user u are offsets[u]:offsets[u+1]
+    user_ids.npy       (num_users,) nameOrig of user u
+    window_starts.npy  (num_windows,) int64, first feature row of each window
+    meta.json          sequence length, forecast horizon and feature layout
+
+Windows are rebuilt on the fly as strided views of the memory-mapped feature matrix.
+"""
+
+import argparse
+import json
+import pickle
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import torch
+from torch.utils.data import BatchSampler, DataLoader, Dataset, RandomSampler, SequentialSampler
+
+from preprocess_transactions import group_starts, process_raw_data, synthetic_transactions
+
+FORMAT_VERSION = 1
+
+INPUT_FEATURES = [
+    'amount', 'balance_before', 'category_id', 'merchant_id', 'time_delta',
+    'time_delta_category', 'time_delta_merchant', 'avg_amount_merchant',
+    'day_of_week_sin', 'day_of_week_cos',
+    'day_of_month_sin', 'day_of_month_cos',
+    'month_of_year_sin', 'month_of_year_cos'
+]
+
+TARGET_FEATURES = ['amount', 'category_id', 'merchant_id', 'time_delta']
+TARGET_COLUMNS = [INPUT_FEATURES.index(name) for name in TARGET_FEATURES]
+
+
+def create_sequences_reference(df: pd.DataFrame, sequence_length: int, forecast_horizon: int):
+    """create_sequences as implemented in model/model.ipynb, kept for parity checks."""
+    all_sequences_X = []
+    all_sequences_y = []
+
+    for user_id in df['user_id'].unique():
+        user_df = df[df['user_id'] == user_id]
+
+        if len(user_df) < sequence_length + forecast_horizon:
+            continue
+
+        user_X_data = user_df[INPUT_FEATURES].values
+        user_y_data = user_df[TARGET_FEATURES].values
+
+        for j in range(len(user_df) - sequence_length - forecast_horizon + 1):
+            start_idx = j
+            mid_idx = j + sequence_length
+            end_idx = mid_idx + forecast_horizon
+
+            all_sequences_X.append(user_X_data[start_idx:mid_idx])
+            all_sequences_y.append(user_y_data[mid_idx:end_idx])
+
+    return all_sequences_X, all_sequences_y
+
+
+def compute_window_starts(user_offsets: np.ndarray, sequence_length: int, forecast_horizon: int) -> np.ndarray:
+    """First row of every (sequence_length + forecast_horizon) window that fits inside one user."""
+    counts = np.diff(user_offsets)
+    windows_per_user = np.maximum(counts - sequence_length - forecast_horizon + 1, 0)
+    total = int(windows_per_user.sum())
+
+    first_window = np.cumsum(windows_per_user) - windows_per_user
+    within_user = np.arange(total, dtype=np.int64) - np.repeat(first_window, windows_per_user)
+    return np.repeat(user_offsets[:-1], windows_per_user) + within_user
+
+
+def write_window_index(processed_df: pd.DataFrame, output_dir: str, sequence_length: int,
+                       forecast_horizon: int, user_names):
+    """Write processed_df (as returned by process_raw_data) in the window-index format.
+
+    A single linear pass over rows sorted by user; users are stored in the order of their
+    first row, so windows come out in the same order as create_sequences produces them.
+    user_names[i] is the nameOrig of user_id i (the uniques of pd.factorize on the raw nameOrig column).
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    user_ids = processed_df['user_id'].to_numpy()
+    starts = group_starts(user_ids)
+    if len(np.unique(user_ids[starts])) != int(starts.sum()):
+        raise ValueError("Rows must be grouped by user_id (as returned by process_raw_data)")
+
+    features = np.lib.format.open_memmap(
+        output_dir / 'features.npy', mode='w+', dtype=np.float32, shape=(len(processed_df), len(INPUT_FEATURES))
+    )
+    for i, column in enumerate(INPUT_FEATURES):
+        features[:, i] = processed_df[column].to_numpy()
+    features.flush()
+
+    user_offsets = np.append(np.flatnonzero(starts), len(user_ids)).astype(np.int64)
+    window_starts = compute_window_starts(user_offsets, sequence_length, forecast_horizon)
+
+    np.save(output_dir / 'user_offsets.npy', user_offsets)
+    np.save(output_dir / 'user_ids.npy', np.asarray(user_names, dtype=str)[user_ids[starts]])
+    np.save(output_dir / 'window_starts.npy', window_starts)
+
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'sequence_length': sequence_length,
+        'forecast_horizon': forecast_horizon,
+        'num_rows': len(processed_df),
+        'num_users': len(user_offsets) - 1,
+        'num_windows': len(window_starts),
+        'input_features': INPUT_FEATURES,
+        'target_features': TARGET_FEATURES,
+    }
+    with open(output_dir / 'meta.json', 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    return meta
+
+
+class WindowIndex:
+    """Memory-mapped window-index dataset; windows are strided views, not copies."""
+
+    def __init__(self, data_dir: str, mmap_mode: str = 'r'):
+        data_dir = Path(data_dir)
+        with open(data_dir / 'meta.json') as f:
+            self.meta = json.load(f)
+
+        self.sequence_length = self.meta['sequence_length']
+        self.forecast_horizon = self.meta['forecast_horizon']
+
+        self.features = np.load(data_dir / 'features.npy', mmap_mode=mmap_mode)
+        self.user_offsets = np.load(data_dir / 'user_offsets.npy')
+        # Datasets written before user ids were stored only have user positions
+        user_ids_path = data_dir / 'user_ids.npy'
+        self.user_ids = np.load(user_ids_path) if user_ids_path.exists() else None
+        self.window_starts = np.load(data_dir / 'window_starts.npy')
+
+        # inputs[i] is the (sequence_length, 14) window starting at row i, without copying
+        self.inputs = np.lib.stride_tricks.sliding_window_view(
+            self.features, self.sequence_length, axis=0
+        ).transpose(0, 2, 1)
+        self.targets = np.lib.stride_tricks.sliding_window_view(
+            self.features, self.forecast_horizon, axis=0
+        ).transpose(0, 2, 1)
+
+    def __len__(self):
+        return len(self.window_starts)
+
+    def window(self, index: int):
+        """(sequence_length, 14) input view and (forecast_horizon, 4) target for window `index`."""
+        start = self.window_starts[index]
+        x = self.inputs[start]
+        y = self.targets[start + self.sequence_length][:, TARGET_COLUMNS]
+        return x, y
+
+
+class WindowDataset(Dataset):
+    """Drop-in replacement for the notebook's Dataset, reading from the window-index format."""
+
+    def __init__(self, data_dir: str, indices=None):
+        self.index = WindowIndex(data_dir)
+        self.indices = np.arange(len(self.index)) if indices is None else np.asarray(indices)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, idx):
+        x_item, y_item = self.index.window(self.indices[idx])
+        return torch.tensor(x_item, dtype=torch.float32), torch.tensor(y_item, dtype=torch.float32)
+
+
+def validate_vocab_bounds(category_ids, merchant_ids, vocab_sizes: dict, chunk_size: int = 1 << 22):
+    """Check once, in chunks, that all category/merchant IDs fit the vocab.
+
+    Replaces the per-item np.any(... >= vocab_size) check of the notebook's Dataset.
+    """
+    for start in range(0, len(category_ids), chunk_size):
+        category_chunk = np.asarray(category_ids[start:start + chunk_size])
+        merchant_chunk = np.asarray(merchant_ids[start:start + chunk_size])
+        if (category_chunk >= vocab_sizes['categories']).any() or (merchant_chunk >= vocab_sizes['merchants']).any():
+            bad = np.flatnonzero((category_chunk >= vocab_sizes['categories']) |
+                                 (merchant_chunk >= vocab_sizes['merchants']))[0] + start
+            raise IndexError(f"Data at index {bad} contains an out-of-bounds category or merchant ID.")
+
+
+class BatchedWindowDataset(Dataset):
+    """Window-index dataset that serves whole batches.
+
+    __getitem__ takes an array of window indices (as yielded by a BatchSampler), sorts them
+    for locality and gathers all inputs and targets with one fancy-indexed read each,
+    returning (B, sequence_length, 14) and (B, forecast_horizon, 4) float32 tensors.
+    Vocab bounds are validated once over the feature matrix when the dataset is built.
+    """
+
+    def __init__(self, data_dir: str, vocab_sizes: dict = None, indices=None):
+        self.index = WindowIndex(data_dir)
+        self.indices = np.arange(len(self.index)) if indices is None else np.asarray(indices)
+
+        self.input_offsets = np.arange(self.index.sequence_length)
+        self.target_offsets = np.arange(self.index.forecast_horizon) + self.index.sequence_length
+
+        if vocab_sizes is not None:
+            features = self.index.features
+            validate_vocab_bounds(features[:, 2], features[:, 3], vocab_sizes)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, batch_indices):
+        starts = np.sort(self.index.window_starts[self.indices[batch_indices]])
+
+        x_batch = self.index.features[starts[:, None] + self.input_offsets]
+        y_batch = self.index.features[starts[:, None] + self.target_offsets][:, :, TARGET_COLUMNS]
+
+        return torch.from_numpy(x_batch), torch.from_numpy(y_batch)
+
+
+class BatchedSequenceDataset(Dataset):
+    """Batched access to the materialized sequences_X.npy / sequences_y.npy files of the notebook."""
+
+    def __init__(self, x_path, y_path, vocab_sizes: dict = None, indices=None):
+        self.sequences_X = np.load(x_path, mmap_mode='r')
+        self.sequences_y = np.load(y_path, mmap_mode='r')
+        assert len(self.sequences_X) == len(self.sequences_y), "X and y sequences must have the same length."
+
+        self.indices = np.arange(len(self.sequences_X)) if indices is None else np.asarray(indices)
+
+        if vocab_sizes is not None:
+            flat_X = self.sequences_X.reshape(-1, self.sequences_X.shape[-1])
+            validate_vocab_bounds(flat_X[:, 2], flat_X[:, 3], vocab_sizes)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, batch_indices):
+        rows = np.sort(self.indices[batch_indices])
+        x_batch = np.asarray(self.sequences_X[rows], dtype=np.float32)
+        y_batch = np.asarray(self.sequences_y[rows], dtype=np.float32)
+        return torch.from_numpy(x_batch), torch.from_numpy(y_batch)
+
+
+def batched_dataloader(dataset: Dataset, batch_size: int, shuffle: bool, num_workers: int = 4,
+                       drop_last: bool = False, sampler=None, **kwargs) -> DataLoader:
+    """DataLoader that hands whole index batches to a batched dataset instead of collating items.
+
+    sampler, e.g. a DistributedSampler, replaces the default random or sequential order.
+    Batches are pinned by the DataLoader when CUDA is available.
+    """
+    if sampler is not None:
+        base_sampler = sampler
+    else:
+        base_sampler = RandomSampler(dataset) if shuffle else SequentialSampler(dataset)
+    return DataLoader(
+        dataset,
+        sampler=BatchSampler(base_sampler, batch_size=batch_size, drop_last=drop_last),
+        batch_size=None,
+        num_workers=num_workers,
+        pin_memory=torch.cuda.is_available(),
+        persistent_workers=num_workers > 0,
+        **kwargs,
+    )
+
+
+def benchmark_loading(data_dir: str, batch_size: int, num_batches: int, num_workers: int):
+    """Samples/second of per-item WindowDataset loading vs. BatchedWindowDataset."""
+    per_item_loader = DataLoader(WindowDataset(data_dir), batch_size=batch_size, shuffle=True,
+                                 num_workers=num_workers)
+    batched_loader = batched_dataloader(BatchedWindowDataset(data_dir), batch_size, shuffle=True,
+                                        num_workers=num_workers)
+
+    results = {}
+    for name, loader in [('per-item', per_item_loader), ('batched', batched_loader)]:
+        start = time.perf_counter()
+        samples = 0
+        for i, (x_batch, _) in enumerate(loader):
+            samples += len(x_batch)
+            if i + 1 >= num_batches:
+                break
+        results[name] = samples / (time.perf_counter() - start)
+        print(f"📊 {name:<9} {results[name]:12,.0f} samples/s")
+    return results
+
+
+def check_parity(processed_df: pd.DataFrame, data_dir: str) -> bool:
+    """Compare every window against create_sequences from the notebook."""
+    index = WindowIndex(data_dir)
+    sequences_X, sequences_y = create_sequences_reference(
+        processed_df, index.sequence_length, index.forecast_horizon
+    )
+
+    if len(sequences_X) != len(index):
+        print(f"❌ window count: {len(index)} vs {len(sequences_X)} from create_sequences")
+        return False
+
+    for i in range(len(index)):
+        x, y = index.window(i)
+        if not (np.array_equal(x, np.asarray(sequences_X[i], dtype=np.float32)) and
+                np.array_equal(y, np.asarray(sequences_y[i], dtype=np.float32))):
+            print(f"❌ window {i} differs from create_sequences")
+            return False
+
+    print(f"✅ All {len(index):,} windows match create_sequences")
+    return True
+
+
+def directory_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in Path(path).iterdir() if f.is_file())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the window-index dataset from raw transactions')
+    parser.add_argument('--csv', type=str, default=None,
+                       help='Raw transactions CSV (t2.csv format); synthetic data is used if omitted')
+    parser.add_argument('--synthetic-rows', type=int, default=200_000,
+                       help='Number of synthetic transactions when no CSV is given')
+    parser.add_argument('--synthetic-users', type=int, default=1000,
+                       help='Number of synthetic users when no CSV is given')
+    parser.add_argument('--output-dir', type=str, default='processed_data',
+                       help='Output directory for the dataset, vocab.json and scaler.pkl')
+    parser.add_argument('--sequence-length', type=int, default=50,
+                       help='Number of transactions in each input window')
+    parser.add_argument('--forecast-horizon', type=int, default=10,
+                       help='Number of transactions to forecast after each window')
+    parser.add_argument('--check-parity', action='store_true',
+                       help='Compare every window against the notebook create_sequences')
+    parser.add_argument('--benchmark-loading', action='store_true',
+                       help='Compare per-item and batched loading throughput on the written dataset')
+    parser.add_argument('--batch-size', type=int, default=2048,
+                       help='Batch size for --benchmark-loading')
+    parser.add_argument('--num-workers', type=int, default=0,
+                       help='DataLoader workers for --benchmark-loading')
+
+    args = parser.parse_args()
+
+    if args.csv:
+        raw_df = pd.read_csv(args.csv)
+    else:
+        raw_df = synthetic_transactions(args.synthetic_rows, args.synthetic_users)
+
+    print(f"🚀 Processing {len(raw_df):,} transactions...")
+    processed_df, vocab_mappings, scaler = process_raw_data(raw_df)
+    _, user_names = pd.factorize(raw_df['nameOrig'])
+    del raw_df
+
+    output_dir = Path(args.output_dir)
+    meta = write_window_index(processed_df, output_dir, args.sequence_length, args.forecast_horizon, user_names)
+
+    with open(output_dir / 'vocab.json', 'w') as f:
+        json.dump(vocab_mappings, f, indent=4)
+    with open(output_dir / 'scaler.pkl', 'wb') as f:
+        pickle.dump(scaler, f)
+
+    materialized_bytes = meta['num_windows'] * 4 * (
+        args.sequence_length * len(INPUT_FEATURES) + args.forecast_horizon * len(TARGET_FEATURES)
+    )
+    compact_bytes = directory_size(output_dir)
+
+    print(f"✅ {meta['num_windows']:,} windows over {meta['num_rows']:,} rows written to {output_dir}")
+    print(f"   Window-index format: {compact_bytes / 1e6:.1f} MB "
+          f"(materialized sequences_X/y.npy: {materialized_bytes / 1e6:.1f} MB, "
+          f"{materialized_bytes / max(compact_bytes, 1):.0f}x larger)")
+
+    if args.check_parity and not check_parity(processed_df, output_dir):
+        raise SystemExit(1)
+
+    if args.benchmark_loading:
+        benchmark_loading(output_dir, args.batch_size, num_batches=10, num_workers=args.num_workers)
+
+
+if __name__ == "__main__":
+    main()